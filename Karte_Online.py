@@ -1,569 +1,262 @@
 import streamlit as st
-import folium
-import geopandas as gpd
-from streamlit_folium import folium_static
+import io
 import os
-import numpy as np
-import mapclassify
-import branca.colormap as cm
-from shapely.geometry import LineString
-from folium.features import DivIcon
-from PIL import Image
-import math
-from shapely.geometry import LineString, MultiLineString
-
-
-
-#Focussing on Passenger Needs
-st.title("Focusing on Passenger Needs ")
-st.subheader("How Can On-Demand Ridepooling Data Make Transport Planning More User-Centered?")
-st.markdown(
-    '<span style="color:gray">Peter Bruder (FH Münster), Robin Kersten (FH Münster), Jeanette Klemmer (FH Münster), Dennis Schöne (RVM GmbH)</span>',
-    unsafe_allow_html=True
-)
-
-
-with st.expander(label="Overview of G-Mobil"):
-    # Function to load shapefiles from a directory
-    def load_shapefile(file_path):
-        if os.path.exists(file_path):
-            return gpd.read_file(file_path)
-        else:
-            st.error(f"File not found: {file_path}")
-            return None
-
-    # Define file paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    betriebsgebiet_path = os.path.join(base_dir, "Betriebsgebiet.shp")
-    gronau_bhf_path = os.path.join(base_dir, "GronauBhf.shp")
-    haltestellen_path = os.path.join(base_dir, "Haltestellen.shp")
-    Buslinien_path = os.path.join(base_dir, "FrühereBuslinie.shp")
-    taxibuslinien_path = os.path.join(base_dir, "FrühereTaxibuslinie.shp")
-
-    # Streamlit App
-    st.header("Overview of Mein G-Mobil")
-
-    # Load Haltestellen to determine map center
-    haltestellen = load_shapefile(haltestellen_path)
-    if haltestellen is not None and not haltestellen.empty:
-        centroid = [haltestellen.geometry.y.mean(), haltestellen.geometry.x.mean()]
-        zoom_start = 12.3
-    else:
-        centroid = [51.933, 7.628]
-        zoom_start = 12.3
-
-    # Initialize Second Map
-    m = folium.Map(
-        location=centroid, 
-        zoom_start=zoom_start, 
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png", 
-        attr="© CartoDB",
-        name="CartoDB Positron"
-    )
-
-
-    # Load and plot Betriebsgebiet (Polygon)
-    betriebsgebiet = load_shapefile(betriebsgebiet_path)
-    if betriebsgebiet is not None:
-        folium.GeoJson(betriebsgebiet, name="Operting area", style_function=lambda x: {'fillColor': 'green', 'color': 'blue', 'weight': 1, 'fillOpacity': 0.05 }).add_to(m)
-
-
-    # Feature Group for Haltestellen
-    haltestellen_group = folium.FeatureGroup(name="G-Mobil stops")
-    if haltestellen is not None:
-        for idx, row in haltestellen.iterrows():
-            color = "green" if row.get("Typ") == "physisch" else "blue"
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=1,
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=1.0,
-                popup=row.get("Haltestell", "Haltestelle")
-            ).add_to(haltestellen_group)
-        haltestellen_group.add_to(m)
-    
-    # Load and group Buslinien (Lines)
-    buslinien_group = folium.FeatureGroup(name="Scheduled bus lines (2021)")
-    buslinien = load_shapefile(Buslinien_path)
-    
-    if buslinien is not None:
-        colors =  ["purple"]  # Example colors
-    
-        # Stelle sicher, dass die Geometrie gültig ist und transformiere ins richtige Koordinatensystem
-        buslinien = buslinien.to_crs(epsg=4326)
-        buslinien = buslinien[buslinien.geometry.notnull() & ~buslinien.geometry.is_empty]
-    
-        for idx, row in buslinien.iterrows():
-            geom = row.geometry
-            color = colors[idx % len(colors)]
-    
-            # MultiLineString auf einzelne Linien zerlegen
-            if isinstance(geom, MultiLineString):
-                lines = geom.geoms
-            elif isinstance(geom, LineString):
-                lines = [geom]
-            else:
-                continue  # Unsupported geometry type
-    
-            for line in lines:
-                coords = [(lat, lon) for lon, lat in line.coords]  # folium erwartet (lat, lon)
-                folium.PolyLine(
-                    coords,
-                    color=color,
-                    weight=2,
-                    opacity=0.8
-                ).add_to(buslinien_group)
-    
-        buslinien_group.add_to(m)
-
-    # Load and group Taxibuslinien (Lines)
-    taxibuslinien_group = folium.FeatureGroup(name="Taxi-buslines (2021)")
-    taxibuslinien = load_shapefile(taxibuslinien_path)
-    if taxibuslinien is not None:
-        colors = ["brown", "cyan", "magenta", "yellow", "pink"]  # Example colors for Taxibuslinien
-        for idx, row in taxibuslinien.iterrows():
-            color = colors[idx % len(colors)]  # Assign colors based on index
-            folium.GeoJson(
-                row.geometry,
-                style_function=lambda x, color=color: {'color': color, 'weight': 2, 'dashArray': '5, 5'}
-            ).add_to(taxibuslinien_group)
-        taxibuslinien_group.add_to(m)
-
-
-    # Add Layer Control
-    folium.LayerControl().add_to(m)
-
-    # Display Map
-    folium_static(m)
-
-
-######################
-# Tagesganglinien
-
-
-with st.expander(label="Applications of Ridepooling Data"):
-
-    st.header("Temporal Distribution of Requests and Bookings")
-    # Bildpfad
-    image_path = r"heatmap_diagrams_ppt.png"
-
-    # Bild laden und anzeigen
-    if os.path.exists(image_path):
-        image = Image.open(image_path)
-        st.image(image,  use_container_width=True)
-    else:
-        st.error(f"Bild nicht gefunden: {image_path}")
-
-
-    #Karte Ein&Ausstiege
-    ######################################################################################
-
-
-
-    # Function to load shapefiles from a directory
-    def load_shapefile(file_path):
-        if os.path.exists(file_path):
-            return gpd.read_file(file_path)
-        else:
-            st.error(f"File not found: {file_path}")
-            return None
-
-    # Define file paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    betriebsgebiet_path = os.path.join(base_dir, "Betriebsgebiet.shp")
-    haltestellen_path = os.path.join(base_dir, "Haltestellen.shp")
-    g_mobil_ein_aus_path = os.path.join(base_dir, "G-Mobil_Ein-undAusstiege.shp")
-
-    # Load Haltestellen to determine map center
-    haltestellen = load_shapefile(haltestellen_path)
-    if haltestellen is not None and not haltestellen.empty:
-        centroid = [haltestellen.geometry.y.mean(), haltestellen.geometry.x.mean()]
-        zoom_start = 12.3
-    else:
-        centroid = [51.933, 7.628]
-        zoom_start = 12.3
-
-    #######################################################################################################################################
-    # Second Map - Ein- und Ausstiegen
-
-    st.header("Spatial distribution of Pickups")
-    # Initialize Second Map
-    m2 = folium.Map(
-        location=centroid, 
-        zoom_start=zoom_start, 
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png", 
-        attr="© CartoDB",
-        name="CartoDB Positron"
-    )
-
-    # Load and plot Betriebsgebiet (Polygon) again for second map
-    if betriebsgebiet is not None:
-        folium.GeoJson(betriebsgebiet, name="Betriebsgebiet", style_function=lambda x: {'fillColor': 'green', 'color': 'blue', 'weight': 1, 'fillOpacity': 0.05 }).add_to(m2)
-
-
-    # Load and plot G-Mobil Ein- und Ausstiege (Points) using Jenks Natural Breaks
-    g_mobil_ein_aus = load_shapefile(g_mobil_ein_aus_path)
-    if g_mobil_ein_aus is not None:
-        values = g_mobil_ein_aus["Ein+Aussti"].values
-        if len(values) > 5:
-            classifier = mapclassify.JenksCaspall(values, k=5)
-            bins = classifier.bins
-        else:
-            bins = np.linspace(min(values), max(values), 6)
-        
-        def get_radius(value):
-            for i, bin_edge in enumerate(bins):
-                if value <= bin_edge:
-                    return (i + 1) * 1  # Increasing radius for visibility
-            return 40
-        
-        for idx, row in g_mobil_ein_aus.iterrows():
-            count = row.get("Ein+Aussti", 1)
-            radius = get_radius(count)
-            
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=radius,
-                color='black',
-                weight=0.5,  # Reduce border thickness
-                fill=True,
-                fill_color='red',
-                fill_opacity=0.2,  # Adjust transparency
-                popup=folium.Popup(f"Einstiege: {count}", parse_html=True),
-                tooltip=f"Einstiege: {count}"
-            ).add_to(m2)
-
-    # Display Second Map
-    folium_static(m2)
-
-
-    #####################################################################################################
-    # Third Map - Ausstiege    
-    st.header("Spatial distribution of Dropoffs")
-
-    # Initialize Third Map
-    m3 = folium.Map(
-        location=centroid, 
-        zoom_start=zoom_start, 
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png", 
-        attr="© CartoDB",
-        name="CartoDB Positron"
-    )
-
-    # Load and plot Betriebsgebiet (Polygon) again for third map
-    if betriebsgebiet is not None:
-        folium.GeoJson(betriebsgebiet, name="Betriebsgebiet", style_function=lambda x: {'fillColor': 'green', 'color': 'blue', 'weight': 1, 'fillOpacity': 0.05 }).add_to(m3)
-
-    # Load and plot G-Mobil Ausstiege (Points) using Jenks Natural Breaks
-    if g_mobil_ein_aus is not None:
-        values = g_mobil_ein_aus["Ein+Auss_1"].values
-        if len(values) > 5:
-            classifier = mapclassify.JenksCaspall(values, k=5)
-            bins = classifier.bins
-        else:
-            bins = np.linspace(min(values), max(values), 6)
-        
-        for idx, row in g_mobil_ein_aus.iterrows():
-            count = row.get("Ein+Auss_1", 1)
-            radius = get_radius(count)
-            
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=radius,
-                color='black',
-                weight=0.5,  # Reduce border thickness
-                fill=True,
-                fill_color='blue',
-                fill_opacity=0.2,  # Adjust transparency
-                popup=folium.Popup(f"Ausstiege: {count}", parse_html=True),
-                tooltip=f"Ausstiege: {count}"
-            ).add_to(m3)
-
-    # Display Third Map
-    folium_static(m3)
-
-
-    ############################################################################
-    # Hochfrequentierte Wegerelationen
-
-    st.header("High Demand Route Relations")
-    # Shapefile laden
-    Wegerelationen_path = os.path.join(base_dir, "Wegerelationen.shp")
-    Wegerelationen_gdf = load_shapefile(Wegerelationen_path)
-
-    # In WGS 84 transformieren (für Folium notwendig)
-    Wegerelationen_gdf = Wegerelationen_gdf.to_crs(epsg=4326)
-
-    # Optional: Betriebsgebiet ebenfalls transformieren
-    if betriebsgebiet is not None:
-        betriebsgebiet = betriebsgebiet.to_crs(epsg=4326)
-
-    # Sicherstellen, dass die Geometrie gültig ist
-    Wegerelationen_gdf = Wegerelationen_gdf[Wegerelationen_gdf.geometry.notnull()]
-
-    # Filter auf Fahrtenl_2 > 100
-    Wegerelationen_gdf = Wegerelationen_gdf[Wegerelationen_gdf['Fahrtenl_2'] > 100]
-
-    # Farbskala definieren (je höher der Wert, desto blauer)
-    colormap = cm.linear.Reds_09.scale(
-        Wegerelationen_gdf['Fahrtenl_2'].min(),
-        Wegerelationen_gdf['Fahrtenl_2'].max()
-    )
+import uuid
 
-    # Kartenzentrum berechnen
-    centroid_geom = Wegerelationen_gdf.unary_union.centroid
-    centroid = (centroid_geom.y, centroid_geom.x)  # lat, lon
-
-    # Karte initialisieren
-    m5 = folium.Map(
-        location=centroid,
-        zoom_start=zoom_start,
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png",
-        attr="© CartoDB",
-        name="CartoDB Positron"
-    )
+from PIL import Image
 
-    # Betriebsgebiet (falls vorhanden) zur Karte hinzufügen
-    if betriebsgebiet is not None:
-        folium.GeoJson(
-            betriebsgebiet,
-            name="Betriebsgebiet",
-            style_function=lambda x: {
-                'fillColor': 'green',
-                'color': 'blue',
-                'weight': 1,
-                'fillOpacity': 0.05
-            }
-        ).add_to(m5)
-
-    # Linien und ggf. Pfeile zeichnen
-    for _, row in Wegerelationen_gdf.iterrows():
-        geom = row.geometry
-        color = colormap(row['Fahrtenl_2'])
-
-        # MultiLineString auf einzelne Linien zerlegen
-        if isinstance(geom, MultiLineString):
-            lines = geom.geoms
-        elif isinstance(geom, LineString):
-            lines = [geom]
-        else:
-            lines = []
-
-        for line in lines:
-            coords = list(line.coords)
-            if len(coords) >= 2:
-                # Koordinaten in (lat, lon) umwandeln
-                latlon_coords = [(lat, lon) for lon, lat in coords]
-
-                # Linie zeichnen
-                folium.PolyLine(
-                    latlon_coords,
-                    color=color,
-                    weight=4,
-                    popup=f"Amount of Passengers per Relation: {row['Fahrtenl_2']}",
-                    opacity=0.7
-                ).add_to(m5)
-
-
-
-    # Legende zur Karte hinzufügen
-    colormap.caption = "Fahrten pro Relation"
-    m5.add_child(colormap)
-
-    # Karte in Streamlit anzeigen
-    folium_static(m5)
-
-
-    ##########################################################
-    #Route Rerouting
-
-    st.header("Route Rerouting – CW 43")
-
-    # Shapefile laden
-    routenumlegung_path = os.path.join(base_dir, "Routenumlegung_KW43_2.shp")
-    routenumlegung_gdf = load_shapefile(routenumlegung_path)
-
-    # In WGS 84 transformieren (für Folium notwendig)
-    routenumlegung_gdf = routenumlegung_gdf.to_crs(epsg=4326)
-
-    # Optional: Betriebsgebiet ebenfalls transformieren
-    if betriebsgebiet is not None:
-        betriebsgebiet = betriebsgebiet.to_crs(epsg=4326)
-
-    # Sicherstellen, dass die Geometrie gültig ist
-    routenumlegung_gdf = routenumlegung_gdf[routenumlegung_gdf.geometry.notnull()]
-
-    # Filter auf Anzahl_Üb > 0
-    routenumlegung_gdf = routenumlegung_gdf[routenumlegung_gdf['Anzahl_Üb'] > 0]
-
-    # Farbskala definieren (z. B. Orange-Rot)
-    colormap = cm.linear.OrRd_09.scale(
-        routenumlegung_gdf['Anzahl_Üb'].min(),
-        routenumlegung_gdf['Anzahl_Üb'].max()
+import instrumentation
+from bookings import BOOKINGS_PATH
+from catchment import DEFAULT_RADIUS, MAX_RADIUS, MIN_RADIUS, catchment_index
+from layer_store import file_version, load_layer, layer_path
+from maps import MAP_LAYERS, MAP_SETTINGS, PARTITION_SOURCES, map_html
+from partitions import DATASETS, period_totals, period_weeks, previous_year, weeks
+from temporal import CHART_IMAGES, chart
+
+
+# Sections of the page: (expander label, [(header, kind, target), ...])
+# kind "map": target is a key of maps.MAPS, kind "chart": a key of temporal.CHARTS,
+# kind "image": target is an image path.
+# A section is only built while its expander is open.
+SECTIONS = [
+    ("Overview of G-Mobil", [
+        ("Overview of Mein G-Mobil", "map", "overview"),
+    ]),
+    ("Applications of Ridepooling Data", [
+        ("Temporal Distribution of Requests and Bookings", "chart", "temporal"),
+        ("Spatial distribution of Pickups", "map", "pickups"),
+        ("Spatial distribution of Dropoffs", "map", "dropoffs"),
+        ("High Demand Route Relations", "map", "relations"),
+        ("Route Rerouting", "map", "rerouting"),
+    ]),
+    ("Possible Data Biases", [
+        ("Age Disparities:\nRidepooling Users vs. Inhabitants", "image", "Age_and_Gender.png"),
+        ("Usage Disparities:\nHeavy Users vs Irregular Users", "chart", "usage"),
+        ("Spatial Availability:\nEfficiency vs. Basic Public Mobility", "map", "availability"),
+        ("Stop Catchment and Coverage", "map", "coverage"),
+    ]),
+]
+
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Maps whose header names the weeks shown -> week of the static layer used without partitions
+HEADER_WEEKS = {"rerouting": "CW 43"}
+
+# Widest image Streamlit shows; larger images are decoded and scaled down on every st.image call
+IMAGE_WIDTH = 1460
+
+
+def relations_from_bookings(period):
+    # Relationen aus der OD-Matrix (Wochen-Partitionen oder Buchungslog) statt aus dem statischen Layer
+    return period_weeks("bookings", period) is not None or file_version(BOOKINGS_PATH) is not None
+
+
+def relations_controls(period):
+    # Schwellenwert statt fest verdrahtetem "> 100"
+    settings = {
+        "min_trips": st.slider(
+            "Minimum trips per relation", 0, 1000, MAP_SETTINGS["relations"]["min_trips"], step=10,
+            help=f"At most the {MAP_SETTINGS['relations']['max_relations']:,} strongest relations are drawn.",
+            key="relations_min_trips"
+        )
+    }
+    # Zeitfilter nur mit Buchungsdaten (OD-Matrix)
+    if relations_from_bookings(period):
+        weekdays = st.multiselect(
+            "Weekdays", list(range(7)), default=list(range(7)), format_func=WEEKDAYS.__getitem__,
+            key="relations_weekdays"
+        )
+        settings["weekdays"] = sorted(weekdays) if len(weekdays) < 7 else None
+        settings["merge_directions"] = st.checkbox("Merge both directions", key="relations_merge")
+    return settings
+
+
+def rerouting_controls(period):
+    # Überlagerungen je Straßenabschnitt statt des vorberechneten Werts je Route
+    return {"segments": st.checkbox("Count overlaps per road segment", key="rerouting_segments")}
+
+
+def coverage_controls(period):
+    # Einzugsradius um die Haltestellen, Kennzahlen aus dem gemeinsamen Index (je Radius zwischengespeichert)
+    index = catchment_index()
+    if index is None:
+        return {}
+    radius = st.slider("Catchment radius (m)", MIN_RADIUS, MAX_RADIUS, DEFAULT_RADIUS, step=50, key="coverage_radius")
+    stop_type = st.selectbox(
+        "Stops", [None, *index.stop_types()], format_func=lambda kind: "all" if kind is None else kind,
+        key="coverage_stop_type"
     )
-
-    # Kartenzentrum berechnen
-    centroid_geom = routenumlegung_gdf.unary_union.centroid
-    centroid = (centroid_geom.y, centroid_geom.x)  # lat, lon
-
-    # Karte initialisieren
-    m6 = folium.Map(
-        location=centroid,
-        zoom_start=zoom_start,
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png",
-        attr="© CartoDB",
-        name="CartoDB Positron"
+    stats = index.stats(radius, stop_type)
+    columns = st.columns(4)
+    columns[0].metric(
+        "Operating area covered", f"{stats.area_share:.1%}", f"{stats.area_share - stats.area_share_2021:+.1%} vs. 2021"
     )
-
-    # Betriebsgebiet (falls vorhanden) zur Karte hinzufügen
-    if betriebsgebiet is not None:
-        folium.GeoJson(
-            betriebsgebiet,
-            name="Betriebsgebiet",
-            style_function=lambda x: {
-                'fillColor': 'green',
-                'color': 'blue',
-                'weight': 1,
-                'fillOpacity': 0.05
-            }
-        ).add_to(m6)
-
-    # Linien zeichnen
-    for _, row in routenumlegung_gdf.iterrows():
-        geom = row.geometry
-        color = colormap(row['Anzahl_Üb'])
-
-        # MultiLineString auf einzelne Linien zerlegen
-        if isinstance(geom, MultiLineString):
-            lines = geom.geoms
-        elif isinstance(geom, LineString):
-            lines = [geom]
-        else:
-            lines = []
-
-        for line in lines:
-            coords = list(line.coords)
-            if len(coords) >= 2:
-                latlon_coords = [(lat, lon) for lon, lat in coords]
-
-                folium.PolyLine(
-                    latlon_coords,
-                    color=color,
-                    weight=4,
-                    opacity=0.7,
-                    popup=f"Amount of overlapping Routes: {row['Anzahl_Üb']}"
-                ).add_to(m6)
-
-    # Legende zur Karte hinzufügen
-    colormap.caption = "Amount of overlapping Routes (CW 43, 2023)"
-    m6.add_child(colormap)
-
-    # Karte in Streamlit anzeigen
-    folium_static(m6)
-
-
-
-
-
-
-
-
-
-###########################################################
-#Biases
-
-with st.expander(label="Possible Data Biases"):
-
-
-    #Age and Gender
-    st.header("Age Disparities:\nRidepooling Users vs. Inhabitants")
-
-    # Bildpfad
-    image_path = r"Age_and_Gender.png"
-
-    # Bild laden und anzeigen
-    if os.path.exists(image_path):
-        image = Image.open(image_path)
-        st.image(image, use_container_width=True)
+    columns[1].metric("Grid cells covered", f"{stats.cells_covered} / {stats.cells}")
+    columns[2].metric("Trips and rejections covered", f"{stats.demand_share:.1%}")
+    columns[3].metric("Cells gained / lost vs. 2021", f"{stats.gained} / {stats.lost}")
+    return {"radius": radius, "stop_type": stop_type}
+
+
+# Map key -> function showing widgets for the selected period and returning settings overrides
+MAP_CONTROLS = {
+    "relations": relations_controls,
+    "rerouting": rerouting_controls,
+    "coverage": coverage_controls,
+}
+
+
+def period_controls():
+    # Zeitraum über die gespeicherten Wochen-Partitionen, mit Vergleich zum Vorjahr
+    labels = sorted({label for dataset in DATASETS for label in weeks(dataset)})
+    if not labels:
+        return None
+    st.sidebar.header("Period")
+    if len(labels) > 1:
+        period = st.sidebar.select_slider("Calendar weeks", labels, value=(labels[0], labels[-1]), key="period")
     else:
-        st.error(f"Bild nicht gefunden: {image_path}")
-
-    #Heavy Users
-    st.header("Usage Disparities:\nHeavy Users vs Irregular Users")
-
-    # Bildpfad
-    image_path = r"Nutzungsverteilung_Poster.png"
-
+        period = (labels[0], labels[0])
+        st.sidebar.caption(f"Calendar week {labels[0]}")
+
+    for dataset, title in [("bookings", "Bookings"), ("requests", "Requests")]:
+        selected = period_weeks(dataset, period)
+        if not selected:
+            continue
+        current = period_totals(dataset, selected).get("rows", 0)
+        # Vorjahresvergleich nur, wenn alle Vorjahreswochen vorliegen
+        stored = set(weeks(dataset))
+        before_weeks = [label for label in previous_year(selected) if label in stored]
+        before = period_totals(dataset, before_weeks).get("rows", 0)
+        delta = None
+        if len(before_weeks) == len(selected) and before:
+            delta = f"{(current - before) / before:+.1%} vs. previous year"
+        st.sidebar.metric(title, f"{current:,}", delta)
+    return period
+
+
+def week_text(label):
+    year, week = label.split("-W")
+    return f"CW {int(week)}, {year}"
+
+
+def unit_header(header, target, period):
+    # Überschrift mit den gezeigten Wochen statt einer fest eingetragenen Kalenderwoche
+    if target not in HEADER_WEEKS:
+        return header
+    selected = period_weeks(PARTITION_SOURCES[target], period)
+    if selected is None:
+        return f"{header} – {HEADER_WEEKS[target]}"
+    if not selected:
+        return f"{header} – no data in the selected weeks"
+    if len(selected) == 1:
+        return f"{header} – {week_text(selected[0])}"
+    return f"{header} – {week_text(selected[0])} to {week_text(selected[-1])}"
+
+
+# Bilder einmal pro Datei-Version lesen, verkleinern und zwischen allen Sessions teilen
+@st.cache_resource(show_spinner=False)
+def load_image(image_path, mtime):
+    with open(image_path, "rb") as f:
+        data = f.read()
+    image = Image.open(io.BytesIO(data))
+    if image.width <= IMAGE_WIDTH:
+        return data
+    image_format = image.format
+    image = image.resize((IMAGE_WIDTH, round(image.height * IMAGE_WIDTH / image.width)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def show_image(image_path):
     # Bild laden und anzeigen
     if os.path.exists(image_path):
-        image = Image.open(image_path)
-        st.image(image,  use_container_width=True)
+        st.image(load_image(image_path, os.path.getmtime(image_path)), use_container_width=True)
     else:
         st.error(f"Bild nicht gefunden: {image_path}")
 
 
-    ###################
-    # Verfügbarkeitsanalyse
-
-    st.header("Spatial Availability:\nEfficiency vs. Basic Public Mobility")
-    Verfügbarkeiten_path = os.path.join(base_dir, "Verfügbarkeitsanalyse.shp")
-
-    verfuegbarkeiten_gdf = gpd.read_file(Verfügbarkeiten_path)
-
-    # Werte von Dezimalform in Prozent umwandeln
-    verfuegbarkeiten_gdf["Verfügbar"] = verfuegbarkeiten_gdf["Verfügbar"] * 100
-
-    # Klassen für Verfügbarkeit definieren (10 Klassen: 0-10%, 10-20%, ..., 90-100%)
-    bins = np.linspace(0, 100, 11)  # Erstellt die Intervalle 0-10, 10-20, ..., 90-100
-    labels = np.arange(1, 11)  # Klassen von 1 bis 10
-    verfuegbarkeiten_gdf["Verfügbarkeitsklasse"] = np.digitize(verfuegbarkeiten_gdf["Verfügbar"], bins, right=True)
+def show_chart(key):
+    # Diagramm aus den Anfragedaten, sonst das exportierte Bild
+    figure = chart(key)
+    if figure is not None:
+        st.altair_chart(figure, width="stretch")
+    else:
+        show_image(CHART_IMAGES[key])
+
+
+def show_map(key, period=None):
+    # Layers come from the shared layer store (read once per process, already in EPSG:4326)
+    for name in MAP_LAYERS[key]:
+        if load_layer(name) is None:
+            st.error(f"File not found: {layer_path(name)}")
+
+    controls = MAP_CONTROLS.get(key)
+    settings = controls(period) if controls is not None else {}
+    if period is not None and key in PARTITION_SOURCES:
+        settings["period"] = period
+
+    # Fertiges HTML aus dem Karten-Cache
+    html = map_html(key, settings)
+    if html is not None:
+        # Karte in Streamlit anzeigen
+        st.iframe(html, height=510, width=700)
+    elif key == "relations" and (relations_from_bookings(period) or load_layer("wegerelationen") is not None):
+        st.info(f"No relation has more than {settings['min_trips']:,} trips. Lower the minimum to show relations.")
+
+
+def show_diagnostics(recorder):
+    # Messwerte dieses Reruns und der Session (nur mit GMOBIL_PROFILE)
+    history = st.session_state.setdefault("diagnostics_history", [])
+    history.append(recorder.seconds)
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        st.metric("This rerun", f"{history[-1]:.2f} s")
+        st.caption(
+            f"Session {recorder.session}: {len(history)} reruns, "
+            f"mean {sum(history) / len(history):.2f} s, max {max(history):.2f} s"
+        )
+        rows = recorder.rows()
+        if rows:
+            st.dataframe(
+                rows,
+                column_order=["kind", "name", "seconds", "peak_bytes", "html_bytes", "geojson_bytes", "features"],
+                hide_index=True,
+            )
+        st.code(instrumentation.prometheus_text(), language="text")
+
+
+recorder = instrumentation.start_run(st.session_state.setdefault("session_id", uuid.uuid4().hex[:8]))
+
+period = period_controls()
 
-    # Begrenzen der Klassenzuordnung auf Werte zwischen 1 und 10, um KeyError zu vermeiden
-    verfuegbarkeiten_gdf["Verfügbarkeitsklasse"] = verfuegbarkeiten_gdf["Verfügbarkeitsklasse"].clip(1, 10)
 
-    # Mittelpunkt für die Karte setzen (z. B. Mittelpunkt der Geometrien)
-    centroid = [verfuegbarkeiten_gdf.geometry.centroid.y.mean(), verfuegbarkeiten_gdf.geometry.centroid.x.mean()]
-    zoom_start = 12  # Passe den Zoomfaktor an
+#Focussing on Passenger Needs
+st.title("Focusing on Passenger Needs ")
+st.subheader("How Can On-Demand Ridepooling Data Make Transport Planning More User-Centered?")
+st.markdown(
+    '<span style="color:gray">Peter Bruder (FH Münster), Robin Kersten (FH Münster), Jeanette Klemmer (FH Münster), Dennis Schöne (RVM GmbH)</span>',
+    unsafe_allow_html=True
+)
 
-    # Map erstellen
-    m4 = folium.Map(
-        location=centroid,
-        zoom_start=zoom_start,
-        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png",
-        attr="© CartoDB",
-        name="CartoDB Positron"
-    )
 
-    # Umgekehrte Transparenzwerte (geringe Verfügbarkeit = hohe Transparenz)
-    opacity_values = {
-        1: 0.1, 2: 0.2, 3: 0.3, 4: 0.4, 5: 0.5,
-        6: 0.6, 7: 0.7, 8: 0.8, 9: 0.9, 10: 1.0
-    }
+for index, (label, units) in enumerate(SECTIONS):
+    expander = st.expander(label=label, key=f"section_{index}", on_change="rerun")
+    if not expander.open:
+        continue
 
-    # Polygone mit abgestufter Transparenz und Hover-Beschriftung hinzufügen
-    for _, row in verfuegbarkeiten_gdf.iterrows():
-        if np.isnan(row["Verfügbar"]):  # Falls Wert NaN ist
-            fill_opacity = 0.0  # Komplett durchsichtig
-            tooltip_text = "no inquiries"
-        else:
-            fill_opacity = opacity_values[row["Verfügbarkeitsklasse"]]
-            tooltip_text = f"Verfügbarkeit: {row['Verfügbar']:.1f}%"
-
-        folium.GeoJson(
-            row.geometry,
-            name=f"Verfügbarkeit {row['Verfügbarkeitsklasse']*10-10} - {row['Verfügbarkeitsklasse']*10} %",
-            style_function=lambda x, opacity=fill_opacity: {
-                'fillColor': 'green',  # Grün als Hauptfarbe
-                'color': 'black',  # Randfarbe der Polygone
-                'weight': 0.2,
-                'fillOpacity': opacity  # Transparenz basierend auf Verfügbarkeitsklasse oder NaN (0.0)
-            },
-            tooltip=tooltip_text  # Hover-Beschriftung
-        ).add_to(m4)
-
-    # Map in Streamlit anzeigen
-    folium_static(m4)
+    with expander:
+        for header, kind, target in units:
+            header = unit_header(header, target, period)
+            st.header(header)
+            with instrumentation.span("section", " ".join(header.split())):
+                if kind == "map":
+                    show_map(target, period)
+                elif kind == "chart":
+                    show_chart(target)
+                else:
+                    show_image(target)
 
 
+if recorder is not None:
+    show_diagnostics(recorder)
+    instrumentation.finish_run(recorder)
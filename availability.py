@@ -0,0 +1,248 @@
+"""Availability grid from raw ride requests.
+
+Every request record has a pickup position and a status. Requests are binned
+into a hexagonal (or square) grid over the Betriebsgebiet: the cell of a point
+is computed arithmetically from its metric coordinates, so no point-in-polygon
+test is needed. Per cell the grid keeps the number of served (``Fahrten_Fa``)
+and rejected (``Abgelehnt_``) requests; ``Verfügbar`` is the share of served
+requests, NaN for cells without requests.
+
+Counts are updated incrementally: appending to a log and calling ``update``
+again only reads the new records and recomputes the cells they fall into.
+
+The result has the columns of Verfügbarkeitsanalyse.shp and can replace it::
+
+    python availability.py requests.csv -o Verfügbarkeitsanalyse.shp
+"""
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from bookings import CHUNK_SIZE, iter_appended_chunks, log_rewritten
+from layer_store import METRIC_CRS, SharedCache, file_version, layer_version, load_layer
+
+
+# Column names in the request log
+REQUEST_COLUMNS = {
+    "lon": "pickup_lon",
+    "lat": "pickup_lat",
+    "status": "status",
+}
+
+# Status values counted as served and as rejected; other requests are ignored
+SERVED_STATUS = "booked"
+REJECTED_STATUS = "rejected"
+
+# Request log used by the availability map instead of the static grid, if set
+REQUESTS_PATH = os.environ.get("GMOBIL_REQUESTS")
+
+# Distance between neighbouring cell rows in metres
+CELL_SIZE = 250.0
+
+# Centre of cell (row 0, col 0) of Verfügbarkeitsanalyse.shp in EPSG:25832
+GRID_ORIGIN = (360490.99, 5791170.39)
+
+_to_metric = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+
+_cache = SharedCache()
+
+
+class HexGrid:
+    """Flat-topped hexagons, rows counting southwards, odd columns shifted down by half a row."""
+
+    def __init__(self, size=CELL_SIZE, origin=GRID_ORIGIN):
+        self.size = size
+        self.origin = origin
+        self.radius = size / np.sqrt(3)
+
+    def cells(self, x, y):
+        """Row and column index of the cell containing each point."""
+        dx = (np.asarray(x) - self.origin[0]) / self.radius
+        dy = (self.origin[1] - np.asarray(y)) / self.radius
+
+        # Axiale Koordinaten, dann auf das nächste Sechseck runden (Würfelkoordinaten)
+        q = 2 / 3 * dx
+        r = -1 / 3 * dx + np.sqrt(3) / 3 * dy
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+
+        cols = rq.astype(np.int64)
+        rows = rr.astype(np.int64) + (cols - (cols & 1)) // 2
+        return rows, cols
+
+    def polygons(self, rows, cols):
+        cx = self.origin[0] + cols * 1.5 * self.radius
+        cy = self.origin[1] - self.size * (rows + 0.5 * (cols & 1))
+        angles = np.radians(np.arange(0, 420, 60))
+        x = cx[:, None] + self.radius * np.cos(angles)
+        y = cy[:, None] + self.radius * np.sin(angles)
+        return shapely.polygons(np.stack([x, y], axis=-1))
+
+
+class SquareGrid:
+    """Square cells, rows counting southwards."""
+
+    def __init__(self, size=CELL_SIZE, origin=GRID_ORIGIN):
+        self.size = size
+        self.origin = origin
+
+    def cells(self, x, y):
+        cols = np.floor((np.asarray(x) - self.origin[0]) / self.size + 0.5).astype(np.int64)
+        rows = np.floor((self.origin[1] - np.asarray(y)) / self.size + 0.5).astype(np.int64)
+        return rows, cols
+
+    def polygons(self, rows, cols):
+        left = self.origin[0] + (cols - 0.5) * self.size
+        top = self.origin[1] - (rows - 0.5) * self.size
+        return shapely.box(left, top - self.size, left + self.size, top)
+
+
+GRIDS = {"hex": HexGrid, "square": SquareGrid}
+
+
+class AvailabilityGrid:
+    """Served and rejected requests per grid cell inside ``area``."""
+
+    def __init__(self, area, grid):
+        self.grid = grid
+        minx, miny, maxx, maxy = area.to_crs(METRIC_CRS).total_bounds
+
+        # Alle Zellen über der Bounding Box, eine Zelle Rand
+        corner_rows, corner_cols = grid.cells([minx, maxx, minx, maxx], [maxy, maxy, miny, miny])
+        rows, cols = np.meshgrid(
+            np.arange(corner_rows.min() - 1, corner_rows.max() + 2),
+            np.arange(corner_cols.min() - 1, corner_cols.max() + 2),
+            indexing="ij",
+        )
+        rows, cols = rows.ravel(), cols.ravel()
+
+        # Zellen auf das Betriebsgebiet zuschneiden, leere Zellen verwerfen
+        shape = shapely.union_all(area.to_crs(METRIC_CRS).geometry.values)
+        clipped = shapely.intersection(grid.polygons(rows, cols), shape)
+        keep = ~shapely.is_empty(clipped) & (shapely.area(clipped) > 0)
+        self.rows, self.cols = rows[keep], cols[keep]
+        self.geometry = gpd.GeoSeries(clipped[keep], crs=METRIC_CRS).to_crs(epsg=4326).values
+
+        # Dichte Nachschlagetabelle (row, col) -> Zellnummer, -1 außerhalb
+        self.row0, self.col0 = self.rows.min(), self.cols.min()
+        self.lookup = np.full((self.rows.max() - self.row0 + 1, self.cols.max() - self.col0 + 1), -1, dtype=np.int64)
+        self.lookup[self.rows - self.row0, self.cols - self.col0] = np.arange(len(self.rows))
+
+        self.served = np.zeros(len(self.rows), dtype=np.int64)
+        self.rejected = np.zeros(len(self.rows), dtype=np.int64)
+        self.availability = np.full(len(self.rows), np.nan)
+        # Log path -> (read position, file size), see iter_appended_chunks
+        self.sources = {}
+
+    def cell_index(self, lon, lat):
+        """Cell number per coordinate, -1 outside the grid."""
+        x, y = _to_metric.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        valid = np.isfinite(x) & np.isfinite(y)
+        rows, cols = self.grid.cells(np.where(valid, x, 0), np.where(valid, y, 0))
+        rows -= self.row0
+        cols -= self.col0
+        inside = valid & (rows >= 0) & (rows < self.lookup.shape[0]) & (cols >= 0) & (cols < self.lookup.shape[1])
+        index = np.full(len(rows), -1, dtype=np.int64)
+        index[inside] = self.lookup[rows[inside], cols[inside]]
+        return index
+
+    def add(self, lon, lat, status):
+        """Count requests and recompute the cells they fall into; returns those cells."""
+        index = self.cell_index(lon, lat)
+        status = np.asarray(status)
+        served = np.bincount(index[(index >= 0) & (status == SERVED_STATUS)], minlength=len(self.rows))
+        rejected = np.bincount(index[(index >= 0) & (status == REJECTED_STATUS)], minlength=len(self.rows))
+        self.served += served
+        self.rejected += rejected
+        return self._recompute(served + rejected)
+
+    def add_cells(self, rows, cols, served, rejected):
+        """Add request counts per (row, col) cell, e.g. from a stored partition; returns the touched cells."""
+        rows = np.asarray(rows) - self.row0
+        cols = np.asarray(cols) - self.col0
+        inside = (rows >= 0) & (rows < self.lookup.shape[0]) & (cols >= 0) & (cols < self.lookup.shape[1])
+        index = np.full(len(rows), -1, dtype=np.int64)
+        index[inside] = self.lookup[rows[inside], cols[inside]]
+        keep = index >= 0
+        served = np.bincount(index[keep], np.asarray(served)[keep], len(self.rows)).astype(np.int64)
+        rejected = np.bincount(index[keep], np.asarray(rejected)[keep], len(self.rows)).astype(np.int64)
+        self.served += served
+        self.rejected += rejected
+        return self._recompute(served + rejected)
+
+    def _recompute(self, added):
+        touched = np.flatnonzero(added)
+        total = self.served[touched] + self.rejected[touched]
+        self.availability[touched] = self.served[touched] / total
+        return touched
+
+    def update(self, path, columns=None, chunksize=CHUNK_SIZE):
+        """Count the records of ``path`` not read before; returns the touched cells.
+
+        Logs are expected to be append-only; use a new grid if one was rewritten.
+        """
+        columns = {**REQUEST_COLUMNS, **(columns or {})}
+        touched = []
+        for chunk in iter_appended_chunks(self.sources, path, columns.values(), chunksize):
+            touched.append(self.add(chunk[columns["lon"]], chunk[columns["lat"]], chunk[columns["status"]]))
+        return np.unique(np.concatenate(touched)) if touched else np.zeros(0, dtype=np.int64)
+
+    def frame(self):
+        """The grid with the columns of Verfügbarkeitsanalyse.shp (EPSG:4326)."""
+        return gpd.GeoDataFrame(
+            {
+                "row_index": self.rows,
+                "col_index": self.cols,
+                "Verfügbar": self.availability,
+                "Abgelehnt_": self.rejected,
+                "Fahrten_Fa": self.served,
+            },
+            geometry=self.geometry,
+            crs="EPSG:4326",
+        )
+
+
+def request_grid(path, shape="hex", size=CELL_SIZE):
+    """AvailabilityGrid for the request log ``path``, shared per process.
+
+    When the log grows, only the appended records are read.
+    """
+    version = (file_version(path), layer_version("betriebsgebiet"), shape, size)
+
+    def build(previous):
+        grid = previous[1] if previous is not None and previous[0][1:] == version[1:] else None
+        # Neu aufbauen, wenn die Datei nicht nur angehängt wurde
+        if grid is None or log_rewritten(grid.sources, path):
+            grid = AvailabilityGrid(load_layer("betriebsgebiet"), GRIDS[shape](size))
+        grid.update(path)
+        return grid
+    return _cache.get(path, version, build)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the availability grid from a ride request log.")
+    parser.add_argument("requests", nargs="+", help="CSV or Parquet request logs")
+    parser.add_argument("-o", "--output", required=True, help="output file, e.g. Verfügbarkeitsanalyse.shp")
+    parser.add_argument("--shape", choices=sorted(GRIDS), default="hex")
+    parser.add_argument("--cell-size", type=float, default=CELL_SIZE, help="row spacing in metres")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    grid = AvailabilityGrid(load_layer("betriebsgebiet"), GRIDS[args.shape](args.cell_size))
+    for path in args.requests:
+        grid.update(path, chunksize=args.chunksize)
+    result = grid.frame()
+    result.to_file(args.output, encoding="utf-8")
+    print(
+        f"{len(result)} cells, {grid.served.sum()} served and {grid.rejected.sum()} rejected requests "
+        f"in {np.count_nonzero(grid.served + grid.rejected)} cells"
+    )
@@ -0,0 +1,261 @@
+"""Scaling benchmark for the map sections of Karte_Online.py.
+
+Generates synthetic data sets at multiples of the current layer sizes (192
+stops, 31 route relations, 172 rerouted trips, 156 bus-line segments, 545
+grid cells) and times every stage of every map: reading, reprojection,
+classification, map construction and HTML serialisation. For each stage the
+output size, the number of features and the peak Python memory (tracemalloc)
+are recorded. Each scale runs in its own process with ``GMOBIL_DATA_DIR``
+pointing at the synthetic layers, so caches and memory do not carry over::
+
+    python benchmark.py run --scales 10 100 1000 -o bench_results/current.json
+    python benchmark.py compare bench_results/baseline.json bench_results/current.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from layer_store import BASE_DIR, LAYER_FILES, METRIC_CRS
+
+
+SCALES = (10, 100, 1000)
+
+BENCH_DATA_DIR = os.path.join(BASE_DIR, "bench_data")
+
+# Stages in the order they run per map
+STAGES = ("read", "reproject", "classify", "build", "render")
+
+_SEED = 0
+
+
+def _jitter(geoms, rng, metres):
+    """Shift each geometry by a random offset of up to ``metres``."""
+    offsets = rng.uniform(-metres, metres, size=(len(geoms), 2))
+    counts = shapely.get_num_coordinates(geoms)
+    coords = shapely.get_coordinates(geoms) + np.repeat(offsets, counts, axis=0)
+    return shapely.set_coordinates(geoms.copy(), coords)
+
+
+def _resample(gdf, n, rng, metres):
+    """``n`` rows drawn from ``gdf`` (metric CRS), geometries jittered."""
+    rows = gdf.iloc[rng.integers(0, len(gdf), n)].reset_index(drop=True)
+    rows = rows.to_crs(METRIC_CRS)
+    rows.geometry = _jitter(np.asarray(rows.geometry.values), rng, metres)
+    return rows
+
+
+def generate(scale, data_dir):
+    """Write all layers at ``scale`` times their current size into ``data_dir``."""
+    from availability import CELL_SIZE, AvailabilityGrid, HexGrid
+
+    rng = np.random.default_rng(_SEED)
+    os.makedirs(data_dir, exist_ok=True)
+
+    def read(name):
+        return gpd.read_file(os.path.join(BASE_DIR, LAYER_FILES[name]))
+
+    def write(name, gdf):
+        gdf.to_file(os.path.join(data_dir, LAYER_FILES[name]), encoding="utf-8")
+
+    # Unverändert übernehmen
+    write("betriebsgebiet", read("betriebsgebiet"))
+    write("gronau_bhf", read("gronau_bhf"))
+
+    stops = _resample(read("haltestellen"), len(read("haltestellen")) * scale, rng, 2000)
+    write("haltestellen", stops)
+    ein_aus = _resample(read("ein_aus"), len(stops), rng, 2000)
+    write("ein_aus", ein_aus)
+
+    write("buslinien", _resample(read("buslinien"), len(read("buslinien")) * scale, rng, 1000))
+    write("taxibuslinien", _resample(read("taxibuslinien"), len(read("taxibuslinien")) * scale, rng, 1000))
+
+    relations = read("wegerelationen")
+    n = len(relations) * scale
+    origin, destination = rng.integers(0, len(stops), (2, n))
+    xy = shapely.get_coordinates(stops.geometry.values)
+    lines = shapely.linestrings(np.stack([xy[origin], xy[destination]], axis=1))
+    write("wegerelationen", gpd.GeoDataFrame({
+        "Haltestell": stops["Haltestell"].to_numpy()[origin],
+        "Halteste_1": stops["Haltestell"].to_numpy()[destination],
+        "Fahrtenl_2": rng.choice(relations["Fahrtenl_2"].to_numpy(), n),
+    }, geometry=lines, crs=stops.crs))
+
+    write("routenumlegung", _resample(read("routenumlegung"), len(read("routenumlegung")) * scale, rng, 500))
+
+    # Feineres Raster mit etwa scale-mal so vielen Zellen
+    grid = AvailabilityGrid(read("betriebsgebiet"), HexGrid(CELL_SIZE / np.sqrt(scale)))
+    grid.served[:] = rng.integers(0, 300, len(grid.rows))
+    grid.rejected[:] = rng.integers(0, 300, len(grid.rows))
+    total = grid.served + grid.rejected
+    grid.availability = np.where(total > 0, grid.served / np.maximum(total, 1), np.nan)
+    write("verfuegbarkeiten", grid.frame())
+
+
+def _classify(key, settings):
+    """The classification step of map ``key`` on its loaded layer."""
+    from classify import breaks, classify
+    from layer_store import load_layer
+    from map_layers import colormap_classes
+    import branca.colormap as cm
+
+    if key in ("pickups", "dropoffs"):
+        values = load_layer("ein_aus")[settings["column"]].to_numpy()
+        return classify(values, breaks(values, settings["scheme"], settings["k"]))
+    if key == "relations":
+        values = load_layer("wegerelationen")["Fahrtenl_2"].to_numpy()
+    elif key == "rerouting":
+        values = load_layer("routenumlegung")["Anzahl_Üb"].to_numpy()
+    elif key == "availability":
+        values = load_layer("verfuegbarkeiten")["Verfügbar"].to_numpy(dtype=float) * 100
+        return classify(values, breaks(values, "equal_interval", settings["classes"], value_range=(0, 100)))
+    elif key == "coverage":
+        # Abfrage des Haltestellenindex (Aufbau beim ersten Aufruf)
+        from catchment import catchment_index
+        return catchment_index().changes(settings["radius"], settings["stop_type"])
+    else:
+        return None
+    colormap = getattr(cm.linear, settings["colormap"]).scale(values.min(), values.max())
+    return colormap_classes(colormap, values, settings["classes"])
+
+
+def _measure(results, scale, key, stage, function, features=None):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        value = function()
+        error = None
+    except Exception as exc:
+        value, error = None, f"{exc.__class__.__name__}: {exc}"
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({
+        "scale": scale,
+        "map": key,
+        "stage": stage,
+        "seconds": round(seconds, 6),
+        "peak_bytes": peak,
+        "output_bytes": len(value.encode("utf-8")) if isinstance(value, str) else None,
+        "features": features(value) if features is not None and value is not None else None,
+        "error": error,
+    })
+    return value
+
+
+def run_scale(scale):
+    """Benchmark all maps on the data set in ``GMOBIL_DATA_DIR``; returns result rows."""
+    from layer_store import layer_path, load_layer
+    from maps import MAP_LAYERS, MAPS, map_settings, render_map
+
+    results = []
+    for key in MAPS:
+        settings = map_settings(key)
+        names = MAP_LAYERS[key]
+        raw = _measure(
+            results, scale, key, "read", lambda: [gpd.read_file(layer_path(name)) for name in names],
+            features=lambda frames: sum(len(frame) for frame in frames),
+        )
+        if raw is not None:
+            _measure(results, scale, key, "reproject", lambda: [frame.to_crs(epsg=4326) for frame in raw])
+        for name in names:
+            load_layer(name)  # Layer-Store für die folgenden Schritte füllen
+
+        _measure(results, scale, key, "classify", lambda: _classify(key, settings))
+        # Ungecachten Builder messen, nicht die gemeinsame Karte
+        m = _measure(results, scale, key, "build", lambda: MAPS[key].__wrapped__(settings))
+        if m is not None:
+            _measure(results, scale, key, "render", lambda: render_map(m))
+    return results
+
+
+def run(scales, data_dir=BENCH_DATA_DIR):
+    """Generate (if needed) and benchmark every scale in a separate process."""
+    results = []
+    for scale in scales:
+        scale_dir = os.path.join(data_dir, f"x{scale}")
+        if not os.path.exists(os.path.join(scale_dir, LAYER_FILES["verfuegbarkeiten"])):
+            print(f"generating x{scale} ...", flush=True)
+            generate(scale, scale_dir)
+        print(f"benchmarking x{scale} ...", flush=True)
+        output = subprocess.run(
+            [sys.executable, __file__, "_scale", str(scale)],
+            env={**os.environ, "GMOBIL_DATA_DIR": scale_dir},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results.extend(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def _version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """Print time and size ratios of ``current`` against ``baseline`` per scale, map and stage."""
+    def index(report):
+        return {(row["scale"], row["map"], row["stage"]): row for row in report["results"]}
+
+    old, new = index(baseline), index(current)
+    print(f"{'scale':>6} {'map':<13} {'stage':<10} {'old s':>9} {'new s':>9} {'ratio':>7} {'new MB':>8}")
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[0], k[1], STAGES.index(k[2]))):
+        a, b = old[key], new[key]
+        ratio = b["seconds"] / a["seconds"] if a["seconds"] else float("nan")
+        print(
+            f"{key[0]:>6} {key[1]:<13} {key[2]:<10} {a['seconds']:>9.3f} {b['seconds']:>9.3f} "
+            f"{ratio:>7.2f} {b['peak_bytes'] / 1e6:>8.1f}" + (f"  {b['error']}" if b["error"] else "")
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard maps on synthetic data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="generate data sets and benchmark them")
+    run_parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES))
+    run_parser.add_argument("--data-dir", default=BENCH_DATA_DIR)
+    run_parser.add_argument("-o", "--output", default=os.path.join("bench_results", "results.json"))
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    scale_parser = commands.add_parser("_scale")  # intern: eine Skala im eigenen Prozess
+    scale_parser.add_argument("scale", type=int)
+    args = parser.parse_args()
+
+    if args.command == "_scale":
+        print(json.dumps(run_scale(args.scale)))
+    elif args.command == "run":
+        report = {
+            "version": _version(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": run(args.scales, args.data_dir),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        for row in report["results"]:
+            print(
+                f"x{row['scale']:<5} {row['map']:<13} {row['stage']:<10} {row['seconds']:>9.3f} s "
+                f"{row['peak_bytes'] / 1e6:>8.1f} MB" + (f"  {row['error']}" if row["error"] else "")
+            )
+        print(f"written to {args.output}")
+    else:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        compare(baseline, current)
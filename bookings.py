@@ -0,0 +1,199 @@
+"""Ingestion of raw ridepooling booking logs.
+
+Booking records (CSV or Parquet) are streamed in chunks, their pickup and
+dropoff coordinates are snapped to the nearest G-Mobil stop with a KD-tree in
+a metric CRS and counted per stop with ``np.bincount``. Memory use depends on
+the chunk size and the number of stops only, not on the size of the log.
+
+The result has the columns of G-Mobil_Ein-undAusstiege.shp and can replace it::
+
+    python bookings.py bookings.csv -o G-Mobil_Ein-undAusstiege.shp
+"""
+import argparse
+import io
+import os
+from collections import namedtuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from layer_store import METRIC_CRS, load_layer
+
+
+# Column names in the booking log
+BOOKING_COLUMNS = {
+    "pickup_lon": "pickup_lon",
+    "pickup_lat": "pickup_lat",
+    "dropoff_lon": "dropoff_lon",
+    "dropoff_lat": "dropoff_lat",
+}
+
+# Booking log used by the dashboard instead of the static exports, if set
+BOOKINGS_PATH = os.environ.get("GMOBIL_BOOKINGS")
+
+# Timestamp column (booking or pickup time) for time filters
+TIME_COLUMN = "booked_at"
+
+CHUNK_SIZE = 500_000
+
+# Bookings further away from every stop than this (metres) are not counted
+MAX_SNAP_DISTANCE = 500
+
+StopCounts = namedtuple("StopCounts", ["stops", "bookings", "unmatched_pickups", "unmatched_dropoffs"])
+
+_to_metric = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def iter_booking_chunks(path, columns, chunksize=CHUNK_SIZE):
+    """Yield the booking log ``path`` as DataFrames of at most ``chunksize`` rows."""
+    if _is_parquet(path):
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=list(columns)):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=list(columns), chunksize=chunksize)
+
+
+class _Section(io.RawIOBase):
+    """Read-only view of an open file up to byte ``end``."""
+
+    def __init__(self, file, end):
+        self.file = file
+        self.remaining = end - file.tell()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.file.readinto(memoryview(buffer)[: max(self.remaining, 0)])
+        self.remaining -= n
+        return n
+
+
+def _last_line_end(file, start, size, block=1 << 16):
+    """Offset after the last newline in ``start`` .. ``size``, ``start`` if there is none."""
+    end = size
+    while end > start:
+        begin = max(end - block, start)
+        file.seek(begin)
+        found = file.read(end - begin).rfind(b"\n")
+        if found >= 0:
+            return begin + found + 1
+        end = begin
+    return start
+
+
+def iter_appended_chunks(sources, path, columns, chunksize=CHUNK_SIZE):
+    """Yield the records of the log ``path`` appended since the last call.
+
+    ``sources`` maps log paths to (position, file size) and is updated once
+    all chunks have been read. The position is a byte offset for CSV, so new
+    records are read from there without parsing the old ones, and the number
+    of row groups for Parquet. A trailing line without newline is left for
+    the next call, as the writer may not have finished it.
+    """
+    start = sources.get(path, (0, 0))[0]
+    size = os.path.getsize(path)
+    if _is_parquet(path):
+        parquet = pq.ParquetFile(path)
+        end = parquet.num_row_groups
+        if end > start:
+            row_groups = list(range(start, end))
+            for batch in parquet.iter_batches(batch_size=chunksize, row_groups=row_groups, columns=list(columns)):
+                yield batch.to_pandas()
+    else:
+        with open(path, "rb") as file:
+            names = pd.read_csv(io.BytesIO(file.readline()), nrows=0).columns.tolist()
+            start = max(start, file.tell())
+            end = _last_line_end(file, start, size)
+            if end > start:
+                file.seek(start)
+                section = io.BufferedReader(_Section(file, end))
+                yield from pd.read_csv(section, header=None, names=names, usecols=list(columns), chunksize=chunksize)
+    sources[path] = (end, size)
+
+
+def log_rewritten(sources, path):
+    """Whether the log ``path`` shrank since it was read, i.e. was not only appended to."""
+    return os.path.getsize(path) < sources.get(path, (0, 0))[1]
+
+
+class StopIndex:
+    """KD-tree over the stop positions in a metric CRS."""
+
+    def __init__(self, stops, max_distance=MAX_SNAP_DISTANCE):
+        x, y = _to_metric.transform(stops.geometry.x.to_numpy(), stops.geometry.y.to_numpy())
+        self.tree = cKDTree(np.column_stack([x, y]))
+        self.max_distance = max_distance
+        self.n = len(stops)
+
+    def snap(self, lon, lat):
+        """Index of the nearest stop per coordinate, -1 where no stop is within range."""
+        x, y = _to_metric.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        xy = np.column_stack([x, y])
+        valid = np.isfinite(xy).all(axis=1)
+        index = np.full(len(xy), -1, dtype=np.int64)
+        _, nearest = self.tree.query(xy[valid], distance_upper_bound=self.max_distance)
+        # cKDTree liefert n für Punkte ohne Treffer
+        index[valid] = np.where(nearest < self.n, nearest, -1)
+        return index
+
+
+def stop_counts_frame(stops, pickups, dropoffs):
+    """Pickups and dropoffs per stop with the columns of G-Mobil_Ein-undAusstiege.shp."""
+    return gpd.GeoDataFrame(
+        {
+            "Haltestell": stops["Haltestell"].to_numpy(),
+            "Typ": stops["Typ"].to_numpy(),
+            "Ein+Aussti": pickups,
+            "Ein+Auss_1": dropoffs,
+            "Ein+Auss_2": pickups + dropoffs,
+        },
+        geometry=stops.geometry.values,
+        crs=stops.crs,
+    )
+
+
+def aggregate_stop_counts(path, stops=None, columns=None, chunksize=CHUNK_SIZE, max_distance=MAX_SNAP_DISTANCE):
+    """Count pickups and dropoffs per stop over the booking log ``path``."""
+    stops = load_layer("haltestellen") if stops is None else stops
+    columns = {**BOOKING_COLUMNS, **(columns or {})}
+    index = StopIndex(stops, max_distance)
+
+    pickups = np.zeros(index.n, dtype=np.int64)
+    dropoffs = np.zeros(index.n, dtype=np.int64)
+    bookings = unmatched_pickups = unmatched_dropoffs = 0
+    for chunk in iter_booking_chunks(path, columns.values(), chunksize):
+        origin = index.snap(chunk[columns["pickup_lon"]], chunk[columns["pickup_lat"]])
+        destination = index.snap(chunk[columns["dropoff_lon"]], chunk[columns["dropoff_lat"]])
+        pickups += np.bincount(origin[origin >= 0], minlength=index.n)
+        dropoffs += np.bincount(destination[destination >= 0], minlength=index.n)
+        bookings += len(chunk)
+        unmatched_pickups += int((origin < 0).sum())
+        unmatched_dropoffs += int((destination < 0).sum())
+
+    return StopCounts(stop_counts_frame(stops, pickups, dropoffs), bookings, unmatched_pickups, unmatched_dropoffs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate pickups and dropoffs per stop from a booking log.")
+    parser.add_argument("bookings", help="CSV or Parquet booking log")
+    parser.add_argument("-o", "--output", required=True, help="output file, e.g. G-Mobil_Ein-undAusstiege.shp")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--max-distance", type=float, default=MAX_SNAP_DISTANCE, help="snap radius in metres")
+    args = parser.parse_args()
+
+    counts = aggregate_stop_counts(args.bookings, chunksize=args.chunksize, max_distance=args.max_distance)
+    counts.stops.to_file(args.output, encoding="utf-8")
+    print(
+        f"{counts.bookings} bookings, {counts.unmatched_pickups} pickups and "
+        f"{counts.unmatched_dropoffs} dropoffs without a stop within {args.max_distance:g} m"
+    )
@@ -0,0 +1,177 @@
+"""Stop catchment and coverage queries over the operating area.
+
+``CoverageIndex`` is built once per process and data version. In the metric
+CRS it holds KD-trees over the stops (all, and per ``Typ``) and an STRtree
+over the former bus and taxi-bus lines. With them it precomputes, for every
+availability grid cell centre and every point of a regular sample lattice
+over the Betriebsgebiet, the distance to the nearest stop of each type and to
+the nearest former line. A query for a catchment radius then reduces to
+comparisons against those distances, so dragging the radius slider costs
+microseconds per radius; catchment polygons and per-radius results are
+additionally cached.
+
+Coverage changes are relative to the 2021 lines: a cell is "gained" if it is
+within the radius of a stop but not of a former line, "lost" in the opposite
+case.
+"""
+from collections import namedtuple
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+from layer_store import METRIC_CRS, SharedCache, layer_version, load_layer
+
+
+# Spacing (metres) of the sample lattice used for the covered share of the area
+LATTICE_SPACING = 25.0
+
+# Catchment radii offered in the app (metres)
+MIN_RADIUS = 50
+MAX_RADIUS = 1500
+DEFAULT_RADIUS = 300
+
+# Cell categories relative to the 2021 lines
+CHANGES = ("both", "gained", "lost", "none")
+
+# Radii kept per process
+MAX_ENTRIES = 64
+
+CoverageStats = namedtuple(
+    "CoverageStats",
+    ["radius", "area_share", "cells", "cells_covered", "demand_share", "gained", "lost", "area_share_2021"],
+)
+
+_index = SharedCache()
+
+
+def _metric_xy(gdf):
+    geoms = gdf.to_crs(METRIC_CRS).geometry.values
+    return np.column_stack([shapely.get_x(geoms), shapely.get_y(geoms)])
+
+
+def _nearest_distance(tree, xy):
+    if tree is None or not len(xy):
+        return np.full(len(xy), np.inf)
+    distance, _ = tree.query(xy)
+    return distance
+
+
+class CoverageIndex:
+    """Nearest-stop and nearest-line distances for grid cells and area samples."""
+
+    def __init__(self, stops, area, grid=None, lines=(), spacing=LATTICE_SPACING):
+        self.stops = stops
+        stop_xy = _metric_xy(stops)
+        self.stop_xy = stop_xy
+        self.trees = {None: cKDTree(stop_xy)}
+        for kind in stops["Typ"].dropna().unique():
+            self.trees[str(kind)] = cKDTree(stop_xy[(stops["Typ"] == kind).to_numpy()])
+
+        line_geoms = [frame.to_crs(METRIC_CRS).geometry.values for frame in lines if frame is not None]
+        line_geoms = np.concatenate(line_geoms) if line_geoms else np.zeros(0, dtype=object)
+        self.line_tree = shapely.STRtree(line_geoms) if len(line_geoms) else None
+
+        # Regelmäßige Stichprobe über dem Betriebsgebiet
+        self.area = shapely.union_all(area.to_crs(METRIC_CRS).geometry.values)
+        minx, miny, maxx, maxy = self.area.bounds
+        x, y = np.meshgrid(np.arange(minx, maxx, spacing) + spacing / 2, np.arange(miny, maxy, spacing) + spacing / 2)
+        inside = shapely.contains_xy(self.area, x.ravel(), y.ravel())
+        self.samples = np.column_stack([x.ravel()[inside], y.ravel()[inside]])
+
+        self.grid = grid
+        if grid is not None:
+            self.cell_geometry = grid.to_crs(METRIC_CRS).geometry.values
+            centres = shapely.centroid(self.cell_geometry)
+            self.cell_xy = np.column_stack([shapely.get_x(centres), shapely.get_y(centres)])
+            demand = np.zeros(len(grid))
+            for column in ("Fahrten_Fa", "Abgelehnt_"):
+                if column in grid:
+                    demand += grid[column].fillna(0).to_numpy(dtype=float)
+            self.demand = demand
+        else:
+            self.cell_geometry = np.zeros(0, dtype=object)
+            self.cell_xy = np.zeros((0, 2))
+            self.demand = np.zeros(0)
+
+        # Abstände einmal berechnen; jede Radiusabfrage ist danach nur ein Vergleich
+        self.sample_distance = {kind: _nearest_distance(tree, self.samples) for kind, tree in self.trees.items()}
+        self.cell_distance = {kind: _nearest_distance(tree, self.cell_xy) for kind, tree in self.trees.items()}
+        self.sample_line_distance = self._line_distance(self.samples)
+        self.cell_line_distance = self._line_distance(self.cell_xy)
+
+        self._results = SharedCache(MAX_ENTRIES)
+
+    def _line_distance(self, xy):
+        if self.line_tree is None or not len(xy):
+            return np.full(len(xy), np.inf)
+        points = shapely.points(xy)
+        (index, _), distance = self.line_tree.query_nearest(points, return_distance=True, all_matches=False)
+        result = np.full(len(xy), np.inf)
+        result[index] = distance
+        return result
+
+    def stop_types(self):
+        return [kind for kind in self.trees if kind is not None]
+
+    def changes(self, radius, stop_type=None):
+        """Category per grid cell (index into ``CHANGES``) for catchment ``radius``."""
+        covered = self.cell_distance[stop_type] <= radius
+        covered_2021 = self.cell_line_distance <= radius
+        return np.select(
+            [covered & covered_2021, covered, covered_2021], [0, 1, 2], default=3
+        ).astype(np.int8)
+
+    def change_areas(self, radius, stop_type=None):
+        """Grid cells of every drawn change category (``CHANGES[:3]``) dissolved into one shape, EPSG:4326."""
+        def compute():
+            changes = self.changes(radius, stop_type)
+            shapes = []
+            for category in range(3):
+                cells = self.cell_geometry[changes == category]
+                # Die Zellen überlappen nicht, die schnelle Vereinigung für Überdeckungen genügt
+                shapes.append(shapely.coverage_union_all(cells) if len(cells) else shapely.Polygon())
+            return gpd.GeoSeries(shapes, index=CHANGES[:3], crs=METRIC_CRS).to_crs(epsg=4326)
+        return self._results.memoize(("change_areas", radius, stop_type), compute)
+
+    def stats(self, radius, stop_type=None):
+        """CoverageStats for catchment ``radius`` around the stops (of ``stop_type``)."""
+        def compute():
+            covered = self.cell_distance[stop_type] <= radius
+            changes = self.changes(radius, stop_type)
+            demand = self.demand.sum()
+            return CoverageStats(
+                radius,
+                float(np.mean(self.sample_distance[stop_type] <= radius)) if len(self.samples) else float("nan"),
+                len(covered),
+                int(covered.sum()),
+                float(self.demand[covered].sum() / demand) if demand else float("nan"),
+                int((changes == 1).sum()),
+                int((changes == 2).sum()),
+                float(np.mean(self.sample_line_distance <= radius)) if len(self.samples) else float("nan"),
+            )
+        return self._results.memoize(("stats", radius, stop_type), compute)
+
+    def catchment(self, radius, stop_type=None):
+        """Union of the stop buffers within the Betriebsgebiet as GeoSeries in EPSG:4326."""
+        def compute():
+            xy = self.stop_xy if stop_type is None else self.stop_xy[(self.stops["Typ"] == stop_type).to_numpy()]
+            buffers = shapely.buffer(shapely.points(xy), radius, quad_segs=8)
+            shape = shapely.intersection(shapely.union_all(buffers), self.area)
+            return gpd.GeoSeries([shape], crs=METRIC_CRS).to_crs(epsg=4326)
+        return self._results.memoize(("catchment", radius, stop_type), compute)
+
+
+def catchment_index():
+    """CoverageIndex over the current layers, shared per process and data version."""
+    names = ("haltestellen", "betriebsgebiet", "verfuegbarkeiten", "buslinien", "taxibuslinien")
+
+    def build(previous):
+        stops, area = load_layer("haltestellen"), load_layer("betriebsgebiet")
+        if stops is None or area is None or not len(stops):
+            return None
+        return CoverageIndex(
+            stops, area, load_layer("verfuegbarkeiten"), [load_layer("buslinien"), load_layer("taxibuslinien")]
+        )
+    return _index.get("index", tuple(layer_version(name) for name in names), build)
@@ -0,0 +1,115 @@
+"""Class breaks and class assignment for graduated symbols.
+
+``breaks`` returns the upper bound of every class for one of ``SCHEMES`` and
+memoises the result per key (e.g. column and data version), so a rerun never
+recomputes Jenks breaks for unchanged data. Breaks for large inputs are
+computed on a fixed-seed random sample, which keeps Jenks breaks on millions
+of values interactive. ``classify`` assigns classes for all values at once with
+``np.searchsorted``; styles are then taken from per-class lookup arrays.
+"""
+import mapclassify
+import numpy as np
+
+from instrumentation import span
+from layer_store import SharedCache
+
+
+# Above this many values the breaks are computed on a random sample
+SAMPLE_THRESHOLD = 10_000
+SAMPLE_SIZE = 10_000
+# Fisher-Jenks is quadratic in the number of values (pure Python without numba)
+FISHER_SAMPLE_SIZE = 500
+
+MAX_ENTRIES = 256
+
+_breaks = SharedCache(MAX_ENTRIES)
+
+
+def _sample(values, size):
+    """Fixed-seed sample of ``values``, so repeated runs give the same breaks."""
+    if len(values) <= size:
+        return values
+    return np.random.default_rng(0).choice(values, size, replace=False)
+
+
+def _sampled(bins, values):
+    # Oberste Klasse muss bis zum Maximum aller Werte reichen
+    bins = np.array(bins, dtype=float)
+    bins[-1] = values.max()
+    return bins
+
+
+def _jenks(values, k):
+    if len(values) > SAMPLE_THRESHOLD:
+        return _sampled(mapclassify.JenksCaspall(_sample(values, SAMPLE_SIZE), k=k).bins, values)
+    return mapclassify.JenksCaspall(values, k=k).bins
+
+
+def _fisher_jenks_sampled(values, k):
+    return _sampled(mapclassify.FisherJenks(_sample(values, FISHER_SAMPLE_SIZE), k=k).bins, values)
+
+
+def _quantiles(values, k):
+    return mapclassify.Quantiles(values, k=k).bins
+
+
+def _equal_interval(values, k):
+    return mapclassify.EqualInterval(values, k=k).bins
+
+
+# Scheme name -> function(values, k) returning the upper class bounds
+SCHEMES = {
+    "jenks": _jenks,
+    "quantiles": _quantiles,
+    "equal_interval": _equal_interval,
+    "fisher_jenks_sampled": _fisher_jenks_sampled,
+}
+
+
+def _compute(values, scheme, k, value_range):
+    with span("classify", scheme if value_range is None else "fixed_range"):
+        return _compute_breaks(values, scheme, k, value_range)
+
+
+def _compute_breaks(values, scheme, k, value_range):
+    if value_range is not None:
+        # Feste Klassen über einen bekannten Wertebereich, z. B. 0-100 %
+        return np.linspace(*value_range, k + 1)[1:]
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(np.unique(values)) <= k:
+        # Zu wenige Werte für das Klassifikationsverfahren: gleiche Intervalle
+        lower, upper = (values.min(), values.max()) if len(values) else (0.0, 0.0)
+        return np.linspace(lower, upper, k + 1)[1:]
+    return np.asarray(SCHEMES[scheme](values, k), dtype=float)
+
+
+def breaks(values, scheme="jenks", k=5, key=None, value_range=None):
+    """Upper bounds of the ``k`` classes of ``values``.
+
+    With a ``key`` (e.g. ``(column, data_version)``) the breaks are memoised
+    together with ``scheme`` and ``k``. ``value_range=(lo, hi)`` gives equal
+    classes over that range regardless of the values.
+    """
+    if key is None:
+        return _compute(values, scheme, k, value_range)
+    return _breaks.memoize((key, scheme, k, value_range), lambda: _compute(values, scheme, k, value_range))
+
+
+def classify(values, bins):
+    """Class index (0 .. len(bins) - 1) per value, -1 for NaN.
+
+    Values above the last bound fall into the last class.
+    """
+    values = np.asarray(values, dtype=float)
+    classes = np.minimum(np.searchsorted(bins, values, side="left"), len(bins) - 1)
+    return np.where(np.isnan(values), -1, classes)
+
+
+def lookup(classes, table, missing=None):
+    """Per-value style from a per-class ``table``; ``missing`` for class -1."""
+    table = np.asarray(table)
+    values = table[np.maximum(classes, 0)]
+    if missing is not None:
+        values = np.where(classes < 0, missing, values)
+    return values
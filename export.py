@@ -0,0 +1,193 @@
+"""Headless export of the dashboard maps to self-contained HTML (and PNG).
+
+Uses the same builders as Karte_Online.py (``maps.MAPS``) and renders every
+map, optionally per calendar week (maps with a time filter, i.e. the route
+relations from a booking log), per period of the weekly partitions (see
+partitions.py) and per service area, in a process pool::
+
+    python export.py -o export
+    python export.py -o export --weeks 2023-W01:2023-W52 --regions --workers 8
+    python export.py -o export --periods 2023-W01:2023-W13 2023-W43
+
+folium names every element with a random id; the exported HTML numbers them
+in order of appearance instead, so unchanged maps produce byte-identical
+files. ``manifest.json`` in the output directory stores the cache key
+(data version and settings) per file, and jobs whose key has not changed are
+skipped without building the map.
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from layer_store import file_version, load_layer
+from maps import LOG_SOURCES, MAP_SETTINGS, MAPS, PARTITION_SOURCES, map_cache_key, render_map
+from partitions import iso_week, period_weeks, week_range
+
+
+MANIFEST = "manifest.json"
+
+# Maps whose settings include a time window ("start"/"end")
+WEEKLY_MAPS = [key for key, settings in MAP_SETTINGS.items() if "start" in settings]
+
+ExportJob = namedtuple("ExportJob", ["key", "settings", "bounds", "filename", "cache_id"])
+
+_ELEMENT_ID = re.compile(r"_[0-9a-f]{32}(?![0-9a-f])")
+
+
+def normalize_ids(html):
+    """Replace folium's random element ids by sequential ones."""
+    ids = {}
+    return _ELEMENT_ID.sub(lambda match: ids.setdefault(match.group(0), f"_{len(ids):04d}"), html)
+
+
+def regions():
+    """Service area name -> [[south, west], [north, east]] from Betriebsgebiet."""
+    area = load_layer("betriebsgebiet")
+    if area is None:
+        return {}
+    result = {}
+    for name, geometry in zip(area["layer"], area.geometry):
+        minx, miny, maxx, maxy = geometry.bounds
+        result[str(name)] = [[miny, minx], [maxy, maxx]]
+    return result
+
+
+def _slug(text):
+    return re.sub(r"[^0-9A-Za-z]+", "_", text).strip("_")
+
+
+def period_spec(spec):
+    """(first, last) week label for ``2023-W01:2023-W13`` or a single ``2023-W43``."""
+    first, _, last = spec.partition(":")
+    return first, last or first
+
+
+def plan(keys, weeks=(), region_bounds=None, periods=()):
+    """All export jobs for ``keys``, their week, period and region variants.
+
+    ``periods`` holds (first, last) week labels; a period variant is exported
+    for every map that combines weekly partitions and has data in the period.
+    """
+    variants = [(None, "", None)]
+    for label in weeks:
+        start, end = iso_week(label)
+        variants.append(({"start": start.isoformat(), "end": end.isoformat()}, f"_{label}", "weekly"))
+    for first, last in periods:
+        suffix = f"_{first}" if first == last else f"_{first}_{last}"
+        variants.append(({"period": [first, last]}, suffix, "period"))
+
+    jobs = []
+    for key in keys:
+        for overrides, suffix, kind in variants:
+            # Wochenvarianten nur für Karten, die aus einem Log mit Zeitstempeln berechnet werden
+            if kind == "weekly" and (key not in WEEKLY_MAPS or file_version(LOG_SOURCES.get(key)) is None):
+                continue
+            # Zeiträume nur für Karten aus Wochen-Partitionen mit Daten im Zeitraum
+            if kind == "period" and (
+                key not in PARTITION_SOURCES or not period_weeks(PARTITION_SOURCES[key], overrides["period"])
+            ):
+                continue
+            for region, bounds in [(None, None), *(region_bounds or {}).items()]:
+                filename = f"{key}{suffix}{'_' + _slug(region) if region else ''}.html"
+                cache_id = map_cache_key(key, overrides) + (f":{bounds}" if bounds else "")
+                jobs.append(ExportJob(key, overrides, bounds, filename, cache_id))
+    return jobs
+
+
+def _export(job, output_dir, png):
+    """Build, render and write one map; returns (filename, status)."""
+    m = MAPS[job.key](job.settings)
+    if m is None:
+        return job.filename, "missing data"
+    html = normalize_ids(render_map(m, job.bounds))
+
+    path = os.path.join(output_dir, job.filename)
+    try:
+        with open(path, encoding="utf-8") as f:
+            unchanged = f.read() == html
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+
+    if png:
+        try:
+            # Benötigt selenium und einen headless Browser
+            data = m._to_png()
+        except Exception as error:
+            return job.filename, f"written, no PNG ({error.__class__.__name__})"
+        with open(os.path.splitext(path)[0] + ".png", "wb") as f:
+            f.write(data)
+    return job.filename, "unchanged" if unchanged else "written"
+
+
+def export(output_dir, keys=None, weeks=(), by_region=False, png=False, workers=None, force=False, periods=()):
+    """Export all maps to ``output_dir``; returns {filename: status}."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    jobs = plan(keys or list(MAPS), weeks, regions() if by_region else None, periods)
+    results = {}
+    pending = []
+    for job in jobs:
+        if not force and manifest.get(job.filename) == job.cache_id and os.path.exists(
+            os.path.join(output_dir, job.filename)
+        ):
+            results[job.filename] = "skipped"
+        else:
+            pending.append(job)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(job, pool.submit(_export, job, output_dir, png)) for job in pending]
+        for job, future in futures:
+            filename, status = future.result()
+            results[filename] = status
+            if status != "missing data":
+                manifest[filename] = job.cache_id
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the dashboard maps to static HTML.")
+    parser.add_argument("-o", "--output", default="export", help="output directory")
+    parser.add_argument("--maps", nargs="+", choices=list(MAPS), help="maps to export (default: all)")
+    parser.add_argument("--weeks", help=f"ISO weeks, e.g. 2023-W01:2023-W52 (maps: {', '.join(WEEKLY_MAPS)})")
+    parser.add_argument(
+        "--periods", nargs="+", type=period_spec, default=(),
+        help=f"periods of the weekly partitions, e.g. 2023-W01:2023-W13 (maps: {', '.join(PARTITION_SOURCES)})",
+    )
+    parser.add_argument("--regions", action="store_true", help="also export one view per service area")
+    parser.add_argument("--png", action="store_true", help="also write PNG screenshots (needs selenium)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render maps that are up to date")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = export(
+        args.output,
+        args.maps,
+        week_range(args.weeks) if args.weeks else (),
+        args.regions,
+        args.png,
+        args.workers,
+        args.force,
+        args.periods,
+    )
+    for filename, status in sorted(results.items()):
+        print(f"{filename}: {status}")
+    print(f"{len(results)} maps in {time.perf_counter() - started:.1f} s")
@@ -0,0 +1,120 @@
+"""Two-tier cache for rendered map HTML.
+
+Entries live in an in-memory LRU and in a directory on disk, both bounded by
+their total size in bytes. Keys are hex digests of everything the HTML depends
+on (see ``cache_key``), so entries never need explicit invalidation: a new data
+version or changed render settings simply produce a new key, and old entries
+age out. Disk errors (read-only directory, files evicted by another process)
+are ignored; the memory tier keeps working without the disk.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "html_cache")
+
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+MAX_DISK_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(*parts):
+    """Stable hex digest of JSON-serialisable ``parts``."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class HtmlCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.html")
+
+    def get(self, key):
+        """Return the cached HTML for ``key`` or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry[0]
+        if self.cache_dir is None:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # LRU-Reihenfolge auf der Platte
+        except OSError:
+            pass  # inzwischen verdrängt: der Inhalt ist trotzdem gültig
+        self._remember(key, html)
+        return html
+
+    def put(self, key, html):
+        self._remember(key, html)
+        if self.cache_dir is None or self.max_disk_bytes <= 0:
+            return
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+        except OSError:
+            # z. B. schreibgeschütztes Verzeichnis: nur im Speicher cachen
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _remember(self, key, html):
+        size = len(html.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous[1]
+            self._memory[key] = (html, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _evict_disk(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".html"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # von einem anderen Prozess entfernt
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
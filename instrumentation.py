@@ -0,0 +1,209 @@
+"""Opt-in timers, memory counters and payload sizes for the dashboard.
+
+Off unless ``GMOBIL_PROFILE`` is set: ``1`` records wall-clock times,
+``memory`` additionally traces Python allocations with ``tracemalloc`` (which
+slows everything down noticeably). Code marks its hot paths with
+``span(kind, name)``; sections, map builds, HTML rendering, layer reads and
+class breaks are instrumented. Inside a span, ``note`` attaches the size of
+generated HTML/GeoJSON and the number of features.
+
+Every finished span is
+
+* appended to the recorder of the current rerun (``start_run``), which the
+  app shows in a sidebar panel,
+* logged as one JSON line on the ``instrumentation`` logger,
+* added to process-wide totals, available in the Prometheus text format
+  (``prometheus_text``) and written to ``GMOBIL_METRICS_FILE`` after every
+  rerun, e.g. for the node_exporter textfile collector.
+
+Memory peaks are process-wide: with several sessions rerunning at the same
+time they include the other sessions' allocations.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE = os.environ.get("GMOBIL_PROFILE", "").lower()
+ENABLED = PROFILE not in ("", "0", "false", "no")
+TRACE_MEMORY = PROFILE == "memory"
+
+METRICS_FILE = os.environ.get("GMOBIL_METRICS_FILE")
+
+Span = namedtuple(
+    "Span", ["kind", "name", "depth", "start", "seconds", "peak_bytes", "html_bytes", "geojson_bytes", "features"]
+)
+
+_current = contextvars.ContextVar("instrumentation_recorder", default=None)
+_frames = contextvars.ContextVar("instrumentation_frames", default=())
+
+# (kind, name) -> [count, seconds, max peak bytes, last html bytes, last geojson bytes, last features]
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+class Recorder:
+    """Spans of one rerun, in the order they finished."""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.started = time.perf_counter()
+        self.spans = []
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def rows(self):
+        """Spans as dicts in start order, names indented by nesting depth."""
+        return [
+            {**span._asdict(), "name": "  " * span.depth + span.name}
+            for span in sorted(self.spans, key=lambda span: span.start)
+        ]
+
+
+class _Frame:
+    def __init__(self, kind, name, depth, memory):
+        self.kind = kind
+        self.name = name
+        self.depth = depth
+        self.memory = memory
+        self.peak = memory
+        self.html_bytes = None
+        self.geojson_bytes = None
+        self.features = None
+        self.started = time.perf_counter()
+
+
+def start_run(session=None):
+    """Start recording a rerun in the current context; returns its Recorder (None if disabled)."""
+    if not ENABLED:
+        return None
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    recorder = Recorder(session)
+    _current.set(recorder)
+    _frames.set(())
+    return recorder
+
+
+@contextlib.contextmanager
+def _span(kind, name):
+    frames = _frames.get()
+    memory = 0
+    if TRACE_MEMORY and tracemalloc.is_tracing():
+        memory, peak = tracemalloc.get_traced_memory()
+        if frames:
+            # Spitze des äußeren Abschnitts sichern, bevor sie zurückgesetzt wird
+            frames[-1].peak = max(frames[-1].peak, peak)
+        tracemalloc.reset_peak()
+    frame = _Frame(kind, name, len(frames), memory)
+    token = _frames.set(frames + (frame,))
+    try:
+        yield frame
+    finally:
+        _frames.reset(token)
+        seconds = time.perf_counter() - frame.started
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            if frames:
+                frames[-1].peak = max(frames[-1].peak, frame.peak)
+        recorder = _current.get()
+        _finish(recorder, Span(
+            kind, name, frame.depth, frame.started - (recorder.started if recorder is not None else frame.started),
+            seconds, frame.peak - frame.memory if TRACE_MEMORY else None,
+            frame.html_bytes, frame.geojson_bytes, frame.features,
+        ))
+
+
+def span(kind, name):
+    """Context manager timing the block as ``kind`` (section, build, render, ...) ``name``."""
+    if not ENABLED:
+        return contextlib.nullcontext()
+    return _span(kind, name)
+
+
+def note(html=None, geojson_bytes=None, features=None):
+    """Attach the size of ``html``, a GeoJSON size or a feature count to the innermost open span.
+
+    GeoJSON sizes and feature counts of several layers add up.
+    """
+    if not ENABLED:
+        return
+    frames = _frames.get()
+    if not frames:
+        return
+    frame = frames[-1]
+    if html is not None:
+        frame.html_bytes = len(html.encode("utf-8"))
+    if geojson_bytes is not None:
+        frame.geojson_bytes = (frame.geojson_bytes or 0) + geojson_bytes
+    if features is not None:
+        frame.features = (frame.features or 0) + features
+
+
+def _finish(recorder, record):
+    if recorder is not None:
+        recorder.spans.append(record)
+    logger.info(json.dumps({
+        **record._asdict(),
+        "seconds": round(record.seconds, 6),
+        "session": recorder.session if recorder is not None else None,
+    }))
+    with _totals_lock:
+        totals = _totals.setdefault((record.kind, record.name), [0, 0.0, 0, None, None, None])
+        totals[0] += 1
+        totals[1] += record.seconds
+        totals[2] = max(totals[2], record.peak_bytes or 0)
+        for index, value in enumerate(record[-3:], start=3):
+            if value is not None:
+                totals[index] = value
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Process-wide totals of all spans in the Prometheus text exposition format."""
+    with _totals_lock:
+        totals = sorted(_totals.items())
+    metrics = [
+        ("gmobil_span_seconds_total", "counter", "Total time spent in instrumented spans.", 1),
+        ("gmobil_span_calls_total", "counter", "Number of finished spans.", 0),
+        ("gmobil_span_peak_bytes", "gauge", "Highest traced Python allocation peak of a span.", 2),
+        ("gmobil_html_bytes", "gauge", "Size of the last generated HTML.", 3),
+        ("gmobil_geojson_bytes", "gauge", "Size of the last generated GeoJSON.", 4),
+        ("gmobil_features", "gauge", "Number of features in the last generated payload.", 5),
+    ]
+    lines = []
+    for metric, kind, description, index in metrics:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        for (span_kind, name), values in totals:
+            if values[index] is None or (index == 2 and not TRACE_MEMORY):
+                continue
+            lines.append(f'{metric}{{kind="{_label(span_kind)}",name="{_label(name)}"}} {values[index]}')
+    return "\n".join(lines) + "\n"
+
+
+def finish_run(recorder):
+    """Log the rerun's total and write the metrics file, if configured."""
+    if recorder is None:
+        return
+    logger.info(json.dumps({
+        "kind": "rerun", "session": recorder.session, "seconds": round(recorder.seconds, 6),
+        "spans": len(recorder.spans),
+    }))
+    if METRICS_FILE:
+        tmp_path = f"{METRICS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, METRICS_FILE)
@@ -0,0 +1,317 @@
+"""Process-wide store for the G-Mobil map layers.
+
+Every layer is read from disk once per process, reprojected to EPSG:4326 once
+and then shared between all Streamlit sessions. The returned GeoDataFrames are
+shared objects: treat them as read-only and ``copy()`` before adding columns.
+
+An entry is reloaded when one of the layer's files changes on disk. Changes are
+detected via mtime/size and confirmed with a content hash, so a plain ``touch``
+does not trigger a new parse.
+
+Layers are read from a columnar cache (uncompressed Feather, already
+reduced and in EPSG:4326) when one has been built for the current shapefile
+contents::
+
+    python layer_store.py build
+
+Stale or missing cache files fall back to the shapefile, which is then
+written to the cache, so further worker processes skip parsing and
+reprojecting the shapefile. The cache saves time only, not memory: reading it
+copies the columns into pandas and decodes the WKB into new shapely
+geometries, so every process still holds its own copy of each layer.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from instrumentation import note, span
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directory with the shapefiles, e.g. a synthetic data set for benchmarks
+DATA_DIR = os.environ.get("GMOBIL_DATA_DIR", BASE_DIR)
+
+# Layer name -> shapefile (relative to DATA_DIR)
+LAYER_FILES = {
+    "betriebsgebiet": "Betriebsgebiet.shp",
+    "gronau_bhf": "GronauBhf.shp",
+    "haltestellen": "Haltestellen.shp",
+    "buslinien": "FrühereBuslinie.shp",
+    "taxibuslinien": "FrühereTaxibuslinie.shp",
+    "ein_aus": "G-Mobil_Ein-undAusstiege.shp",
+    "wegerelationen": "Wegerelationen.shp",
+    "routenumlegung": "Routenumlegung_KW43_2.shp",
+    "verfuegbarkeiten": "Verfügbarkeitsanalyse.shp",
+}
+
+# Attribute columns the app uses per layer; everything else is dropped
+LAYER_COLUMNS = {
+    "betriebsgebiet": ["layer"],
+    "gronau_bhf": ["name"],
+    "haltestellen": ["Haltestell", "Typ"],
+    "buslinien": ["Linie"],
+    "taxibuslinien": [],
+    "ein_aus": ["Haltestell", "Typ", "Ein+Aussti", "Ein+Auss_1", "Ein+Auss_2"],
+    "wegerelationen": ["Haltestell", "Halteste_1", "Fahrtenl_2"],
+    "routenumlegung": ["FROM_ID", "TO_ID", "DIST_KM", "DURATION_H", "PROFILE", "Anzahl_Üb"],
+    "verfuegbarkeiten": ["row_index", "col_index", "Verfügbar", "Abgelehnt_", "Fahrten_Fa"],
+}
+
+# Files that together make up one shapefile layer
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+# Metric CRS for distance and area computations (ETRS89 / UTM 32N)
+METRIC_CRS = "EPSG:25832"
+
+CACHE_DIR = os.path.join(DATA_DIR, "layer_cache")
+CACHE_MANIFEST = "manifest.json"
+
+# Bump when _prepare_layer changes, so cache files written by older versions are rebuilt
+CACHE_FORMAT = 2
+
+_Entry = namedtuple("_Entry", ["signature", "digest", "gdf"])
+
+_entries = {}
+_file_versions = {}
+_locks = {name: threading.Lock() for name in LAYER_FILES}
+_manifest_lock = threading.Lock()
+
+
+def layer_path(name):
+    return os.path.join(DATA_DIR, LAYER_FILES[name])
+
+
+def _layer_parts(path):
+    stem = os.path.splitext(path)[0]
+    return [stem + ext for ext in SHAPEFILE_PARTS if os.path.exists(stem + ext)]
+
+
+def _signature(parts):
+    signature = []
+    for part in parts:
+        stat = os.stat(part)
+        signature.append((part, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _digest(parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _downcast(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy()
+        if not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+            return pd.to_numeric(series.astype(np.int64), downcast="integer")
+        return series.astype(np.float32)
+    if series.nunique() <= len(series) // 2:
+        return series.astype("category")
+    return series
+
+
+def _prepare_layer(name, gdf):
+    """Reduce a raw shapefile layer to the columns and dtypes the app uses."""
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        with span("reproject", name):
+            gdf = gdf.to_crs(epsg=4326)
+
+    columns = [c for c in LAYER_COLUMNS[name] if c in gdf.columns]
+    data = {c: _downcast(gdf[c]) for c in columns}
+    return gpd.GeoDataFrame(data, geometry=gdf.geometry.values, crs="EPSG:4326", index=gdf.index)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, CACHE_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _cache_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.feather")
+
+
+def _write_cache(cache_dir, name, digest, gdf):
+    """Write one layer to the columnar cache and record it in the manifest."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = _cache_path(cache_dir, name)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    gdf.to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, cache_path)
+    with _manifest_lock:
+        manifest = _read_manifest(cache_dir)
+        manifest[name] = {
+            "source": LAYER_FILES[name], "source_digest": digest, "format": CACHE_FORMAT, "rows": len(gdf)
+        }
+        tmp_path = os.path.join(cache_dir, f"{CACHE_MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(cache_dir, CACHE_MANIFEST))
+
+
+def _read_layer(name, path, digest):
+    manifest = _read_manifest(CACHE_DIR)
+    cache_path = _cache_path(CACHE_DIR, name)
+    with span("load", name):
+        entry = manifest.get(name, {})
+        cached = (
+            entry.get("source_digest") == digest and entry.get("format") == CACHE_FORMAT and os.path.exists(cache_path)
+        )
+        if not cached:
+            # Cache fehlt oder ist veraltet: Shapefile lesen und in den Cache schreiben
+            with span("read", name):
+                gdf = gpd.read_file(path)
+            gdf = _prepare_layer(name, gdf)
+            try:
+                _write_cache(CACHE_DIR, name, digest, gdf)
+                cached = True
+            except OSError:
+                pass  # z. B. schreibgeschütztes Verzeichnis: ohne Cache weiter
+        if cached:
+            gdf = gpd.read_feather(cache_path, memory_map=True)
+        note(features=len(gdf))
+    return gdf
+
+
+def _entry(name):
+    path = layer_path(name)
+    if not os.path.exists(path):
+        return None
+
+    parts = _layer_parts(path)
+    signature = _signature(parts)
+    entry = _entries.get(name)
+    if entry is not None and entry.signature == signature:
+        return entry
+
+    with _locks[name]:
+        # Another session may have reloaded the layer while we were waiting
+        entry = _entries.get(name)
+        if entry is not None and entry.signature == signature:
+            return entry
+
+        digest = _digest(parts)
+        if entry is not None and entry.digest == digest:
+            entry = entry._replace(signature=signature)
+        else:
+            entry = _Entry(signature, digest, _read_layer(name, path, digest))
+        _entries[name] = entry
+        return entry
+
+
+def load_layer(name):
+    """Return layer ``name`` as GeoDataFrame in EPSG:4326, or None if its file is missing."""
+    entry = _entry(name)
+    return entry.gdf if entry is not None else None
+
+
+def layer_version(name):
+    """Content hash of the layer's files, or None if the layer is missing."""
+    entry = _entry(name)
+    return entry.digest if entry is not None else None
+
+
+def file_version(path):
+    """Content hash of any data file (e.g. a booking log), or None if it is missing.
+
+    The hash is cached per process and only recomputed when mtime/size change.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    signature = _signature([path])
+    cached = _file_versions.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, _digest([path]))
+        _file_versions[path] = cached
+    return cached[1]
+
+
+class SharedCache:
+    """Process-wide cache shared by all sessions.
+
+    ``get`` keeps one value per key for the current data version and builds it
+    once under a lock; ``memoize`` keeps results of pure computations. With
+    ``max_entries`` the least recently used entries are dropped.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, version, build):
+        """Value of ``key`` for data ``version``, built by ``build(previous)`` if needed.
+
+        ``previous`` is the (version, value) entry of an older version or None,
+        so a builder can update the old value incrementally.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                entry = (version, build(entry))
+                self._store(key, entry)
+            return entry[1]
+
+    def memoize(self, key, compute):
+        """Result of ``compute()`` for ``key``; computed outside the lock, so slow keys don't block others."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = compute()
+        with self._lock:
+            self._store(key, (None, value))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def build_cache(cache_dir=CACHE_DIR, names=None):
+    """Convert the shapefile layers into the columnar cache read by ``load_layer``."""
+    for name in names or LAYER_FILES:
+        path = layer_path(name)
+        if not os.path.exists(path):
+            print(f"{name}: file not found, skipped ({path})")
+            continue
+        gdf = _prepare_layer(name, gpd.read_file(path))
+        _write_cache(cache_dir, name, _digest(_layer_parts(path)), gdf)
+        print(f"{name}: {len(gdf)} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar cache for the G-Mobil layers.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--layers", nargs="*", choices=sorted(LAYER_FILES), help="default: all layers")
+    args = parser.parse_args()
+    build_cache(args.cache_dir, args.layers)
@@ -0,0 +1,193 @@
+"""Load test for Karte_Online.py with many concurrent sessions.
+
+Every simulated session is a Streamlit ``AppTest``, i.e. the real script run
+by Streamlit's own runtime, in its own thread like the script threads of a
+server. A session loads the page, opens all sections and then reruns a few
+times with a changed relations threshold. Reported are latency percentiles
+per step and the resident memory of the process: after one warm-up session
+(shared layers, maps and HTML in place) and with all sessions alive, from
+which the memory per additional session follows.
+
+With ``--processes`` the sessions are spread over several worker processes,
+like server replicas behind a load balancer. For every worker the
+proportional set size (PSS) is reported next to the RSS; pages shared between
+the workers (e.g. of the imported libraries) are split between them in the
+PSS. The layers themselves are not shared: every worker decodes its own copy,
+the layer cache (``python layer_store.py build``) only makes that faster::
+
+    python loadtest.py --sessions 50 --reruns 3
+    python loadtest.py --sessions 50 --processes 4 -o loadtest.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(BASE_DIR, "Karte_Online.py")
+
+SESSIONS = 10
+RERUNS = 3
+TIMEOUT = 300
+
+# Values the simulated users pick for the relations threshold
+MIN_TRIPS = (50, 100, 150, 200)
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def memory():
+    """(RSS, PSS) of this process in bytes; PSS is None where /proc is not available."""
+    try:
+        with open("/proc/self/smaps_rollup", encoding="ascii") as f:
+            values = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.endswith("kB\n")}
+        return values["Rss"], values["Pss"]
+    except (OSError, KeyError):
+        # Ohne /proc nur der Höchstwert
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, None
+
+
+def _session(index, reruns, seed):
+    """Run one session; returns (AppTest, [(step, seconds, errors)])."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + index)
+    at = AppTest.from_file(SCRIPT, default_timeout=TIMEOUT)
+    timings = []
+
+    def run(step):
+        started = time.perf_counter()
+        at.run()
+        timings.append((step, time.perf_counter() - started, len(at.exception) + len(at.error)))
+
+    run("load")
+    # Alle Abschnitte öffnen
+    for index in range(len(at.expander)):
+        at.session_state[f"section_{index}"] = True
+    run("open")
+    for _ in range(reruns):
+        at.session_state["relations_min_trips"] = rng.choice(MIN_TRIPS)
+        run("rerun")
+    return at, timings
+
+
+def run_sessions(sessions, reruns=RERUNS, warmup=True, seed=0):
+    """Run ``sessions`` concurrent sessions in this process; returns a result dict."""
+    warnings.filterwarnings("ignore")
+    os.chdir(BASE_DIR)  # Bildpfade sind relativ
+    result = {"pid": os.getpid(), "sessions": sessions}
+    result["rss_start"], result["pss_start"] = memory()
+    if warmup:
+        _session(-1, 0, seed)
+    result["rss_warm"], result["pss_warm"] = memory()
+
+    peak = [result["rss_warm"]]
+    done = threading.Event()
+
+    def monitor():
+        while not done.wait(0.1):
+            peak[0] = max(peak[0], memory()[0])
+
+    threading.Thread(target=monitor, daemon=True).start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        finished = list(pool.map(lambda index: _session(index, reruns, seed), range(sessions)))
+    result["seconds"] = time.perf_counter() - started
+    # Messen, solange alle Sessions noch existieren
+    result["rss_end"], result["pss_end"] = memory()
+    done.set()
+    result["rss_peak"] = max(peak[0], result["rss_end"])
+    result["timings"] = [timing for _, timings in finished for timing in timings]
+    return result
+
+
+def _percentiles(values):
+    values = np.asarray(values)
+    return {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES} | {"max": float(values.max())}
+
+
+def summarize(results):
+    """Latency percentiles per step and memory per worker and session."""
+    timings = [timing for result in results for timing in result["timings"]]
+    sessions = sum(result["sessions"] for result in results)
+    summary = {
+        "sessions": sessions,
+        "processes": len(results),
+        "errors": sum(errors for _, _, errors in timings),
+        "latency": {
+            step: _percentiles([seconds for name, seconds, _ in timings if name == step])
+            for step in dict.fromkeys(name for name, _, _ in timings)
+        },
+        "workers": [
+            {
+                "pid": result["pid"],
+                "sessions": result["sessions"],
+                "rss_warm": result["rss_warm"],
+                "rss_end": result["rss_end"],
+                "rss_peak": result["rss_peak"],
+                "pss_end": result["pss_end"],
+                "rss_per_session": (result["rss_end"] - result["rss_warm"]) / max(result["sessions"], 1),
+            }
+            for result in results
+        ],
+    }
+    summary["rss_total"] = sum(worker["rss_end"] for worker in summary["workers"])
+    if all(worker["pss_end"] is not None for worker in summary["workers"]):
+        summary["pss_total"] = sum(worker["pss_end"] for worker in summary["workers"])
+    return summary
+
+
+def _print(summary):
+    mb = 1024 * 1024
+    print(f"{summary['sessions']} sessions in {summary['processes']} process(es), {summary['errors']} errors")
+    print(f"{'step':<8}" + "".join(f"{name:>9}" for name in [f"p{p}" for p in PERCENTILES] + ["max"]))
+    for step, values in summary["latency"].items():
+        print(f"{step:<8}" + "".join(f"{value:>8.2f}s" for value in values.values()))
+    for worker in summary["workers"]:
+        pss = f", PSS {worker['pss_end'] / mb:.0f} MB" if worker["pss_end"] is not None else ""
+        print(
+            f"pid {worker['pid']}: {worker['sessions']} sessions, RSS warm {worker['rss_warm'] / mb:.0f} MB, "
+            f"end {worker['rss_end'] / mb:.0f} MB, peak {worker['rss_peak'] / mb:.0f} MB{pss}, "
+            f"{worker['rss_per_session'] / mb:.1f} MB per session"
+        )
+    if "pss_total" in summary:
+        print(f"total RSS {summary['rss_total'] / mb:.0f} MB, PSS {summary['pss_total'] / mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run concurrent simulated sessions of the dashboard.")
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="concurrent sessions in total")
+    parser.add_argument("--reruns", type=int, default=RERUNS, help="reruns per session after opening all sections")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes the sessions are spread over")
+    parser.add_argument("--no-warmup", action="store_true", help="start all sessions on cold caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    warmup = not args.no_warmup
+    if args.processes == 1:
+        results = [run_sessions(args.sessions, args.reruns, warmup, args.seed)]
+    else:
+        shares = [len(part) for part in np.array_split(np.arange(args.sessions), args.processes)]
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [
+                pool.submit(run_sessions, share, args.reruns, warmup, args.seed + 1000 * i)
+                for i, share in enumerate(shares)
+            ]
+            results = [future.result() for future in futures]
+
+    summary = summarize(results)
+    _print(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,324 @@
+"""Bulk folium layers for the G-Mobil maps.
+
+Instead of one folium object (and one inline JS block) per feature, each layer
+is written as a single GeoJSON FeatureCollection. Per-feature styling is read
+from the feature properties, so folium only emits one style entry per distinct
+style. Lines that share a style are merged into one MultiLineString.
+
+Very large regular grids can alternatively be sent as a single image overlay
+built from their row/column indices, and aggregated point data as one layer
+per zoom level of which only the current one is shown (``ZoomLevels``).
+Static layers can also be referenced as vector tiles (see ``vector_tiles``).
+
+All builders pass their geometries through the payload reduction stage
+(``payload.reduce_geometries``) before serialising them.
+"""
+import json
+
+import folium
+import geopandas as gpd
+import numpy as np
+import shapely
+from branca.element import MacroElement
+from folium.plugins import VectorGridProtobuf
+from folium.template import Template
+
+from payload import COORDINATE_PRECISION, reduce_geometries, to_topology
+
+
+def _is_scalar(value):
+    return np.ndim(value) == 0
+
+
+def _as_list(value, n):
+    values = np.asarray(value)
+    if values.shape != (n,):
+        raise ValueError(f"expected {n} values, got shape {values.shape}")
+    return values.tolist()
+
+
+def point_layer(
+    gdf,
+    label=None,
+    radius=1,
+    color="black",
+    fill_color=None,
+    weight=1,
+    fill_opacity=1.0,
+    name=None,
+    popup=True,
+    tooltip=False,
+    precision=COORDINATE_PRECISION,
+):
+    """Render all points of ``gdf`` as one GeoJson layer of circle markers.
+
+    ``radius``, ``color`` and ``fill_color`` are either scalars or arrays with one
+    value per point; ``label`` is the popup/tooltip text per point.
+    """
+    geoms = reduce_geometries(gdf.geometry.values, precision=precision, name=name)
+    x = shapely.get_x(geoms).tolist()
+    y = shapely.get_y(geoms).tolist()
+    n = len(x)
+    fill_color = color if fill_color is None else fill_color
+
+    # Only per-feature values go into the properties, constants into the style
+    styles = {"radius": radius, "color": color, "fillColor": fill_color}
+    constant = {key: value for key, value in styles.items() if _is_scalar(value)}
+    varying = {key: _as_list(value, n) for key, value in styles.items() if not _is_scalar(value)}
+    if label is not None:
+        varying["label"] = _as_list(label, n)
+
+    keys = list(varying)
+    columns = [varying[key] for key in keys]
+    features = [
+        {
+            "type": "Feature",
+            "id": i,
+            "geometry": {"type": "Point", "coordinates": [x[i], y[i]]},
+            "properties": dict(zip(keys, values)),
+        }
+        for i, values in enumerate(zip(*columns) if columns else [()] * n)
+    ]
+
+    def style_function(feature):
+        style = {"weight": weight, "fill": True, "fillOpacity": fill_opacity, **constant}
+        style.update((key, feature["properties"][key]) for key in styles if key in varying)
+        return style
+
+    has_label = label is not None
+    return folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=name,
+        marker=folium.CircleMarker(),
+        style_function=style_function,
+        popup=folium.GeoJsonPopup(fields=["label"], labels=False) if has_label and popup else None,
+        tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False) if has_label and tooltip else None,
+    )
+
+
+def colormap_classes(colormap, values, n=5):
+    """Split ``values`` into ``n`` equal classes of ``colormap``.
+
+    Returns the class index per value, one colour and one label per class and
+    the matching step colormap for the legend.
+    """
+    step = colormap.to_step(n)
+    edges = np.asarray(step.index, dtype=float)
+    classes = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n - 1)
+    colors = [colormap((lo + hi) / 2) for lo, hi in zip(edges[:-1], edges[1:])]
+    labels = [f"{lo:.0f} – {hi:.0f}" for lo, hi in zip(edges[:-1], edges[1:])]
+    return classes, colors, labels, step
+
+
+def line_layers(
+    gdf,
+    classes,
+    colors,
+    labels=None,
+    weight=2,
+    opacity=0.8,
+    dash_array=None,
+    tooltip=None,
+    name=None,
+    zoom=None,
+    precision=COORDINATE_PRECISION,
+):
+    """Merge the lines of ``gdf`` per class and return one GeoJson layer per class.
+
+    ``classes`` holds a class index per row, ``colors`` and ``labels`` one entry
+    per class. Rows without a (Multi)LineString geometry are skipped. ``name``
+    is only used for the payload report.
+    """
+    geoms = np.asarray(gdf.geometry.values)
+    classes = np.broadcast_to(np.asarray(classes), geoms.shape)
+    type_ids = shapely.get_type_id(geoms)
+    is_line = np.isin(type_ids, [1, 5]) & ~shapely.is_empty(geoms)
+
+    # MultiLineStrings in Einzellinien zerlegen (vektorisiert)
+    parts, index = shapely.get_parts(geoms[is_line], return_index=True)
+    part_classes = classes[is_line][index]
+    valid = shapely.get_num_coordinates(parts) >= 2
+    parts, part_classes = parts[valid], part_classes[valid]
+    if len(parts) == 0:
+        return []
+    parts = reduce_geometries(parts, zoom, precision, name)
+
+    class_ids, inverse = np.unique(part_classes, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    merged = shapely.multilinestrings(parts[order], indices=inverse[order])
+
+    layers = []
+    for class_id, geom in zip(class_ids.tolist(), merged):
+        color = colors[class_id]
+        label = labels[class_id] if labels is not None else None
+        style = {"color": color, "weight": weight, "opacity": opacity}
+        if dash_array is not None:
+            style["dashArray"] = dash_array
+        feature = {
+            "type": "Feature",
+            "geometry": json.loads(shapely.to_geojson(geom)),
+            "properties": {},
+        }
+        text = tooltip.format(label=label) if tooltip is not None and label is not None else None
+        layers.append(
+            folium.GeoJson(feature, name=label, style_function=lambda x, style=style: style, tooltip=text)
+        )
+    return layers
+
+
+def _feature_collection(geoms, properties):
+    """GeoJSON FeatureCollection string for a geometry array and property columns."""
+    geometries = shapely.to_geojson(geoms)
+    keys = list(properties)
+    rows = zip(*(properties[key] for key in keys)) if keys else [()] * len(geometries)
+    features = [
+        f'{{"type":"Feature","id":{i},"geometry":{geometry},"properties":{json.dumps(dict(zip(keys, row)))}}}'
+        for i, (geometry, row) in enumerate(zip(geometries, rows))
+    ]
+    return '{"type":"FeatureCollection","features":[' + ",".join(features) + "]}"
+
+
+def polygon_layer(
+    gdf,
+    fill_opacity,
+    label=None,
+    fill_color="green",
+    color="black",
+    weight=0.2,
+    name=None,
+    zoom=None,
+    precision=COORDINATE_PRECISION,
+    topology=False,
+):
+    """Render all polygons of ``gdf`` as one choropleth GeoJson layer.
+
+    ``fill_opacity`` holds one value per polygon, ``label`` the tooltip text.
+    With ``topology=True`` the layer is sent as TopoJSON with shared arcs; the
+    per-cell tooltip is dropped in that mode.
+    """
+    n = len(gdf)
+    geoms = reduce_geometries(gdf.geometry.values, zoom, precision, name)
+    properties = {"opacity": _as_list(fill_opacity, n)}
+    if label is not None:
+        properties["label"] = _as_list(label, n)
+
+    def style_function(feature):
+        return {
+            "fillColor": fill_color,
+            "color": color,
+            "weight": weight,
+            "fillOpacity": feature["properties"]["opacity"],
+        }
+
+    if topology:
+        frame = gpd.GeoDataFrame({"opacity": properties["opacity"]}, geometry=geoms, crs=gdf.crs)
+        topo = to_topology(frame, precision)
+        if topo is not None:
+            return folium.TopoJson(topo, "objects.data", style_function=style_function, name=name)
+
+    return folium.GeoJson(
+        _feature_collection(geoms, properties),
+        name=name,
+        style_function=style_function,
+        tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False) if label is not None else None,
+    )
+
+
+def area_layer(gdf, name="Betriebsgebiet", zoom=None, precision=COORDINATE_PRECISION, tiles=None):
+    """Operating area outline as shown on every map.
+
+    With a vector tile URL (``tiles``) the outline is loaded from the tile server.
+    """
+    style = {'fillColor': 'green', 'color': 'blue', 'weight': 1, 'fillOpacity': 0.05}
+    if tiles is not None:
+        return vector_tile_layer(tiles, "betriebsgebiet", {**style, 'fill': True}, name=name)
+    geoms = reduce_geometries(gdf.geometry.values, zoom, precision, name)
+    return folium.GeoJson(
+        _feature_collection(geoms, {}),
+        name=name,
+        style_function=lambda x: style,
+    )
+
+
+def vector_tile_layer(url, layer, style, name=None, max_native_zoom=16):
+    """Layer ``layer`` of the vector tiles at ``url``.
+
+    ``style`` is a Leaflet path style dict or a JavaScript function of the
+    feature properties returning one.
+    """
+    style = style if isinstance(style, str) else json.dumps(style)
+    options = (
+        f'{{"vectorTileLayerStyles": {{{json.dumps(layer)}: {style}}}, '
+        f'"maxNativeZoom": {max_native_zoom}, "interactive": false}}'
+    )
+    return VectorGridProtobuf(url, name=name, options=options)
+
+
+def grid_raster_layer(gdf, fill_opacity, row_col=("row_index", "col_index"), fill_color=(0, 128, 0), name=None):
+    """Render a regular grid as one image overlay, one pixel per cell.
+
+    Rows count from north to south and columns from west to east. The image is
+    stretched over the grid's WGS84 bounding box, which ignores the slight
+    rotation of a projected grid; it is meant for grids too large for polygons.
+    """
+    rows = gdf[row_col[0]].to_numpy().astype(int)
+    cols = gdf[row_col[1]].to_numpy().astype(int)
+    rows -= rows.min()
+    cols -= cols.min()
+
+    image = np.zeros((rows.max() + 1, cols.max() + 1, 4))
+    image[..., :3] = np.asarray(fill_color) / 255
+    image[rows, cols, 3] = np.nan_to_num(np.asarray(fill_opacity, dtype=float))
+
+    minx, miny, maxx, maxy = gdf.total_bounds
+    return folium.raster_layers.ImageOverlay(
+        image,
+        bounds=[[miny, minx], [maxy, maxx]],
+        mercator_project=True,
+        name=name,
+    )
+
+
+class ZoomLevels(MacroElement):
+    """Show only the layer of the current zoom level.
+
+    ``levels`` is a list of (zoom, layer); after every zoom change the layer whose
+    zoom is nearest to the map's zoom is kept on the map (the first of them on a
+    tie), all others are removed. Add this element after the layers.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var levels = [
+                {%- for zoom, layer in this.levels %}
+                [{{ zoom }}, {{ layer.get_name() }}],
+                {%- endfor %}
+            ];
+            function showLevel() {
+                // Nächstgelegene vorhandene Stufe, auch bei Lücken zwischen den Zoomstufen
+                var zoom = map.getZoom(), nearest = levels[0][0];
+                levels.forEach(function(level) {
+                    if (Math.abs(level[0] - zoom) < Math.abs(nearest - zoom)) { nearest = level[0]; }
+                });
+                levels.forEach(function(level) {
+                    if (level[0] === nearest) {
+                        if (!map.hasLayer(level[1])) { map.addLayer(level[1]); }
+                    } else if (map.hasLayer(level[1])) {
+                        map.removeLayer(level[1]);
+                    }
+                });
+            }
+            map.on("zoomend", showLevel);
+            showLevel();
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, levels):
+        super().__init__()
+        self._name = "ZoomLevels"
+        self.levels = list(levels)
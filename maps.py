@@ -0,0 +1,646 @@
+"""Map builders for the G-Mobil dashboard.
+
+Each builder returns a finished ``folium.Map`` built from the shared layer
+store, or None if the map's main layer is missing. Builders do not depend on
+Streamlit, so the same maps can be produced outside the app. Built maps are
+memoised per data version (the content hashes of the layers they use) and
+shared between sessions; use ``render_map`` to turn one into HTML.
+
+``map_html`` returns the rendered HTML from a two-tier cache keyed by the data
+version and the render settings (``MAP_SETTINGS`` plus per-call overrides).
+
+If a booking log is configured (``GMOBIL_BOOKINGS``), the route relations are
+computed from it with the OD engine instead of read from Wegerelationen.shp,
+and the pickup/dropoff maps show its raw positions aggregated per zoom level.
+A request log (``GMOBIL_REQUESTS``) likewise replaces the availability grid.
+In vector-tile mode (``GMOBIL_VECTOR_TILES``) the large static layers are
+referenced as tiles instead of being inlined. With weekly partitions (see
+``partitions``) the ``period`` setting (first, last ISO week) combines the
+partitions of that period instead.
+"""
+import functools
+import json
+import threading
+
+import branca.colormap as cm
+import folium
+import geopandas as gpd
+import numpy as np
+
+from availability import CELL_SIZE, REQUESTS_PATH, request_grid
+from bookings import BOOKINGS_PATH
+from catchment import CHANGES, DEFAULT_RADIUS, catchment_index
+from classify import breaks, classify, lookup
+from html_cache import HtmlCache, cache_key
+from instrumentation import note, span
+from layer_store import file_version, layer_version, load_layer
+from map_layers import (
+    ZoomLevels,
+    area_layer,
+    colormap_classes,
+    grid_raster_layer,
+    line_layers,
+    point_layer,
+    polygon_layer,
+    vector_tile_layer,
+)
+from od_matrix import above, booking_od, relation_lines
+from partitions import (
+    partition_version,
+    period_grid,
+    period_od,
+    period_pyramid,
+    period_routes,
+    period_stop_counts,
+    period_weeks,
+)
+from payload import COORDINATE_PRECISION, DETAIL_ZOOM, SIMPLIFY_PIXELS
+from pyramid import booking_pyramid
+from route_overlap import route_overlaps
+from vector_tiles import TILE_URL, start_server, tile_url, tiles_enabled
+
+
+TILES = "https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png"
+DEFAULT_CENTER = [51.933, 7.628]
+ZOOM_START = 12.3
+
+# Ab dieser Zellenzahl wird das Verfügbarkeitsraster als Bild statt als Polygone übertragen
+GRID_RASTER_THRESHOLD = 20000
+
+# Most relations drawn, strongest first; low thresholds otherwise yield tens of thousands of lines
+MAX_RELATIONS = 2000
+
+# Marker radius (pixels) per Jenks class of aggregated raw points
+PYRAMID_RADIUS = 4
+
+# Map key -> layers the builder reads
+MAP_LAYERS = {
+    "overview": ["haltestellen", "betriebsgebiet", "buslinien", "taxibuslinien"],
+    "pickups": ["haltestellen", "betriebsgebiet", "ein_aus"],
+    "dropoffs": ["haltestellen", "betriebsgebiet", "ein_aus"],
+    "relations": ["betriebsgebiet", "wegerelationen"],
+    "rerouting": ["betriebsgebiet", "routenumlegung"],
+    "availability": ["verfuegbarkeiten"],
+    "coverage": ["haltestellen", "betriebsgebiet", "verfuegbarkeiten", "buslinien", "taxibuslinien"],
+}
+
+# Render settings per map; part of the HTML cache key
+MAP_SETTINGS = {
+    "overview": {"zoom": ZOOM_START},
+    # Mit Buchungsdaten: "raw_points" zeigt die aggregierten Rohpunkte je Zoomstufe statt der Haltestellen
+    "pickups": {
+        "zoom": ZOOM_START, "column": "Ein+Aussti", "scheme": "jenks", "k": 5, "raw_points": True, "period": None,
+    },
+    "dropoffs": {
+        "zoom": ZOOM_START, "column": "Ein+Auss_1", "scheme": "jenks", "k": 5, "raw_points": True, "period": None,
+    },
+    "relations": {
+        "zoom": ZOOM_START, "min_trips": 100, "colormap": "Reds_09", "classes": 5,
+        # Nur mit Buchungsdaten: Zeitraum, Wochentage (0 = Montag), Stunden, Hin/Rück zusammenfassen
+        "start": None, "end": None, "weekdays": None, "hours": None, "merge_directions": False,
+        "period": None, "max_relations": MAX_RELATIONS,
+    },
+    "rerouting": {
+        "zoom": ZOOM_START, "min_overlaps": 0, "colormap": "OrRd_09", "classes": 5, "segments": False,
+        "period": None,
+    },
+    "availability": {
+        "zoom": 12, "classes": 10, "raster_threshold": GRID_RASTER_THRESHOLD,
+        # Nur mit Anfragedaten: Zellform ("hex"/"square") und Zeilenabstand in Metern
+        "grid_shape": "hex", "cell_size": CELL_SIZE, "period": None,
+        # Zellen als TopoJSON mit gemeinsamen Kanten (ohne Tooltip, benötigt topojson)
+        "topology": False,
+    },
+    # Einzugsradius in Metern, Haltestellentyp (None = alle)
+    "coverage": {"zoom": 12, "radius": DEFAULT_RADIUS, "stop_type": None, "raster_threshold": GRID_RASTER_THRESHOLD},
+}
+
+# Cell colour (name, RGB for the raster) per coverage change; cells covered by neither are not drawn
+COVERAGE_COLORS = {"both": ("green", (0, 128, 0)), "gained": ("blue", (0, 0, 255)), "lost": ("red", (255, 0, 0))}
+COVERAGE_LABELS = {
+    "both": "Within reach of a stop and a 2021 line",
+    "gained": "Only within reach of a stop",
+    "lost": "Only within reach of a 2021 line",
+}
+
+# Maps that are computed from a raw log when one is configured
+LOG_SOURCES = {
+    "pickups": BOOKINGS_PATH,
+    "dropoffs": BOOKINGS_PATH,
+    "relations": BOOKINGS_PATH,
+    "availability": REQUESTS_PATH,
+}
+
+# Maps that combine weekly partitions for a "period" -> partitioned dataset
+PARTITION_SOURCES = {
+    "pickups": "bookings",
+    "dropoffs": "bookings",
+    "relations": "bookings",
+    "rerouting": "routes",
+    "availability": "requests",
+}
+
+# Bump when builder output changes without a settings change
+RENDER_VERSION = 1
+
+html_cache = HtmlCache()
+
+_built = {}
+_build_locks = {key: threading.Lock() for key in MAP_LAYERS}
+_render_lock = threading.Lock()
+
+
+def data_version(key):
+    """Content hashes of the layers (and raw log) map ``key`` is built from."""
+    versions = [layer_version(name) for name in MAP_LAYERS[key]]
+    if key in LOG_SOURCES:
+        versions.append(file_version(LOG_SOURCES[key]))
+    if key in PARTITION_SOURCES:
+        versions.append(partition_version())
+    return tuple(versions)
+
+
+def map_settings(key, overrides=None):
+    return {**MAP_SETTINGS[key], **(overrides or {})}
+
+
+def memoize_by_version(key):
+    """Build map ``key`` once per data version and settings and share it between sessions."""
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(settings=None):
+            settings = map_settings(key, settings)
+            version = (data_version(key), cache_key(settings))
+            entry = _built.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            with _build_locks[key]:
+                entry = _built.get(key)
+                if entry is None or entry[0] != version:
+                    with span("build", key):
+                        entry = (version, build(settings))
+                    _built[key] = entry
+            return entry[1]
+        return wrapper
+    return decorator
+
+
+def render_map(m, bounds=None):
+    """Render a (shared) map to a standalone HTML page.
+
+    ``bounds`` ([[south, west], [north, east]]) fits the view to an area for
+    this rendering only.
+    """
+    # folium hängt die Karte beim Rendern in eine neue Figure ein, daher nur ein Thread gleichzeitig
+    with _render_lock:
+        if bounds is None:
+            return folium.Figure().add_child(m).render()
+        fit = folium.FitBounds(bounds)
+        m.add_child(fit)
+        try:
+            return folium.Figure().add_child(m).render()
+        finally:
+            del m._children[fit.get_name()]
+
+
+def map_cache_key(key, settings=None):
+    return cache_key(
+        key,
+        data_version(key),
+        map_settings(key, settings),
+        {
+            "precision": COORDINATE_PRECISION,
+            "simplify": (SIMPLIFY_PIXELS, DETAIL_ZOOM),
+            "render": RENDER_VERSION,
+            "tiles": TILE_URL if tiles_enabled() else None,
+        },
+    )
+
+
+def map_html(key, settings=None):
+    """Rendered HTML of map ``key``, or None if the map's main layer is missing.
+
+    ``settings`` overrides single entries of ``MAP_SETTINGS[key]``.
+    """
+    if tiles_enabled():
+        # Auch gecachtes HTML verweist auf den Kachelserver
+        start_server()
+    with span("map", key):
+        cache_id = map_cache_key(key, settings)
+        html = html_cache.get(cache_id)
+        if html is None:
+            m = MAPS[key](settings)
+            if m is None:
+                return None
+            with span("render", key):
+                html = render_map(m)
+            html_cache.put(cache_id, html)
+        note(html=html)
+    return html
+
+
+def _base_map(location, zoom_start=ZOOM_START):
+    return folium.Map(
+        location=location,
+        zoom_start=zoom_start,
+        tiles=TILES,
+        attr="© CartoDB",
+        name="CartoDB Positron"
+    )
+
+
+def _stops_center():
+    haltestellen = load_layer("haltestellen")
+    if haltestellen is not None and not haltestellen.empty:
+        return [haltestellen.geometry.y.mean(), haltestellen.geometry.x.mean()]
+    return DEFAULT_CENTER
+
+
+@memoize_by_version("overview")
+def build_overview_map(settings):
+    zoom_start = settings["zoom"]
+    m = _base_map(_stops_center(), zoom_start)
+
+    # Load and plot Betriebsgebiet (Polygon)
+    betriebsgebiet = load_layer("betriebsgebiet")
+    if betriebsgebiet is not None:
+        area_layer(betriebsgebiet, name="Operting area", zoom=zoom_start, tiles=tile_url("betriebsgebiet")).add_to(m)
+
+    # Feature Group for Haltestellen
+    haltestellen = load_layer("haltestellen")
+    haltestellen_group = folium.FeatureGroup(name="G-Mobil stops")
+    if haltestellen is not None:
+        # Alle Haltestellen als eine FeatureCollection
+        colors = np.where(haltestellen["Typ"] == "physisch", "green", "blue")
+        point_layer(
+            haltestellen,
+            label=haltestellen["Haltestell"].fillna("Haltestelle").to_numpy(),
+            radius=1,
+            color=colors,
+            fill_opacity=1.0,
+            name="Haltestellen"
+        ).add_to(haltestellen_group)
+        haltestellen_group.add_to(m)
+
+    # Load and group Buslinien (Lines)
+    buslinien_group = folium.FeatureGroup(name="Scheduled bus lines (2021)")
+    buslinien = load_layer("buslinien")
+    if buslinien is not None and tile_url("buslinien") is not None:
+        vector_tile_layer(
+            tile_url("buslinien"), "buslinien", {"color": "purple", "weight": 2, "opacity": 0.8}, name="Buslinien"
+        ).add_to(buslinien_group)
+        buslinien_group.add_to(m)
+    elif buslinien is not None:
+        colors = ["purple"]  # Example colors
+
+        # Linien gleicher Farbe werden zu einem MultiLineString zusammengefasst
+        classes = np.arange(len(buslinien)) % len(colors)
+        for layer in line_layers(buslinien, classes, colors, weight=2, opacity=0.8, name="Buslinien", zoom=zoom_start):
+            layer.add_to(buslinien_group)
+        buslinien_group.add_to(m)
+
+    # Load and group Taxibuslinien (Lines)
+    taxibuslinien_group = folium.FeatureGroup(name="Taxi-buslines (2021)")
+    taxibuslinien = load_layer("taxibuslinien")
+    colors = ["brown", "cyan", "magenta", "yellow", "pink"]  # Example colors for Taxibuslinien
+    if taxibuslinien is not None and tile_url("taxibuslinien") is not None:
+        # Farbe nach Zeilennummer wie unten, im Browser berechnet
+        style = (
+            f"function(p) {{ var colors = {json.dumps(colors)}; return {{color: colors[p.index % colors.length], "
+            "weight: 2, opacity: 1.0, dashArray: '5, 5'}; }"
+        )
+        vector_tile_layer(tile_url("taxibuslinien"), "taxibuslinien", style, name="Taxibuslinien").add_to(
+            taxibuslinien_group
+        )
+        taxibuslinien_group.add_to(m)
+    elif taxibuslinien is not None:
+        classes = np.arange(len(taxibuslinien)) % len(colors)  # Assign colors based on index
+        for layer in line_layers(
+            taxibuslinien, classes, colors, weight=2, opacity=1.0, dash_array='5, 5', name="Taxibuslinien", zoom=zoom_start
+        ):
+            layer.add_to(taxibuslinien_group)
+        taxibuslinien_group.add_to(m)
+
+    # Add Layer Control
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def _stop_counts_map(settings, text, fill_color, name, kind):
+    zoom_start = settings["zoom"]
+    column = settings["column"]
+    m = _base_map(_stops_center(), zoom_start)
+
+    betriebsgebiet = load_layer("betriebsgebiet")
+    if betriebsgebiet is not None:
+        area_layer(betriebsgebiet, zoom=zoom_start, tiles=tile_url("betriebsgebiet")).add_to(m)
+
+    # Radius je Klasse (1, 2, ... Pixel)
+    radii = np.arange(1, settings["k"] + 1)
+
+    weeks = period_weeks("bookings", settings["period"])
+    if weeks is not None:
+        version = (tuple(weeks), partition_version())
+    else:
+        version = file_version(BOOKINGS_PATH)
+
+    if settings["raw_points"] and version is not None:
+        # Rohpunkte aus den Buchungsdaten, je Zoomstufe vorab aggregiert; nur die aktuelle Stufe wird angezeigt
+        if weeks is not None:
+            pyramid = period_pyramid(weeks, kind)
+        else:
+            pyramid = booking_pyramid(BOOKINGS_PATH, kind)
+        levels = []
+        for level in pyramid.levels():
+            if not len(level.count):
+                continue
+            bins = breaks(level.count, settings["scheme"], settings["k"], key=(kind, level.zoom, version))
+            counts = level.count.astype(np.int64)
+            layer = point_layer(
+                gpd.GeoDataFrame(geometry=gpd.points_from_xy(level.lon, level.lat), crs="EPSG:4326"),
+                label=np.char.mod(f"{text}: %d", counts),
+                radius=lookup(classify(level.count, bins), radii * PYRAMID_RADIUS),
+                color='black',
+                weight=0.5,
+                fill_color=fill_color,
+                fill_opacity=0.4,
+                tooltip=True,
+                name=f"{name} (zoom {level.zoom})",
+            )
+            layer.add_to(m)
+            levels.append((level.zoom, layer))
+        if levels:
+            ZoomLevels(levels).add_to(m)
+        return m
+
+    # Load and plot G-Mobil Ein- und Ausstiege (Points) using Jenks Natural Breaks
+    if weeks is not None:
+        # Haltestellen-Summen der Wochen im Zeitraum
+        g_mobil_ein_aus = period_stop_counts(weeks)
+    else:
+        g_mobil_ein_aus = load_layer("ein_aus")
+        version = layer_version("ein_aus")
+    if g_mobil_ein_aus is not None:
+        counts = g_mobil_ein_aus[column].to_numpy()
+        bins = breaks(counts, settings["scheme"], settings["k"], key=("ein_aus", column, version))
+        point_layer(
+            g_mobil_ein_aus,
+            label=np.char.mod(f"{text}: %d", counts),
+            radius=lookup(classify(counts, bins), radii),
+            color='black',
+            weight=0.5,  # Reduce border thickness
+            fill_color=fill_color,
+            fill_opacity=0.2,  # Adjust transparency
+            tooltip=True,
+            name=name
+        ).add_to(m)
+    return m
+
+
+@memoize_by_version("pickups")
+def build_pickups_map(settings):
+    return _stop_counts_map(settings, "Einstiege", "red", "Einstiege", "pickup")
+
+
+@memoize_by_version("dropoffs")
+def build_dropoffs_map(settings):
+    return _stop_counts_map(settings, "Ausstiege", "blue", "Ausstiege", "dropoff")
+
+
+def _line_counts_map(gdf, column, colormap, settings, tooltip, caption, name):
+    zoom_start = settings["zoom"]
+
+    # Kartenzentrum aus der Bounding Box (die Vereinigung aller Linien wächst überproportional)
+    minx, miny, maxx, maxy = gdf.total_bounds
+    m = _base_map(((miny + maxy) / 2, (minx + maxx) / 2), zoom_start)  # lat, lon
+
+    # Betriebsgebiet (falls vorhanden) zur Karte hinzufügen
+    betriebsgebiet = load_layer("betriebsgebiet")
+    if betriebsgebiet is not None:
+        area_layer(betriebsgebiet, zoom=zoom_start, tiles=tile_url("betriebsgebiet")).add_to(m)
+
+    # Linien je Legendenklasse zusammengefasst zeichnen
+    classes, colors, labels, colormap = colormap_classes(colormap, gdf[column].to_numpy(), settings["classes"])
+    for layer in line_layers(
+        gdf, classes, colors, labels,
+        weight=4,
+        opacity=0.7,
+        tooltip=tooltip,
+        name=name,
+        zoom=zoom_start
+    ):
+        layer.add_to(m)
+
+    # Legende zur Karte hinzufügen
+    colormap.caption = caption
+    m.add_child(colormap)
+    return m
+
+
+@memoize_by_version("relations")
+def build_relations_map(settings):
+    weeks = period_weeks("bookings", settings["period"])
+    if weeks is not None or file_version(BOOKINGS_PATH) is not None:
+        # Relationen direkt aus den Buchungsdaten (OD-Matrix), Linien zwischen den Haltestellen
+        od = period_od(weeks) if weeks is not None else booking_od(BOOKINGS_PATH)
+        matrix = od.matrix(
+            start=settings["start"],
+            end=settings["end"],
+            weekdays=settings["weekdays"],
+            hours=settings["hours"],
+            merge_directions=settings["merge_directions"],
+        )
+        origins, destinations, counts = above(matrix, settings["min_trips"])
+        # above() liefert absteigend sortiert, also die stärksten Relationen behalten
+        limit = settings["max_relations"]
+        Wegerelationen_gdf = relation_lines(origins[:limit], destinations[:limit], counts[:limit])
+    else:
+        Wegerelationen_gdf = load_layer("wegerelationen")
+        if Wegerelationen_gdf is None:
+            return None
+
+        # Sicherstellen, dass die Geometrie gültig ist
+        Wegerelationen_gdf = Wegerelationen_gdf[Wegerelationen_gdf.geometry.notnull()]
+
+        # Filter auf Fahrtenl_2 > 100
+        Wegerelationen_gdf = Wegerelationen_gdf[Wegerelationen_gdf['Fahrtenl_2'] > settings["min_trips"]]
+        Wegerelationen_gdf = Wegerelationen_gdf.nlargest(settings["max_relations"], 'Fahrtenl_2', keep="first")
+
+    if Wegerelationen_gdf.empty:
+        return None
+
+    # Farbskala definieren (je höher der Wert, desto blauer)
+    colormap = getattr(cm.linear, settings["colormap"]).scale(
+        Wegerelationen_gdf['Fahrtenl_2'].min(),
+        Wegerelationen_gdf['Fahrtenl_2'].max()
+    )
+    return _line_counts_map(
+        Wegerelationen_gdf, 'Fahrtenl_2', colormap, settings,
+        tooltip="Amount of Passengers per Relation: {label}",
+        caption="Fahrten pro Relation",
+        name="Wegerelationen"
+    )
+
+
+@memoize_by_version("rerouting")
+def build_rerouting_map(settings):
+    weeks = period_weeks("routes", settings["period"])
+    if weeks is not None:
+        # Umlegungen aller Wochen im Zeitraum
+        routenumlegung_gdf = period_routes(weeks)
+        caption = f"Amount of overlapping Routes ({weeks[0]} – {weeks[-1]})" if weeks else None
+    else:
+        routenumlegung_gdf = load_layer("routenumlegung")
+        caption = "Amount of overlapping Routes (CW 43, 2023)"
+    if routenumlegung_gdf is None:
+        return None
+
+    # Sicherstellen, dass die Geometrie gültig ist
+    routenumlegung_gdf = routenumlegung_gdf[routenumlegung_gdf.geometry.notnull()]
+    if routenumlegung_gdf.empty:
+        return None
+
+    if settings["segments"]:
+        # Überlagerungen je Straßenabschnitt aus den Routen selbst berechnen
+        routenumlegung_gdf = route_overlaps(routenumlegung_gdf).segments
+
+    # Filter auf Anzahl_Üb > 0
+    routenumlegung_gdf = routenumlegung_gdf[routenumlegung_gdf['Anzahl_Üb'] > settings["min_overlaps"]]
+    if routenumlegung_gdf.empty:
+        return None
+
+    # Farbskala definieren (z. B. Orange-Rot)
+    colormap = getattr(cm.linear, settings["colormap"]).scale(
+        routenumlegung_gdf['Anzahl_Üb'].min(),
+        routenumlegung_gdf['Anzahl_Üb'].max()
+    )
+    return _line_counts_map(
+        routenumlegung_gdf, 'Anzahl_Üb', colormap, settings,
+        tooltip="Amount of overlapping Routes: {label}",
+        caption=caption,
+        name="Routenumlegung"
+    )
+
+
+@memoize_by_version("availability")
+def build_availability_map(settings):
+    weeks = period_weeks("requests", settings["period"])
+    grid = period_grid(weeks, settings["grid_shape"], settings["cell_size"]) if weeks is not None else None
+    if grid is not None:
+        # Summen der Wochen im Zeitraum
+        verfuegbarkeiten_gdf = grid.frame()
+    elif file_version(REQUESTS_PATH) is not None:
+        # Raster direkt aus den Anfragedaten, bei angehängten Daten nur neue Datensätze
+        verfuegbarkeiten_gdf = request_grid(REQUESTS_PATH, settings["grid_shape"], settings["cell_size"]).frame()
+    else:
+        verfuegbarkeiten_gdf = load_layer("verfuegbarkeiten")
+        if verfuegbarkeiten_gdf is None:
+            return None
+
+    # Mittelpunkt für die Karte setzen (z. B. Mittelpunkt der Geometrien)
+    centroid = [verfuegbarkeiten_gdf.geometry.centroid.y.mean(), verfuegbarkeiten_gdf.geometry.centroid.x.mean()]
+    zoom_start = settings["zoom"]
+    m = _base_map(centroid, zoom_start)
+
+    # Werte von Dezimalform in Prozent, Klassen 0-10%, 10-20%, ..., 90-100%
+    n_classes = settings["classes"]
+    verfuegbar = verfuegbarkeiten_gdf["Verfügbar"].to_numpy(dtype=float) * 100
+    classes = classify(verfuegbar, breaks(verfuegbar, "equal_interval", n_classes, value_range=(0, 100)))
+
+    # Umgekehrte Transparenzwerte (geringe Verfügbarkeit = hohe Transparenz), NaN = komplett durchsichtig
+    no_inquiries = classes < 0
+    fill_opacity = lookup(classes, np.arange(1, n_classes + 1) / n_classes, missing=0.0)
+
+    if grid is None and file_version(REQUESTS_PATH) is None and tile_url("verfuegbarkeiten") is not None:
+        # Statisches Raster als Vektorkacheln, Klassen wie oben im Browser berechnet (ohne Tooltip)
+        style = (
+            f"function(p) {{ var v = p['Verfügbar'], n = {n_classes}; "
+            "var opacity = v === undefined ? 0 : Math.min(Math.max(Math.ceil(v * n - 1e-9), 1), n) / n; "
+            "return {fill: true, fillColor: 'green', fillOpacity: opacity, color: 'black', weight: 0.2}; }"
+        )
+        vector_tile_layer(tile_url("verfuegbarkeiten"), "verfuegbarkeiten", style, name="Verfügbarkeiten").add_to(m)
+    elif len(verfuegbarkeiten_gdf) > settings["raster_threshold"]:
+        # Große Raster als ein Bild (ein Pixel pro Zelle) übertragen
+        grid_raster_layer(verfuegbarkeiten_gdf, fill_opacity).add_to(m)
+    else:
+        # Alle Zellen als eine FeatureCollection mit einem Tooltip
+        tooltip_text = np.where(no_inquiries, "no inquiries", np.char.mod("Verfügbarkeit: %.1f%%", verfuegbar))
+        polygon_layer(
+            verfuegbarkeiten_gdf,
+            fill_opacity,
+            label=tooltip_text,  # Hover-Beschriftung
+            fill_color='green',  # Grün als Hauptfarbe
+            color='black',  # Randfarbe der Polygone
+            weight=0.2,
+            name="Verfügbarkeiten",
+            zoom=zoom_start,
+            topology=settings["topology"]
+        ).add_to(m)
+    return m
+
+
+@memoize_by_version("coverage")
+def build_coverage_map(settings):
+    index = catchment_index()
+    if index is None:
+        return None
+    radius, stop_type = settings["radius"], settings["stop_type"]
+    zoom_start = settings["zoom"]
+    m = _base_map(_stops_center(), zoom_start)
+
+    betriebsgebiet = load_layer("betriebsgebiet")
+    area_layer(betriebsgebiet, name="Operating area", zoom=zoom_start, tiles=tile_url("betriebsgebiet")).add_to(m)
+
+    catchment = index.catchment(radius, stop_type)
+    polygon_layer(
+        catchment, [0.2], fill_color="blue", color="blue", weight=1, name=f"Catchment ({radius} m)", zoom=zoom_start
+    ).add_to(m)
+
+    # Rasterzellen nach Erreichbarkeit gegenüber den Linien von 2021, je Kategorie zu einer Fläche vereinigt
+    if index.grid is not None and len(index.grid) > settings["raster_threshold"]:
+        changes = index.changes(radius, stop_type)
+        for change, (color, rgb) in COVERAGE_COLORS.items():
+            cells = index.grid[changes == CHANGES.index(change)]
+            if not cells.empty:
+                grid_raster_layer(
+                    cells, np.full(len(cells), 0.4), fill_color=rgb, name=COVERAGE_LABELS[change]
+                ).add_to(m)
+    elif index.grid is not None:
+        areas = index.change_areas(radius, stop_type)
+        for change, (color, rgb) in COVERAGE_COLORS.items():
+            if areas[change].is_empty:
+                continue
+            polygon_layer(
+                areas[[change]],
+                [0.4],
+                label=[COVERAGE_LABELS[change]],
+                fill_color=color,
+                color="black",
+                weight=0.2,
+                name=COVERAGE_LABELS[change],
+                zoom=zoom_start,
+            ).add_to(m)
+
+    stops = index.stops if stop_type is None else index.stops[index.stops["Typ"] == stop_type]
+    point_layer(
+        stops,
+        label=stops["Haltestell"].fillna("Haltestelle").to_numpy(),
+        radius=1,
+        color=np.where(stops["Typ"] == "physisch", "green", "blue"),
+        name="Haltestellen",
+    ).add_to(m)
+
+    folium.LayerControl().add_to(m)
+    return m
+
+
+# Map key -> builder
+MAPS = {
+    "overview": build_overview_map,
+    "pickups": build_pickups_map,
+    "dropoffs": build_dropoffs_map,
+    "relations": build_relations_map,
+    "rerouting": build_rerouting_map,
+    "availability": build_availability_map,
+    "coverage": build_coverage_map,
+}
@@ -0,0 +1,167 @@
+"""Sparse origin-destination matrices between G-Mobil stops.
+
+Trips from a booking log are snapped to stops once (see ``bookings.StopIndex``)
+and kept as compact columns (origin, destination, day, weekday, hour). Stop-by-
+stop matrices for any time window, weekday or hour filter are then built with
+a vectorised mask and a ``scipy.sparse`` COO->CSR conversion, which sums
+duplicate relations. Relation lines are generated from the stop coordinates,
+so the "High Demand Route Relations" map no longer needs Wegerelationen.shp.
+"""
+from collections import namedtuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+from bookings import (
+    BOOKING_COLUMNS,
+    CHUNK_SIZE,
+    MAX_SNAP_DISTANCE,
+    TIME_COLUMN,
+    StopIndex,
+    iter_booking_chunks,
+)
+from layer_store import SharedCache, file_version, layer_version, load_layer
+
+
+Trips = namedtuple("Trips", ["origin", "destination", "day", "weekday", "hour"])
+
+_cache = SharedCache()
+
+
+def _days(value):
+    """Days since 1970-01-01 for a date, datetime or ISO string."""
+    return int(np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64))
+
+
+def load_trips(path, stops=None, columns=None, time_column=TIME_COLUMN, chunksize=CHUNK_SIZE,
+               max_distance=MAX_SNAP_DISTANCE):
+    """Read the booking log ``path`` into compact per-trip stop indices and time keys.
+
+    Trips whose origin or destination is not within ``max_distance`` of a stop,
+    or without time, are dropped.
+    """
+    stops = load_layer("haltestellen") if stops is None else stops
+    columns = {**BOOKING_COLUMNS, **(columns or {})}
+    index = StopIndex(stops, max_distance)
+
+    parts = []
+    for chunk in iter_booking_chunks(path, [*columns.values(), time_column], chunksize):
+        origin = index.snap(chunk[columns["pickup_lon"]], chunk[columns["pickup_lat"]])
+        destination = index.snap(chunk[columns["dropoff_lon"]], chunk[columns["dropoff_lat"]])
+        times = pd.to_datetime(chunk[time_column].to_numpy())
+        keep = (origin >= 0) & (destination >= 0)
+        keep &= np.asarray(times.notna())
+        times = times[keep]
+        parts.append(Trips(
+            origin[keep].astype(np.int32),
+            destination[keep].astype(np.int32),
+            times.values.astype("datetime64[D]").astype(np.int32),
+            times.weekday.to_numpy().astype(np.int8),
+            times.hour.to_numpy().astype(np.int8),
+        ))
+
+    if not parts:
+        empty = np.zeros(0, dtype=np.int32)
+        return Trips(empty, empty, empty, empty.astype(np.int8), empty.astype(np.int8))
+    return Trips(*(np.concatenate(column) for column in zip(*parts)))
+
+
+class ODMatrix:
+    """Stop-by-stop trip counts with time filters.
+
+    ``counts`` weights every entry of ``trips``, e.g. for trips already summed
+    per relation, day and hour; by default each entry is one trip.
+    """
+
+    def __init__(self, trips, n_stops, counts=None):
+        self.trips = trips
+        self.n_stops = n_stops
+        self.counts = counts
+
+    def _mask(self, start=None, end=None, weekdays=None, hours=None):
+        trips = self.trips
+        mask = np.ones(len(trips.origin), dtype=bool)
+        if start is not None:
+            mask &= trips.day >= _days(start)
+        if end is not None:
+            mask &= trips.day <= _days(end)
+        if weekdays is not None:
+            mask &= np.isin(trips.weekday, list(weekdays))
+        if hours is not None:
+            mask &= np.isin(trips.hour, list(hours))
+        return mask
+
+    def matrix(self, start=None, end=None, weekdays=None, hours=None, merge_directions=False):
+        """CSR matrix of trips from row stop to column stop.
+
+        ``start``/``end`` limit the days (inclusive), ``weekdays`` (0 = Monday)
+        and ``hours`` the time of day. With ``merge_directions`` A->B and B->A
+        are summed into the upper triangle.
+        """
+        mask = self._mask(start, end, weekdays, hours)
+        origin = self.trips.origin[mask]
+        destination = self.trips.destination[mask]
+        if merge_directions:
+            origin, destination = np.minimum(origin, destination), np.maximum(origin, destination)
+        counts = np.ones(len(origin), dtype=np.int64) if self.counts is None else self.counts[mask]
+        shape = (self.n_stops, self.n_stops)
+        return sparse.coo_matrix((counts, (origin, destination)), shape=shape).tocsr()
+
+
+def _relations(matrix, include_loops=False):
+    coo = matrix.tocoo()
+    rows, cols, values = coo.row, coo.col, coo.data
+    if not include_loops:
+        keep = rows != cols
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+    return rows, cols, values
+
+
+def top_k(matrix, k, include_loops=False):
+    """The ``k`` strongest relations as (origins, destinations, counts), descending."""
+    rows, cols, values = _relations(matrix, include_loops)
+    if k < len(values):
+        best = np.argpartition(values, -k)[-k:]
+        rows, cols, values = rows[best], cols[best], values[best]
+    order = np.argsort(-values, kind="stable")
+    return rows[order], cols[order], values[order]
+
+
+def above(matrix, min_trips, include_loops=False):
+    """All relations with more than ``min_trips`` trips, descending."""
+    rows, cols, values = _relations(matrix, include_loops)
+    keep = values > min_trips
+    order = np.argsort(-values[keep], kind="stable")
+    return rows[keep][order], cols[keep][order], values[keep][order]
+
+
+def relation_lines(origins, destinations, counts, stops=None):
+    """Straight relation lines with the columns of Wegerelationen.shp."""
+    stops = load_layer("haltestellen") if stops is None else stops
+    x = stops.geometry.x.to_numpy()
+    y = stops.geometry.y.to_numpy()
+    coords = np.stack([
+        np.column_stack([x[origins], y[origins]]),
+        np.column_stack([x[destinations], y[destinations]]),
+    ], axis=1)
+    names = stops["Haltestell"].to_numpy()
+    return gpd.GeoDataFrame(
+        {
+            "Haltestell": names[origins],
+            "Halteste_1": names[destinations],
+            "Fahrtenl_2": counts,
+        },
+        geometry=shapely.linestrings(coords) if len(coords) else [],
+        crs=stops.crs,
+    )
+
+
+def booking_od(path):
+    """ODMatrix for the booking log ``path``, shared per process and file version."""
+    def build(previous):
+        stops = load_layer("haltestellen")
+        return ODMatrix(load_trips(path, stops), len(stops))
+    return _cache.get(path, (file_version(path), layer_version("haltestellen")), build)
@@ -0,0 +1,512 @@
+"""Week-partitioned storage for the booking log, the request log and route layers.
+
+Raw logs are split by ISO calendar week (``2023-W43``) and every week is
+stored as a pre-aggregated summary, so a period is shown by adding up a few
+small partitions instead of rescanning raw rows:
+
+* ``bookings``: pickups and dropoffs per stop, trips per (origin, destination,
+  day, hour) and the finest pickup/dropoff pyramid cells,
+* ``requests``: served and rejected requests per availability grid cell,
+* ``routes``: the routed trips of a week (e.g. Routenumlegung_KW43_2.shp).
+
+``manifest.json`` lists every partition with its row count and the versions it
+was computed against. Appending a log only rewrites the weeks it contains and
+then the manifest; by default the new records are added to weeks already
+stored, with ``--replace`` those weeks are overwritten, e.g. to re-import a
+week::
+
+    python partitions.py bookings bookings_2024-W01.parquet
+    python partitions.py requests requests.csv --replace
+    python partitions.py routes Routenumlegung_KW43_2.shp --week 2023-W43
+
+Partitions live in ``GMOBIL_PARTITIONS`` (default: ``partitions`` next to the
+shapefiles). Combined periods are cached per process and manifest version.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from availability import CELL_SIZE, GRIDS, REJECTED_STATUS, REQUEST_COLUMNS, SERVED_STATUS, AvailabilityGrid
+from bookings import (
+    BOOKING_COLUMNS,
+    CHUNK_SIZE,
+    MAX_SNAP_DISTANCE,
+    TIME_COLUMN,
+    StopIndex,
+    iter_booking_chunks,
+    stop_counts_frame,
+)
+from layer_store import DATA_DIR, LAYER_COLUMNS, SharedCache, file_version, layer_version, load_layer
+from od_matrix import ODMatrix, Trips
+from pyramid import PointPyramid
+from temporal import USAGE_COLUMNS
+
+
+logger = logging.getLogger(__name__)
+
+PARTITION_DIR = os.environ.get("GMOBIL_PARTITIONS", os.path.join(DATA_DIR, "partitions"))
+MANIFEST = "manifest.json"
+
+DATASETS = ("bookings", "requests", "routes")
+
+# Combined periods kept per process
+MAX_ENTRIES = 32
+
+_combined = SharedCache(MAX_ENTRIES)
+_partitions = SharedCache()
+_write_lock = threading.Lock()
+
+
+def iso_week(label):
+    """(Monday, Sunday) of an ISO week label like ``2023-W05``."""
+    year, week = label.split("-W")
+    monday = datetime.date.fromisocalendar(int(year), int(week), 1)
+    return monday, monday + datetime.timedelta(days=6)
+
+
+def week_range(spec):
+    """Week labels for ``2023-W01:2023-W52`` or a single ``2023-W05``."""
+    first, _, last = spec.partition(":")
+    monday, _ = iso_week(first)
+    end, _ = iso_week(last or first)
+    weeks = []
+    while monday <= end:
+        year, week, _ = monday.isocalendar()
+        weeks.append(f"{year}-W{week:02d}")
+        monday += datetime.timedelta(days=7)
+    return weeks
+
+
+def week_labels(times):
+    """ISO week label per timestamp, an empty string for missing ones."""
+    times = pd.DatetimeIndex(times)
+    valid = times.notna()
+    calendar = times[valid].isocalendar()
+    codes = calendar["year"].to_numpy(dtype=np.int64) * 100 + calendar["week"].to_numpy(dtype=np.int64)
+    # Nur die wenigen verschiedenen Wochen formatieren
+    unique, inverse = np.unique(codes, return_inverse=True)
+    formatted = np.array([f"{code // 100}-W{code % 100:02d}" for code in unique], dtype=object)
+    labels = np.full(len(times), "", dtype=object)
+    labels[np.asarray(valid)] = formatted[inverse.ravel()]
+    return labels
+
+
+def previous_year(labels):
+    """The same calendar weeks one year earlier (week 53 only if that year has one)."""
+    shifted = []
+    for label in labels:
+        year, week = label.split("-W")
+        try:
+            datetime.date.fromisocalendar(int(year) - 1, int(week), 1)
+        except ValueError:
+            continue
+        shifted.append(f"{int(year) - 1}-W{week}")
+    return shifted
+
+
+def _manifest_path(directory):
+    return os.path.join(directory, MANIFEST)
+
+
+def read_manifest(directory=PARTITION_DIR):
+    try:
+        with open(_manifest_path(directory), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def partition_version(directory=PARTITION_DIR):
+    """Content hash of the manifest, None without partitions."""
+    return file_version(_manifest_path(directory))
+
+
+def weeks(dataset, directory=PARTITION_DIR):
+    """Sorted week labels stored for ``dataset``."""
+    return sorted(read_manifest(directory).get(dataset, {}))
+
+
+def period_weeks(dataset, period, directory=PARTITION_DIR):
+    """Stored weeks of ``dataset`` within ``period`` (first, last label), inclusive.
+
+    None if no period is given or the dataset has no partitions, i.e. the
+    unpartitioned sources apply.
+    """
+    labels = weeks(dataset, directory)
+    if period is None or not labels:
+        return None
+    first, last = period
+    return [label for label in labels if first <= label <= last]
+
+
+def period_totals(dataset, labels, directory=PARTITION_DIR):
+    """Summed manifest counts (``rows``, for requests also ``served``) of the weeks ``labels``."""
+    entries = read_manifest(directory).get(dataset, {})
+    totals = {}
+    for label in labels:
+        for name, value in entries.get(label, {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def _relative_path(dataset, label, extension):
+    return f"{dataset}/{label}{extension}"
+
+
+def _write_partitions(dataset, written, directory):
+    """Store new partition files and their manifest entries; ``written``: label -> (data, entry)."""
+    extension = ".feather" if dataset == "routes" else ".npz"
+    with _write_lock:
+        os.makedirs(os.path.join(directory, dataset), exist_ok=True)
+        manifest = read_manifest(directory)
+        for label, (data, entry) in written.items():
+            relative = _relative_path(dataset, label, extension)
+            path = os.path.join(directory, relative)
+            tmp_path = f"{path}.{os.getpid()}.tmp{extension}"
+            if dataset == "routes":
+                data.to_feather(tmp_path, compression="uncompressed")
+            else:
+                np.savez(tmp_path, **data)
+            os.replace(tmp_path, path)
+            manifest.setdefault(dataset, {})[label] = {
+                **entry, "file": relative, "written": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+
+        manifest[dataset] = dict(sorted(manifest[dataset].items()))
+        tmp_path = _manifest_path(directory) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, _manifest_path(directory))
+
+
+def load_partition(dataset, label, directory=PARTITION_DIR):
+    """Arrays (or for routes the GeoDataFrame) of one partition, cached per file version."""
+    entry = read_manifest(directory).get(dataset, {}).get(label)
+    if entry is None:
+        return None
+    path = os.path.join(directory, entry["file"])
+
+    def build(previous):
+        if dataset == "routes":
+            return gpd.read_feather(path)
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+    return _partitions.get(path, file_version(path), build)
+
+
+def _group_sum(keys, values):
+    """Sum ``values`` (dict of arrays) over equal rows of ``keys`` (dict of arrays)."""
+    frame = pd.DataFrame({**keys, **values})
+    if frame.empty:
+        return {name: column.to_numpy() for name, column in frame.items()}
+    grouped = frame.groupby(list(keys), sort=True, as_index=False)[list(values)].sum()
+    return {name: grouped[name].to_numpy(dtype=frame[name].dtype) for name in frame}
+
+
+class _BookingWeek:
+    """Summary of the bookings of one week while a log is read."""
+
+    def __init__(self, n_stops):
+        self.rows = 0
+        self.pickups = np.zeros(n_stops, dtype=np.int64)
+        self.dropoffs = np.zeros(n_stops, dtype=np.int64)
+        self.trips = []
+        self.pyramids = {"pickup": PointPyramid(), "dropoff": PointPyramid()}
+
+    def add(self, chunk, columns, origin, destination, times):
+        self.rows += len(chunk)
+        self.pickups += np.bincount(origin[origin >= 0], minlength=len(self.pickups))
+        self.dropoffs += np.bincount(destination[destination >= 0], minlength=len(self.dropoffs))
+        keep = (origin >= 0) & (destination >= 0)
+        self.trips.append(_group_sum(
+            {
+                "origin": origin[keep].astype(np.int32),
+                "destination": destination[keep].astype(np.int32),
+                "day": times[keep].values.astype("datetime64[D]").astype(np.int32),
+                "hour": times[keep].hour.to_numpy().astype(np.int8),
+            },
+            {"count": np.ones(keep.sum(), dtype=np.int64)},
+        ))
+        for kind, pyramid in self.pyramids.items():
+            pyramid.add(chunk[columns[f"{kind}_lon"]], chunk[columns[f"{kind}_lat"]])
+
+    def arrays(self):
+        data = {"pickups": self.pickups, "dropoffs": self.dropoffs}
+        trips = {name: np.concatenate([part[name] for part in self.trips]) for name in self.trips[0]}
+        keys = ("origin", "destination", "day", "hour")
+        data.update(_group_sum({k: trips[k] for k in keys}, {"count": trips["count"]}))
+        for kind, pyramid in self.pyramids.items():
+            for name, values in zip(("keys", "count", "sum_x", "sum_y"), pyramid.cells()):
+                data[f"{kind}_{name}"] = values
+        return data
+
+
+def _merge_bookings(old, new):
+    data = {"pickups": old["pickups"] + new["pickups"], "dropoffs": old["dropoffs"] + new["dropoffs"]}
+    keys = ("origin", "destination", "day", "hour")
+    data.update(_group_sum(
+        {k: np.concatenate([old[k], new[k]]) for k in keys}, {"count": np.concatenate([old["count"], new["count"]])}
+    ))
+    for kind in ("pickup", "dropoff"):
+        pyramid = PointPyramid()
+        for part in (old, new):
+            pyramid.add_cells(*(part[f"{kind}_{name}"] for name in ("keys", "count", "sum_x", "sum_y")))
+        for name, values in zip(("keys", "count", "sum_x", "sum_y"), pyramid.cells()):
+            data[f"{kind}_{name}"] = values
+    return data
+
+
+def _skip_missing_times(path, skipped):
+    if skipped:
+        logger.warning("%s: %d records without time skipped", path, skipped)
+
+
+def append_bookings(path, directory=PARTITION_DIR, columns=None, time_column=TIME_COLUMN,
+                    chunksize=CHUNK_SIZE, max_distance=MAX_SNAP_DISTANCE, replace=False):
+    """Add the weeks of the booking log ``path`` to the partitions; returns {week: bookings}.
+
+    Weeks already stored are merged with the new records; a week stored for
+    another stops layer raises ValueError. With ``replace`` stored weeks are
+    overwritten instead. Records without time are skipped.
+    """
+    stops = load_layer("haltestellen")
+    stops_version = layer_version("haltestellen")
+    columns = {**BOOKING_COLUMNS, **(columns or {})}
+    index = StopIndex(stops, max_distance)
+
+    summaries = {}
+    skipped = 0
+    for chunk in iter_booking_chunks(path, [*columns.values(), time_column], chunksize):
+        times = pd.DatetimeIndex(pd.to_datetime(chunk[time_column]))
+        origin = index.snap(chunk[columns["pickup_lon"]], chunk[columns["pickup_lat"]])
+        destination = index.snap(chunk[columns["dropoff_lon"]], chunk[columns["dropoff_lat"]])
+        labels = week_labels(times)
+        skipped += int((labels == "").sum())
+        for label in np.unique(labels[labels != ""]):
+            pick = labels == label
+            summaries.setdefault(label, _BookingWeek(len(stops))).add(
+                chunk[pick], columns, origin[pick], destination[pick], times[pick]
+            )
+
+    _skip_missing_times(path, skipped)
+
+    existing = read_manifest(directory).get("bookings", {})
+    written = {}
+    for label, summary in summaries.items():
+        data, rows = summary.arrays(), summary.rows
+        old = None if replace else existing.get(label)
+        if old is not None and old["stops"] != stops_version:
+            raise ValueError(f"bookings {label}: stored for other stops, cannot merge (use --replace)")
+        if old is not None:
+            data = _merge_bookings(load_partition("bookings", label, directory), data)
+            rows += old["rows"]
+        written[label] = (data, {"rows": rows, "stops": stops_version})
+    _write_partitions("bookings", written, directory)
+    return {label: entry["rows"] for label, (_, entry) in written.items()}
+
+
+def append_requests(path, directory=PARTITION_DIR, shape="hex", size=CELL_SIZE, columns=None,
+                    time_column=USAGE_COLUMNS["time"], chunksize=CHUNK_SIZE, replace=False):
+    """Add the weeks of the request log ``path`` to the availability partitions; returns {week: requests}.
+
+    Weeks already stored are merged with the new records; a week stored on
+    another grid raises ValueError. With ``replace`` stored weeks are
+    overwritten instead. Records without time are skipped.
+    """
+    grid = AvailabilityGrid(load_layer("betriebsgebiet"), GRIDS[shape](size))
+    columns = {**REQUEST_COLUMNS, **(columns or {})}
+
+    counts = {}
+    skipped = 0
+    for chunk in iter_booking_chunks(path, [*columns.values(), time_column], chunksize):
+        labels = week_labels(pd.to_datetime(chunk[time_column]))
+        cells = grid.cell_index(chunk[columns["lon"]], chunk[columns["lat"]])
+        status = chunk[columns["status"]].to_numpy()
+        skipped += int((labels == "").sum())
+        for label in np.unique(labels[labels != ""]):
+            pick = labels == label
+            week = counts.setdefault(label, {
+                "rows": 0,
+                "served": np.zeros(len(grid.rows), dtype=np.int64),
+                "rejected": np.zeros(len(grid.rows), dtype=np.int64),
+            })
+            week["rows"] += int(pick.sum())
+            pick &= cells >= 0
+            week["served"] += np.bincount(cells[pick & (status == SERVED_STATUS)], minlength=len(grid.rows))
+            week["rejected"] += np.bincount(cells[pick & (status == REJECTED_STATUS)], minlength=len(grid.rows))
+    _skip_missing_times(path, skipped)
+
+    existing = read_manifest(directory).get("requests", {})
+    written = {}
+    for label, week in counts.items():
+        # Zellen über Zeile/Spalte speichern, unabhängig vom Zuschnitt auf das Betriebsgebiet
+        cells = np.flatnonzero(week["served"] + week["rejected"])
+        data = {
+            "row": grid.rows[cells], "col": grid.cols[cells],
+            "served": week["served"][cells], "rejected": week["rejected"][cells],
+        }
+        entry = {
+            "rows": week["rows"], "served": int(week["served"].sum()), "rejected": int(week["rejected"].sum()),
+            "grid": [shape, size],
+        }
+        old = None if replace else existing.get(label)
+        if old is not None and old["grid"] != entry["grid"]:
+            raise ValueError(f"requests {label}: stored on another grid, cannot merge (use --replace)")
+        if old is not None:
+            previous = load_partition("requests", label, directory)
+            data = _group_sum(
+                {k: np.concatenate([previous[k], data[k]]) for k in ("row", "col")},
+                {k: np.concatenate([previous[k], data[k]]) for k in ("served", "rejected")},
+            )
+            for name in ("rows", "served", "rejected"):
+                entry[name] += old[name]
+        written[label] = (data, entry)
+    _write_partitions("requests", written, directory)
+    return {label: entry["rows"] for label, (_, entry) in written.items()}
+
+
+def add_routes(path, label, directory=PARTITION_DIR):
+    """Store the routed trips in ``path`` (e.g. a Routenumlegung shapefile) as week ``label``."""
+    iso_week(label)  # Bezeichnung prüfen
+    gdf = gpd.read_file(path).to_crs(epsg=4326)
+    gdf = gdf[[c for c in LAYER_COLUMNS["routenumlegung"] if c in gdf.columns] + ["geometry"]]
+    _write_partitions("routes", {label: (gdf, {"rows": len(gdf), "source": os.path.basename(path)})}, directory)
+    return len(gdf)
+
+
+def _memoized(name, labels, args, compute):
+    """Combined result of the partitions ``labels``, cached per manifest version."""
+    return _combined.memoize((name, tuple(labels), args, partition_version()), compute)
+
+
+def _booking_partitions(labels):
+    """Booking partitions of ``labels`` computed for the current stops; others are skipped."""
+    entries = read_manifest().get("bookings", {})
+    stops_version = layer_version("haltestellen")
+    parts = []
+    for label in labels:
+        if entries[label]["stops"] != stops_version:
+            logger.warning("bookings %s: computed for other stops, skipped (re-import the week)", label)
+            continue
+        parts.append(load_partition("bookings", label))
+    return parts
+
+
+def period_stop_counts(labels):
+    """Pickups and dropoffs per stop in the weeks ``labels`` (columns of G-Mobil_Ein-undAusstiege.shp)."""
+    def compute():
+        stops = load_layer("haltestellen")
+        pickups = np.zeros(len(stops), dtype=np.int64)
+        dropoffs = np.zeros(len(stops), dtype=np.int64)
+        for part in _booking_partitions(labels):
+            pickups += part["pickups"]
+            dropoffs += part["dropoffs"]
+        return stop_counts_frame(stops, pickups, dropoffs)
+    return _memoized("stop_counts", labels, None, compute)
+
+
+def period_od(labels):
+    """ODMatrix of the trips in the weeks ``labels``."""
+    def compute():
+        parts = _booking_partitions(labels)
+        column = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.zeros(0, dtype=np.int32)
+            for name in ("origin", "destination", "day", "hour", "count")
+        }
+        # 1970-01-01 war ein Donnerstag
+        weekday = ((column["day"] + 3) % 7).astype(np.int8)
+        trips = Trips(column["origin"], column["destination"], column["day"], weekday, column["hour"])
+        return ODMatrix(trips, len(load_layer("haltestellen")), counts=column["count"].astype(np.int64))
+    return _memoized("od", labels, None, compute)
+
+
+def period_pyramid(labels, kind="pickup"):
+    """PointPyramid of the pickup or dropoff positions in the weeks ``labels``."""
+    def compute():
+        pyramid = PointPyramid()
+        for label in labels:
+            part = load_partition("bookings", label)
+            pyramid.add_cells(*(part[f"{kind}_{name}"] for name in ("keys", "count", "sum_x", "sum_y")))
+        return pyramid
+    return _memoized("pyramid", labels, kind, compute)
+
+
+def period_grid(labels, shape="hex", size=CELL_SIZE):
+    """AvailabilityGrid of the requests in the weeks ``labels``.
+
+    None if a week was stored for another grid shape or cell size.
+    """
+    entries = read_manifest().get("requests", {})
+    if any(entries[label]["grid"] != [shape, size] for label in labels):
+        return None
+
+    def compute():
+        grid = AvailabilityGrid(load_layer("betriebsgebiet"), GRIDS[shape](size))
+        for label in labels:
+            part = load_partition("requests", label)
+            grid.add_cells(part["row"], part["col"], part["served"], part["rejected"])
+        return grid
+    return _memoized("grid", labels, (shape, size, layer_version("betriebsgebiet")), compute)
+
+
+def period_routes(labels):
+    """Routed trips of the weeks ``labels`` (columns of the Routenumlegung layer)."""
+    def compute():
+        frames = [load_partition("routes", label) for label in labels]
+        if not frames:
+            return gpd.GeoDataFrame(columns=LAYER_COLUMNS["routenumlegung"], geometry=[], crs="EPSG:4326")
+        return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+    return _memoized("routes", labels, None, compute)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add weekly partitions for the G-Mobil dashboard.")
+    parser.add_argument("--dir", default=PARTITION_DIR, help="partition directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("bookings", "requests"):
+        command = commands.add_parser(name, help=f"split a {name[:-1]} log into weekly partitions")
+        command.add_argument("log", help="CSV or Parquet log")
+        command.add_argument(
+            "--replace", action="store_true", help="overwrite stored weeks instead of adding the new records to them"
+        )
+        command.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    commands.choices["requests"].add_argument("--shape", choices=sorted(GRIDS), default="hex")
+    commands.choices["requests"].add_argument("--cell-size", type=float, default=CELL_SIZE)
+    routes_parser = commands.add_parser("routes", help="store a routed-trips shapefile as one week")
+    routes_parser.add_argument("shapefile")
+    routes_parser.add_argument("--week", required=True, help="ISO week, e.g. 2023-W43")
+    commands.add_parser("list", help="show the stored partitions")
+    args = parser.parse_args()
+
+    if args.command == "bookings":
+        try:
+            result = append_bookings(args.log, args.dir, chunksize=args.chunksize, replace=args.replace)
+        except ValueError as error:
+            parser.error(str(error))
+    elif args.command == "requests":
+        try:
+            result = append_requests(
+                args.log, args.dir, args.shape, args.cell_size, chunksize=args.chunksize,
+                replace=args.replace,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+    elif args.command == "routes":
+        result = {args.week: add_routes(args.shapefile, args.week, args.dir)}
+    else:
+        manifest = read_manifest(args.dir)
+        result = {
+            f"{dataset} {label}": entry["rows"]
+            for dataset in DATASETS for label, entry in manifest.get(dataset, {}).items()
+        }
+    for label, rows in sorted(result.items()):
+        print(f"{label}: {rows} rows")
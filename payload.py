@@ -0,0 +1,90 @@
+"""Payload reduction stage shared by all map builders.
+
+Every layer is inlined into the HTML that reaches the browser, so geometries
+are simplified for the zoom level they are shown at (topology-preserving) and
+their coordinates are rounded to a fixed number of decimals before they are
+serialised. The simplification is done once per layer, so it is done for the
+highest zoom users inspect (``DETAIL_ZOOM``, street level) rather than the
+initial zoom: zooming in by n levels magnifies the error by 2**n, and a
+tolerance for zoom 12 would be off by about 15 m at zoom 16. Polygon layers can
+optionally be encoded as TopoJSON with shared arcs (``"topology"`` setting of
+the availability map), which needs the optional ``topojson`` package.
+
+The GeoJSON size before and after the reduction is logged and kept per layer
+in ``payload_reports``.
+"""
+import logging
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+from instrumentation import note
+
+try:
+    import topojson
+except ImportError:  # optional, only needed for topology=True
+    topojson = None
+
+
+logger = logging.getLogger(__name__)
+
+# Decimal places kept for WGS84 coordinates (5 decimals ~ 1 m)
+COORDINATE_PRECISION = 5
+
+# Simplification tolerance in screen pixels at the displayed zoom level
+SIMPLIFY_PIXELS = 0.5
+
+# Geometries are simplified for at least this zoom level (about 2 m per pixel)
+DETAIL_ZOOM = 16
+
+PayloadReport = namedtuple("PayloadReport", ["features", "bytes_before", "bytes_after"])
+
+# Layer name -> PayloadReport of the last reduction
+payload_reports = {}
+
+
+def zoom_tolerance(zoom, pixels=SIMPLIFY_PIXELS):
+    """Degrees covered by ``pixels`` screen pixels at web-mercator ``zoom``."""
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+
+def _geojson_bytes(geoms):
+    return int(sum(len(s) for s in shapely.to_geojson(geoms) if s is not None))
+
+
+def reduce_geometries(geoms, zoom=None, precision=COORDINATE_PRECISION, name=None):
+    """Simplify ``geoms`` for ``zoom`` and round their coordinates to ``precision`` decimals.
+
+    The tolerance is that of ``zoom`` or ``DETAIL_ZOOM``, whichever is higher,
+    so the result stays within ``SIMPLIFY_PIXELS`` up to street level.
+    ``zoom=None`` skips the simplification, ``precision=None`` the rounding.
+    With a ``name`` the sizes before and after are recorded in ``payload_reports``.
+    """
+    geoms = np.asarray(geoms)
+    reduced = geoms
+    if zoom is not None:
+        reduced = shapely.simplify(reduced, zoom_tolerance(max(zoom, DETAIL_ZOOM)), preserve_topology=True)
+    if precision is not None:
+        reduced = shapely.transform(reduced, lambda coords: np.round(coords, precision))
+
+    if name is not None:
+        report = PayloadReport(len(geoms), _geojson_bytes(geoms), _geojson_bytes(reduced))
+        payload_reports[name] = report
+        logger.info("payload %s: %d features, %d -> %d bytes", name, *report)
+        note(geojson_bytes=report.bytes_after, features=report.features)
+    else:
+        note(features=len(geoms))
+    return reduced
+
+
+def to_topology(gdf, precision=COORDINATE_PRECISION):
+    """Encode ``gdf`` as TopoJSON dict with shared arcs (object name ``data``).
+
+    Returns None when the ``topojson`` package is not installed.
+    """
+    if topojson is None:
+        logger.warning("topojson is not installed, falling back to GeoJSON")
+        return None
+    quantization = 10 ** precision if precision is not None else False
+    return topojson.Topology(gdf, prequantize=quantization).to_dict()
@@ -0,0 +1,124 @@
+"""Zoom-level aggregation pyramid for dense point data.
+
+Points are binned into square cells of ``CELL_PIXELS`` screen pixels in Web
+Mercator tile space at ``MAX_ZOOM``. Every coarser level is derived from the
+finest one by halving the integer cell indices (a quadtree), so each level
+holds pre-summed counts and the count-weighted centre of its cells. The number
+of cells per level is bounded by the area covered, not by the number of
+points, which keeps the browser cost of a map constant at any data volume.
+
+Points can be added in chunks; only the finest level is kept while adding.
+Pyramids of several periods are combined by adding their finest cells.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from bookings import BOOKING_COLUMNS, CHUNK_SIZE, iter_booking_chunks
+from layer_store import SharedCache, file_version
+
+
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+
+# Cell edge length in screen pixels at every zoom level
+CELL_PIXELS = 64
+
+Level = namedtuple("Level", ["zoom", "lon", "lat", "count"])
+
+_cache = SharedCache()
+
+
+def _pixels(lon, lat, zoom):
+    """Web Mercator pixel coordinates at ``zoom`` (256 px tiles)."""
+    scale = 256 * 2.0 ** zoom
+    lat = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = (np.asarray(lon) + 180) / 360 * scale
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale
+    return x, y
+
+
+def _lon_lat(x, y, zoom):
+    scale = 256 * 2.0 ** zoom
+    lon = x / scale * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / scale))))
+    return lon, lat
+
+
+def _reduce(keys, count, sum_x, sum_y):
+    """Sum points that share a cell key."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return (
+        keys,
+        np.bincount(inverse, count, len(keys)),
+        np.bincount(inverse, sum_x, len(keys)),
+        np.bincount(inverse, sum_y, len(keys)),
+    )
+
+
+class PointPyramid:
+    """Point counts per cell for every zoom level from ``min_zoom`` to ``max_zoom``."""
+
+    def __init__(self, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, cell_pixels=CELL_PIXELS):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cell_pixels = cell_pixels
+        # Feinste Ebene: Zellschlüssel, Anzahl, Summe der Pixelkoordinaten
+        empty = np.zeros(0)
+        self._finest = (np.zeros(0, dtype=np.int64), empty, empty, empty)
+        self._levels = {}
+
+    def add(self, lon, lat, weights=None):
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        weights = np.ones(valid.sum()) if weights is None else np.asarray(weights, dtype=float)[valid]
+        x, y = _pixels(lon[valid], lat[valid], self.max_zoom)
+
+        ix = (x // self.cell_pixels).astype(np.int64)
+        iy = (y // self.cell_pixels).astype(np.int64)
+        self.add_cells(*_reduce((ix << 32) | iy, weights, x * weights, y * weights))
+
+    def cells(self):
+        """The finest level as (cell keys, counts, sums of the x and y pixel coordinates)."""
+        return self._finest
+
+    def add_cells(self, keys, count, sum_x, sum_y):
+        """Add finest-level cells, e.g. ``cells()`` of a pyramid with the same zoom range."""
+        self._finest = _reduce(*(np.concatenate(parts) for parts in zip(self._finest, (keys, count, sum_x, sum_y))))
+        self._levels.clear()
+
+    def level(self, zoom):
+        """Aggregated cells for map zoom ``zoom`` (clamped to the pyramid's range)."""
+        zoom = int(min(max(round(zoom), self.min_zoom), self.max_zoom))
+        level = self._levels.get(zoom)
+        if level is None:
+            keys, count, sum_x, sum_y = self._finest
+            shift = self.max_zoom - zoom
+            # Zellindizes halbieren je Ebene (Quadtree)
+            keys = ((keys >> 32) >> shift << 32) | ((keys & 0xFFFFFFFF) >> shift)
+            keys, count, sum_x, sum_y = _reduce(keys, count, sum_x, sum_y)
+            lon, lat = _lon_lat(sum_x / count, sum_y / count, self.max_zoom)
+            level = Level(zoom, lon, lat, count)
+            self._levels[zoom] = level
+        return level
+
+    def levels(self):
+        return [self.level(zoom) for zoom in range(self.min_zoom, self.max_zoom + 1)]
+
+    @property
+    def total(self):
+        return self._finest[1].sum()
+
+
+def booking_pyramid(path, kind="pickup", columns=None, chunksize=CHUNK_SIZE):
+    """PointPyramid of the pickup or dropoff positions in the booking log ``path``, shared per process."""
+    columns = {**BOOKING_COLUMNS, **(columns or {})}
+    lon_column, lat_column = columns[f"{kind}_lon"], columns[f"{kind}_lat"]
+
+    def build(previous):
+        pyramid = PointPyramid()
+        for chunk in iter_booking_chunks(path, [lon_column, lat_column], chunksize):
+            pyramid.add(chunk[lon_column], chunk[lat_column])
+        return pyramid
+    return _cache.get((path, kind), file_version(path), build)
@@ -0,0 +1,141 @@
+"""Overlap counts for routed trips.
+
+All routes are cut into their vertex-to-vertex segments in a metric CRS.
+Routes along the same road rarely share all their vertices, so every segment
+is first split at the vertices of other routes within ``SNAP_TOLERANCE``
+metres of it (one STRtree ``dwithin`` query), and vertices closer than the
+tolerance are merged. Each of the resulting pieces gets a
+direction-independent key from its end points, so routes that follow the same
+road within the tolerance produce the same keys. Counting distinct routes per
+key with ``np.unique`` replaces pairwise geometry intersection: the cost is a
+sort over all segments, i.e. O(n log n) in the number of vertices instead of
+quadratic in the number of routes.
+
+Recompute the overlaps for another week's routes with::
+
+    python route_overlap.py Routenumlegung_KW44.shp -o Routenumlegung_KW44_overlap.shp
+"""
+import argparse
+from collections import namedtuple
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+from layer_store import METRIC_CRS
+
+
+# Distance (metres) within which routes count as using the same road
+SNAP_TOLERANCE = 2.0
+
+OVERLAP_COLUMN = "Anzahl_Üb"
+
+RouteOverlaps = namedtuple("RouteOverlaps", ["segments", "route_counts"])
+
+
+def _segments(gdf):
+    """Segment start and end points (metric) and the route index of every segment."""
+    geoms = np.asarray(gdf.to_crs(METRIC_CRS).geometry.values)
+    parts, route_index = shapely.get_parts(geoms, return_index=True)
+    coords, part_index = shapely.get_coordinates(parts, return_index=True)
+
+    # Aufeinanderfolgende Stützpunkte desselben Linienteils bilden ein Segment
+    same_part = part_index[:-1] == part_index[1:]
+    start = coords[:-1][same_part]
+    end = coords[1:][same_part]
+    routes = route_index[part_index[:-1][same_part]]
+    keep = (start != end).any(axis=1)
+    return start[keep], end[keep], routes[keep]
+
+
+def _split(start, end, routes, tolerance):
+    """Cut the segments at all vertices within ``tolerance`` of their interior.
+
+    The cut points are the vertices themselves, so a route running along another
+    route's segment shares its end points with the pieces of that segment.
+    """
+    vertices = np.unique(np.concatenate([start, end]), axis=0)
+    tree = shapely.STRtree(shapely.linestrings(np.stack([start, end], axis=1)))
+    vertex, segment = tree.query(shapely.points(vertices), predicate="dwithin", distance=tolerance)
+
+    # Lage des Lotfußpunkts auf dem Segment; Schnitte nahe den Endpunkten übernimmt das Zusammenführen
+    direction = end[segment] - start[segment]
+    length = np.hypot(*direction.T)
+    along = np.einsum("ij,ij->i", vertices[vertex] - start[segment], direction) / length
+    interior = (along > tolerance) & (along < length - tolerance)
+    vertex, segment, along = vertex[interior], segment[interior], along[interior]
+
+    # Je Segment: Anfang, Schnittpunkte nach Lage sortiert, Ende
+    n = len(start)
+    seg = np.concatenate([np.arange(n), segment, np.arange(n)])
+    position = np.concatenate([np.full(n, -np.inf), along, np.full(n, np.inf)])
+    points = np.concatenate([start, vertices[vertex], end])
+    order = np.lexsort([position, seg])
+    seg, points = seg[order], points[order]
+    piece = seg[:-1] == seg[1:]
+    return points[:-1][piece], points[1:][piece], routes[seg[:-1][piece]]
+
+
+def _merge_points(points, tolerance):
+    """Id per point; points within ``tolerance`` of a point with a lower id take that id."""
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    canonical = np.arange(len(unique))
+    pairs = cKDTree(unique).query_pairs(tolerance, output_type="ndarray")
+    # Nur eine Stufe, damit dicht digitalisierte Kurven nicht zu einem Punkt verschmelzen
+    np.minimum.at(canonical, pairs[:, 1], pairs[:, 0])
+    return canonical[inverse.ravel()], unique
+
+
+def route_overlaps(gdf, tolerance=SNAP_TOLERANCE):
+    """Number of distinct routes per road segment and per route.
+
+    Returns ``segments``, a GeoDataFrame (EPSG:4326) with one line per distinct
+    segment and the number of routes using it in ``Anzahl_Üb``, and
+    ``route_counts``, the highest segment count along each route of ``gdf``.
+    Routes count as overlapping where they run within ``tolerance`` metres of
+    each other.
+    """
+    start, end, routes = _segments(gdf)
+    if not len(start):
+        segments = gpd.GeoDataFrame({OVERLAP_COLUMN: np.zeros(0, dtype=np.int64)}, geometry=[], crs="EPSG:4326")
+        return RouteOverlaps(segments, np.zeros(len(gdf), dtype=np.int64))
+
+    start, end, routes = _split(start, end, routes, tolerance)
+    point_id, points = _merge_points(np.concatenate([start, end]), tolerance)
+    a, b = np.split(point_id, 2)
+    keep = a != b
+    a, b, routes = a[keep], b[keep], routes[keep]
+
+    # Richtungsunabhängiger Schlüssel je Segment
+    keys = np.minimum(a, b) * len(points) + np.maximum(a, b)
+    unique_keys, first_seen, segment_id = np.unique(keys, return_index=True, return_inverse=True)
+
+    # Jede Route zählt pro Segment nur einmal
+    pairs = np.unique(segment_id * len(gdf) + routes)
+    pair_segment, pair_route = np.divmod(pairs, len(gdf))
+    counts = np.bincount(pair_segment, minlength=len(unique_keys))
+
+    route_counts = np.zeros(len(gdf), dtype=np.int64)
+    np.maximum.at(route_counts, pair_route, counts[pair_segment])
+
+    lines = shapely.linestrings(np.stack([points[a[first_seen]], points[b[first_seen]]], axis=1))
+    segments = gpd.GeoDataFrame({OVERLAP_COLUMN: counts}, geometry=lines, crs=METRIC_CRS).to_crs(epsg=4326)
+    return RouteOverlaps(segments, route_counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute route overlap counts for routed trips.")
+    parser.add_argument("routes", help="line layer with one routed trip per row")
+    parser.add_argument("-o", "--output", required=True, help="routes with recomputed Anzahl_Üb")
+    parser.add_argument("--segments", help="optional output with one line per road segment")
+    parser.add_argument("--tolerance", type=float, default=SNAP_TOLERANCE, help="overlap tolerance in metres")
+    args = parser.parse_args()
+
+    routes = gpd.read_file(args.routes)
+    overlaps = route_overlaps(routes, args.tolerance)
+    routes[OVERLAP_COLUMN] = overlaps.route_counts
+    routes.to_file(args.output, encoding="utf-8")
+    if args.segments:
+        overlaps.segments.to_file(args.segments, encoding="utf-8")
+    print(f"{len(routes)} routes, {len(overlaps.segments)} segments, max overlap {overlaps.route_counts.max()}")
@@ -0,0 +1,190 @@
+"""Temporal and per-user charts computed from the request log.
+
+Requests are counted per day and hour with ``np.bincount`` into a (days x 24)
+array and per user with a grouped count; both are kept per process and updated
+incrementally when new days are appended to the log. The weekday x hour
+heatmaps (average requests and executed rides per day) and the usage
+disparity plot are Altair charts built from these aggregates, so the
+dashboard no longer needs the exported PNGs when a request log is configured.
+The usage plot bins users by requests and rides on logarithmic bins, so its
+size does not grow with the number of users.
+"""
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from availability import REQUESTS_PATH, SERVED_STATUS
+from bookings import CHUNK_SIZE, iter_appended_chunks, log_rewritten
+from layer_store import SharedCache, file_version
+
+
+# Column names in the request log
+USAGE_COLUMNS = {
+    "time": "requested_at",
+    "user": "user_id",
+    "status": "status",
+}
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Hours shown in the heatmaps (service hours)
+HOURS = range(5, 24)
+
+# Maximum number of bins per axis of the usage plot
+USAGE_BINS = 60
+
+# Pre-rendered figures shown while no request log is configured
+CHART_IMAGES = {
+    "temporal": "heatmap_diagrams_ppt.png",
+    "usage": "Nutzungsverteilung_Poster.png",
+}
+
+_cache = SharedCache()
+
+
+class UsageAggregates:
+    """Requests and executed rides per day and hour, and per user."""
+
+    def __init__(self):
+        self.first_day = None
+        self.requests = np.zeros((0, 24), dtype=np.int64)
+        self.rides = np.zeros((0, 24), dtype=np.int64)
+        self.users = pd.DataFrame({"requests": [], "rides": []}, dtype=np.int64)
+        # Log path -> (read position, file size), see iter_appended_chunks
+        self.sources = {}
+
+    def _extend(self, first, last):
+        """Grow the day arrays to cover ``first`` .. ``last`` (days since 1970-01-01)."""
+        if self.first_day is None:
+            self.first_day = first
+        before = max(self.first_day - first, 0)
+        after = max(last - (self.first_day + len(self.requests) - 1), 0)
+        if before or after:
+            pad = ((before, after), (0, 0))
+            self.requests = np.pad(self.requests, pad)
+            self.rides = np.pad(self.rides, pad)
+            self.first_day -= before
+
+    def add(self, times, users, status):
+        times = pd.to_datetime(np.asarray(times))
+        valid = ~times.isna()
+        times = times[valid]
+        served = np.asarray(status)[valid] == SERVED_STATUS
+        if not len(times):
+            return
+
+        days = times.values.astype("datetime64[D]").astype(np.int64)
+        self._extend(days.min(), days.max())
+        cells = (days - self.first_day) * 24 + times.hour.to_numpy()
+        size = self.requests.size
+        self.requests += np.bincount(cells, minlength=size).reshape(self.requests.shape)
+        self.rides += np.bincount(cells[served], minlength=size).reshape(self.rides.shape)
+
+        # Anfragen und Fahrten je Nutzer aufsummieren
+        per_user = pd.DataFrame({"user": np.asarray(users)[valid], "rides": served.astype(np.int64)})
+        per_user = per_user.groupby("user")["rides"].agg(requests="size", rides="sum")
+        self.users = self.users.add(per_user, fill_value=0).astype(np.int64)
+
+    def update(self, path, columns=None, chunksize=CHUNK_SIZE):
+        """Count the records of ``path`` not read before (append-only logs)."""
+        columns = {**USAGE_COLUMNS, **(columns or {})}
+        for chunk in iter_appended_chunks(self.sources, path, columns.values(), chunksize):
+            self.add(chunk[columns["time"]], chunk[columns["user"]], chunk[columns["status"]])
+
+    def weekday_hour(self, counts):
+        """Average ``counts`` per weekday (0 = Monday) and hour over all days covered."""
+        weekday = (self.first_day + np.arange(len(counts)) + 3) % 7  # 1970-01-01 war ein Donnerstag
+        days_per_weekday = np.bincount(weekday, minlength=7)
+        totals = np.zeros((7, 24))
+        np.add.at(totals, weekday, counts)
+        return totals / np.maximum(days_per_weekday, 1)[:, None]
+
+
+def usage_aggregates(path):
+    """UsageAggregates for the request log ``path``, shared per process."""
+    def build(previous):
+        aggregates = previous[1] if previous is not None else None
+        # Neu aufbauen, wenn die Datei nicht nur angehängt wurde
+        if aggregates is None or log_rewritten(aggregates.sources, path):
+            aggregates = UsageAggregates()
+        aggregates.update(path)
+        return aggregates
+    return _cache.get(path, file_version(path), build)
+
+
+def _heatmap(averages, title, scheme):
+    hours = list(HOURS)
+    frame = pd.DataFrame({
+        "Weekday": np.repeat(WEEKDAYS, len(hours)),
+        "Hour": np.tile(hours, 7),
+        "Average": averages[:, hours].ravel(),
+    })
+    base = alt.Chart(frame, title=title).encode(
+        x=alt.X("Hour:O"),
+        y=alt.Y("Weekday:N", sort=WEEKDAYS),
+    )
+    cells = base.mark_rect().encode(
+        color=alt.Color("Average:Q", scale=alt.Scale(scheme=scheme)),
+        tooltip=["Weekday", "Hour", alt.Tooltip("Average:Q", format=".1f")],
+    )
+    labels = base.mark_text(fontSize=9).encode(text=alt.Text("Average:Q", format=".0f"))
+    return (cells + labels).properties(width=330, height=230)
+
+
+def temporal_chart(aggregates):
+    return alt.hconcat(
+        _heatmap(aggregates.weekday_hour(aggregates.requests), "Average ride requests per weekday and hour", "greens"),
+        _heatmap(aggregates.weekday_hour(aggregates.rides), "Average executed rides per weekday and hour", "blues"),
+    )
+
+
+def _usage_edges(values, bins=USAGE_BINS):
+    """Logarithmically spaced whole-number bin edges from 0 past the maximum of ``values``."""
+    top = int(values.max()) + 1 if len(values) else 1
+    return np.unique(np.round(np.geomspace(1, top + 1, bins + 1))).astype(np.int64) - 1
+
+
+def usage_bins(aggregates, bins=USAGE_BINS):
+    """Number of users per (rides, requests) bin; bins without users are left out."""
+    rides = aggregates.users["rides"].to_numpy()
+    requests = aggregates.users["requests"].to_numpy()
+    ride_edges, request_edges = _usage_edges(rides, bins), _usage_edges(requests, bins)
+    counts, _, _ = np.histogram2d(rides, requests, bins=[ride_edges, request_edges])
+    i, j = np.nonzero(counts)
+    return pd.DataFrame({
+        "rides": ride_edges[i],
+        "rides_end": ride_edges[i + 1],
+        "requests": request_edges[j],
+        "requests_end": request_edges[j + 1],
+        "users": counts[i, j].astype(np.int64),
+    })
+
+
+def usage_chart(aggregates):
+    return alt.Chart(
+        usage_bins(aggregates),
+        title="Usage Disparity: Ride Requests vs. executed Rides per User",
+    ).mark_rect().encode(
+        x=alt.X("rides:Q", title="Number of executed rides", scale=alt.Scale(type="symlog")),
+        x2="rides_end:Q",
+        y=alt.Y("requests:Q", title="Number of ride requests", scale=alt.Scale(type="symlog")),
+        y2="requests_end:Q",
+        color=alt.Color("users:Q", title="Users", scale=alt.Scale(type="log", scheme="blues")),
+        tooltip=["rides", "rides_end", "requests", "requests_end", "users"],
+    ).interactive()
+
+
+CHARTS = {
+    "temporal": temporal_chart,
+    "usage": usage_chart,
+}
+
+_charts = SharedCache()
+
+
+def chart(key):
+    """Altair chart ``key`` for the configured request log, or None without one."""
+    version = file_version(REQUESTS_PATH)
+    if version is None:
+        return None
+    return _charts.get(key, version, lambda previous: CHARTS[key](usage_aggregates(REQUESTS_PATH)))
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import shapely
+
+from availability import HexGrid
+from layer_store import METRIC_CRS, load_layer
+
+
+@pytest.fixture(scope="module")
+def static_grid():
+    grid = load_layer("verfuegbarkeiten")
+    if grid is None:
+        pytest.skip("Verfügbarkeitsanalyse.shp not found")
+    return grid.to_crs(METRIC_CRS)
+
+
+def test_hex_cells_match_static_layer(static_grid):
+    points = static_grid.geometry.representative_point()
+    rows, cols = HexGrid().cells(points.x.to_numpy(), points.y.to_numpy())
+    np.testing.assert_array_equal(rows, static_grid["row_index"].to_numpy(dtype=np.int64))
+    np.testing.assert_array_equal(cols, static_grid["col_index"].to_numpy(dtype=np.int64))
+
+
+def test_hex_polygons_contain_static_cells(static_grid):
+    rows = static_grid["row_index"].to_numpy(dtype=np.int64)
+    cols = static_grid["col_index"].to_numpy(dtype=np.int64)
+    polygons = HexGrid().polygons(rows, cols)
+    # Zellen am Rand sind auf das Betriebsgebiet zugeschnitten, liegen aber im vollen Sechseck
+    assert shapely.covered_by(static_grid.geometry.values, shapely.buffer(polygons, 1.0)).all()
+
+
+def test_hex_cells_of_polygon_centres():
+    grid = HexGrid()
+    rows, cols = np.meshgrid(np.arange(-3, 4), np.arange(-3, 4), indexing="ij")
+    rows, cols = rows.ravel(), cols.ravel()
+    centres = shapely.centroid(grid.polygons(rows, cols))
+    found = grid.cells(shapely.get_x(centres), shapely.get_y(centres))
+    np.testing.assert_array_equal(found[0], rows)
+    np.testing.assert_array_equal(found[1], cols)
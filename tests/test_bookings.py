@@ -0,0 +1,82 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bookings import StopIndex, aggregate_stop_counts, iter_appended_chunks, log_rewritten
+
+
+def _read(sources, path):
+    chunks = list(iter_appended_chunks(sources, path, ["user", "status"], chunksize=2))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=["user", "status"])
+
+
+def test_csv_reads_appended_records_only(tmp_path):
+    path = tmp_path / "requests.csv"
+    path.write_text("booked_at,user,status\n2023-10-23 08:00,1,booked\n2023-10-23 09:00,2,rejected\n")
+    sources = {}
+    assert _read(sources, str(path))["user"].tolist() == [1, 2]
+    assert _read(sources, str(path)).empty
+
+    with open(path, "a") as file:
+        file.write("2023-10-24 08:00,3,booked\n2023-10-24 09:00,4,boo")
+    new = _read(sources, str(path))
+    assert new["user"].tolist() == [3]
+    assert new["status"].tolist() == ["booked"]
+
+    # Die unvollständige letzte Zeile wird gelesen, sobald sie abgeschlossen ist
+    with open(path, "a") as file:
+        file.write("ked\n")
+    assert _read(sources, str(path))["user"].tolist() == [4]
+    assert not log_rewritten(sources, str(path))
+
+    path.write_text("booked_at,user,status\n")
+    assert log_rewritten(sources, str(path))
+
+
+def test_parquet_reads_new_row_groups_only(tmp_path):
+    path = str(tmp_path / "requests.parquet")
+    first = pa.table({"user": [1, 2, 3], "status": ["booked"] * 3})
+    second = pa.table({"user": [4], "status": ["rejected"]})
+    with pq.ParquetWriter(path, first.schema) as writer:
+        writer.write_table(first)
+    sources = {}
+    assert _read(sources, path)["user"].tolist() == [1, 2, 3]
+
+    with pq.ParquetWriter(path, first.schema) as writer:
+        writer.write_table(first)
+        writer.write_table(second)
+    assert _read(sources, path)["user"].tolist() == [4]
+
+
+def _stops(lon, lat):
+    return gpd.GeoDataFrame(
+        {"Haltestell": [f"Stop {i}" for i in range(len(lon))], "Typ": ["physisch"] * len(lon)},
+        geometry=gpd.points_from_xy(lon, lat),
+        crs="EPSG:4326",
+    )
+
+
+def test_snap_to_nearest_stop_within_range():
+    index = StopIndex(_stops([7.60, 7.62], [51.96, 51.96]), max_distance=500)
+    # ~70 m östlich der ersten Haltestelle, ~1.6 km von beiden entfernt, fehlende Koordinate
+    found = index.snap([7.601, 7.61, 7.621, np.nan], [51.96, 51.973, 51.96, 51.96])
+    assert found.tolist() == [0, -1, 1, -1]
+
+
+def test_aggregate_stop_counts(tmp_path):
+    stops = _stops([7.60, 7.62], [51.96, 51.96])
+    path = tmp_path / "bookings.csv"
+    pd.DataFrame({
+        "pickup_lon": [7.60, 7.60, 7.62, 8.0],
+        "pickup_lat": [51.96, 51.96, 51.96, 51.96],
+        "dropoff_lon": [7.62, 7.62, 7.60, 7.60],
+        "dropoff_lat": [51.96, 51.96, 51.96, 51.96],
+    }).to_csv(path, index=False)
+    result = aggregate_stop_counts(str(path), stops, chunksize=3)
+    assert result.bookings == 4
+    assert (result.unmatched_pickups, result.unmatched_dropoffs) == (1, 0)
+    assert result.stops["Ein+Aussti"].tolist() == [2, 1]
+    assert result.stops["Ein+Auss_1"].tolist() == [2, 2]
+    assert result.stops["Ein+Auss_2"].tolist() == [4, 3]
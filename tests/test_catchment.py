@@ -0,0 +1,54 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from catchment import CHANGES, CoverageIndex
+from layer_store import METRIC_CRS
+
+SIZE = 2000.0
+CELL = 100.0
+
+
+@pytest.fixture(scope="module")
+def index():
+    # 2 x 2 km Betriebsgebiet, zwei Haltestellen im Süden, eine Linie von 2021 im Norden
+    area = gpd.GeoDataFrame(geometry=[shapely.box(0, 0, SIZE, SIZE)], crs=METRIC_CRS)
+    stops = gpd.GeoDataFrame(
+        {"Typ": ["physisch", "virtuell"], "Haltestell": ["A", "B"]},
+        geometry=gpd.points_from_xy([500, 1500], [500, 500]),
+        crs=METRIC_CRS,
+    )
+    x, y = np.meshgrid(np.arange(0, SIZE, CELL), np.arange(0, SIZE, CELL))
+    cells = shapely.box(x.ravel(), y.ravel(), x.ravel() + CELL, y.ravel() + CELL)
+    grid = gpd.GeoDataFrame({"Fahrten_Fa": np.ones(len(cells))}, geometry=cells, crs=METRIC_CRS).to_crs(epsg=4326)
+    line = gpd.GeoDataFrame(geometry=[shapely.LineString([(0, 1800), (SIZE, 1800)])], crs=METRIC_CRS)
+    return CoverageIndex(stops.to_crs(epsg=4326), area.to_crs(epsg=4326), grid, [line.to_crs(epsg=4326)])
+
+
+def test_stats(index):
+    stats = index.stats(300)
+    assert stats.area_share == pytest.approx(2 * np.pi * 300**2 / SIZE**2, abs=0.01)
+    assert stats.area_share_2021 == pytest.approx(0.25, abs=0.01)
+    assert stats.cells == 400
+    assert stats.gained == stats.cells_covered > 0
+    assert stats.lost == 5 * 20  # fünf Zellreihen mit Mittelpunkt höchstens 300 m von der Linie
+    assert stats.demand_share == pytest.approx(stats.cells_covered / 400)
+
+
+def test_stop_type_filter(index):
+    assert index.stop_types() == ["physisch", "virtuell"]
+    assert index.stats(300, "physisch").cells_covered * 2 == index.stats(300).cells_covered
+
+
+def test_catchment_area(index):
+    area = index.catchment(300).to_crs(METRIC_CRS).area.iloc[0]
+    assert area == pytest.approx(2 * np.pi * 300**2, rel=0.02)
+
+
+def test_change_areas_cover_their_cells(index):
+    changes = index.changes(500)
+    areas = index.change_areas(500).to_crs(METRIC_CRS)
+    assert areas.index.tolist() == list(CHANGES[:3])
+    for category, change in enumerate(CHANGES[:3]):
+        assert areas[change].area == pytest.approx((changes == category).sum() * CELL**2, rel=1e-6, abs=1.0)
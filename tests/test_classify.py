@@ -0,0 +1,46 @@
+import numpy as np
+
+from classify import breaks, classify, lookup
+
+
+def test_equal_interval_breaks_over_fixed_range():
+    np.testing.assert_allclose(breaks([3, 97], "equal_interval", 4, value_range=(0, 100)), [25, 50, 75, 100])
+
+
+def test_breaks_end_at_maximum():
+    values = np.random.default_rng(1).gamma(2.0, 50.0, 2000)
+    for scheme in ("jenks", "quantiles", "equal_interval"):
+        bins = breaks(values, scheme, 5)
+        assert len(bins) == 5
+        assert np.all(np.diff(bins) > 0)
+        assert bins[-1] == values.max()
+
+
+def test_sampled_breaks_cover_all_values():
+    values = np.random.default_rng(2).exponential(10.0, 50_000)
+    bins = breaks(values, "jenks", 5)
+    assert bins[-1] == values.max()
+    assert set(np.unique(classify(values, bins))) == set(range(5))
+
+
+def test_few_distinct_values_fall_back_to_equal_intervals():
+    np.testing.assert_allclose(breaks([1, 1, 3, 3], "jenks", 5), np.linspace(1, 3, 6)[1:])
+
+
+def test_breaks_memoised_per_key():
+    first = breaks(np.arange(100.0), "quantiles", 4, key=("test", 1))
+    # Gleicher Schlüssel: gespeicherte Grenzen, auch wenn sich die Werte geändert haben
+    assert breaks(np.arange(1000.0), "quantiles", 4, key=("test", 1)) is first
+    assert breaks(np.arange(1000.0), "quantiles", 4, key=("test", 2))[-1] == 999
+
+
+def test_classify_bounds_are_inclusive_and_nan_is_missing():
+    bins = np.array([10.0, 20.0, 30.0])
+    classes = classify([0, 10, 10.5, 20, 30, 45, np.nan], bins)
+    np.testing.assert_array_equal(classes, [0, 0, 1, 1, 2, 2, -1])
+
+
+def test_lookup_uses_missing_for_class_minus_one():
+    classes = np.array([0, 2, -1, 1])
+    np.testing.assert_array_equal(lookup(classes, ["a", "b", "c"]), ["a", "c", "a", "b"])
+    np.testing.assert_allclose(lookup(classes, [0.1, 0.2, 0.3], missing=0.0), [0.1, 0.3, 0.0, 0.2])
@@ -0,0 +1,43 @@
+import os
+
+from html_cache import HtmlCache, cache_key
+
+
+def test_cache_key_is_stable_and_order_independent():
+    assert cache_key("map", {"a": 1, "b": 2}) == cache_key("map", {"b": 2, "a": 1})
+    assert cache_key("map", {"a": 1}) != cache_key("map", {"a": 2})
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    HtmlCache(str(tmp_path)).put("k", "<html>ä</html>")
+    assert HtmlCache(str(tmp_path)).get("k") == "<html>ä</html>"
+    assert HtmlCache(str(tmp_path)).get("missing") is None
+
+
+def test_memory_lru_is_bounded():
+    cache = HtmlCache(None, max_memory_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.get("a")
+    cache.put("c", "12345")
+    assert cache.get("a") == "12345"
+    assert cache.get("b") is None
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+
+
+def test_disk_eviction_keeps_the_newest(tmp_path):
+    cache = HtmlCache(str(tmp_path), max_memory_bytes=0, max_disk_bytes=10)
+    cache.put("old", "12345")
+    os.utime(tmp_path / "old.html", (1, 1))
+    cache.put("new", "123456")
+    assert sorted(os.listdir(tmp_path)) == ["new.html"]
+
+
+def test_unusable_directory_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = HtmlCache(str(blocker / "cache"))
+    cache.put("k", "<html></html>")
+    assert cache.get("k") == "<html></html>"
+    assert HtmlCache(str(blocker / "cache")).get("k") is None
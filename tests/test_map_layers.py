@@ -0,0 +1,29 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from map_layers import point_layer
+
+
+def _points(n):
+    return gpd.GeoSeries(shapely.points(np.linspace(7.0, 7.1, n), np.linspace(51.9, 52.0, n)), crs="EPSG:4326")
+
+
+def test_point_layer_keeps_constants_in_the_style():
+    layer = point_layer(_points(3), label=["a", "b", "c"], radius=2, color="green")
+    features = layer.data["features"]
+    assert [feature["properties"] for feature in features] == [{"label": "a"}, {"label": "b"}, {"label": "c"}]
+    style = layer.style_function(features[0])
+    assert (style["radius"], style["color"], style["fillColor"]) == (2, "green", "green")
+
+
+def test_point_layer_styles_per_point():
+    layer = point_layer(_points(2), radius=np.array([1, 5]), color=np.array(["red", "blue"]))
+    features = layer.data["features"]
+    assert [feature["properties"]["radius"] for feature in features] == [1, 5]
+    assert layer.style_function(features[1])["color"] == "blue"
+    assert features[1]["geometry"]["coordinates"] == [7.1, 52.0]
+
+
+def test_point_layer_empty():
+    assert point_layer(_points(0)).data["features"] == []
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from layer_store import load_layer
+from od_matrix import ODMatrix, Trips, above, load_trips, top_k
+
+
+def _matrix(origin, destination, n_stops=4, merge_directions=False, counts=None):
+    origin = np.asarray(origin, dtype=np.int32)
+    days = np.zeros(len(origin), dtype=np.int32)
+    trips = Trips(origin, np.asarray(destination, dtype=np.int32), days, days.astype(np.int8), days.astype(np.int8))
+    return ODMatrix(trips, n_stops, counts).matrix(merge_directions=merge_directions)
+
+
+def test_duplicate_relations_are_summed():
+    matrix = _matrix([0, 0, 0, 1, 2], [1, 1, 1, 0, 3])
+    assert matrix[0, 1] == 3
+    assert matrix[1, 0] == 1
+    assert matrix.sum() == 5
+
+
+def test_counts_weight_entries():
+    matrix = _matrix([0, 0, 1], [1, 1, 2], counts=np.array([5, 2, 4]))
+    assert matrix[0, 1] == 7
+    assert matrix[1, 2] == 4
+
+
+def test_merge_directions():
+    matrix = _matrix([0, 1, 1], [1, 0, 2], merge_directions=True)
+    assert matrix[0, 1] == 2
+    assert matrix[1, 0] == 0
+
+
+def test_top_k_descending_without_loops():
+    matrix = _matrix([0, 0, 0, 1, 1, 2, 3, 3, 3, 3], [1, 1, 1, 2, 2, 3, 3, 3, 3, 3])
+    origins, destinations, counts = top_k(matrix, 2)
+    np.testing.assert_array_equal(counts, [3, 2])
+    np.testing.assert_array_equal(origins, [0, 1])
+    np.testing.assert_array_equal(destinations, [1, 2])
+    # Schleifen (3 -> 3) nur auf Wunsch
+    assert top_k(matrix, 1, include_loops=True)[2][0] == 4
+
+
+def test_top_k_larger_than_relations():
+    origins, _, counts = top_k(_matrix([0, 1], [1, 2]), 10)
+    assert len(origins) == 2
+    np.testing.assert_array_equal(counts, [1, 1])
+
+
+def test_above_is_strict_and_sorted():
+    matrix = _matrix([0, 0, 0, 1, 1, 2], [1, 1, 1, 2, 2, 3])
+    origins, destinations, counts = above(matrix, 1)
+    np.testing.assert_array_equal(counts, [3, 2])
+    np.testing.assert_array_equal(origins, [0, 1])
+    assert len(above(matrix, 3)[0]) == 0
+
+
+def test_load_trips_drops_missing_times(tmp_path):
+    stops = load_layer("haltestellen")
+    if stops is None:
+        pytest.skip("stop layer not found")
+    xy = stops.geometry.get_coordinates().to_numpy()
+    path = tmp_path / "bookings.csv"
+    pd.DataFrame({
+        "pickup_lon": xy[:3, 0], "pickup_lat": xy[:3, 1],
+        "dropoff_lon": xy[1:4, 0], "dropoff_lat": xy[1:4, 1],
+        "booked_at": ["2023-10-23 08:00", None, "2023-10-24 17:00"],
+    }).to_csv(path, index=False)
+    trips = load_trips(str(path), stops)
+    assert trips.origin.tolist() == [0, 2]
+    assert trips.hour.tolist() == [8, 17]
@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from layer_store import load_layer
+from partitions import (
+    append_bookings,
+    append_requests,
+    load_partition,
+    period_weeks,
+    previous_year,
+    read_manifest,
+    week_labels,
+)
+
+
+@pytest.fixture(scope="module")
+def stops():
+    stops = load_layer("haltestellen")
+    if stops is None or load_layer("betriebsgebiet") is None:
+        pytest.skip("stop or Betriebsgebiet layer not found")
+    return stops
+
+
+def _bookings(stops, path, times):
+    xy = stops.geometry.get_coordinates().to_numpy()
+    n = len(times)
+    pd.DataFrame({
+        "pickup_lon": xy[np.arange(n) % len(xy), 0],
+        "pickup_lat": xy[np.arange(n) % len(xy), 1],
+        "dropoff_lon": xy[(np.arange(n) + 1) % len(xy), 0],
+        "dropoff_lat": xy[(np.arange(n) + 1) % len(xy), 1],
+        "booked_at": times,
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def _requests(stops, path, times, status="booked"):
+    xy = stops.geometry.get_coordinates().to_numpy()
+    n = len(times)
+    pd.DataFrame({
+        "pickup_lon": xy[np.arange(n) % len(xy), 0],
+        "pickup_lat": xy[np.arange(n) % len(xy), 1],
+        "status": status,
+        "requested_at": times,
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_week_labels_skip_missing_times():
+    labels = week_labels(pd.to_datetime(["2023-10-23", None, "2024-01-01"]))
+    assert labels.tolist() == ["2023-W43", "", "2024-W01"]
+
+
+def test_previous_year_drops_missing_week_53():
+    assert previous_year(["2020-W52", "2020-W53"]) == ["2019-W52"]
+    assert previous_year(["2021-W53"]) == ["2020-W53"]
+
+
+def test_append_bookings_merges_weeks(stops, tmp_path):
+    directory = str(tmp_path / "parts")
+    first = _bookings(stops, tmp_path / "a.csv", ["2023-10-23 08:00"] * 3 + [None])
+    second = _bookings(stops, tmp_path / "b.csv", ["2023-10-24 09:00"] * 2 + ["2023-10-30 09:00"])
+    assert append_bookings(first, directory) == {"2023-W43": 3}
+    assert append_bookings(second, directory) == {"2023-W43": 5, "2023-W44": 1}
+
+    part = load_partition("bookings", "2023-W43", directory)
+    assert part["pickups"].sum() == 5
+    assert part["count"].sum() == 5
+    assert part["pickup_count"].sum() == 5
+
+    # Ersetzen statt Zusammenführen
+    assert append_bookings(second, directory, replace=True) == {"2023-W43": 2, "2023-W44": 1}
+    assert load_partition("bookings", "2023-W43", directory)["pickups"].sum() == 2
+
+
+def test_append_bookings_rejects_other_stops(stops, tmp_path):
+    directory = tmp_path / "parts"
+    log = _bookings(stops, tmp_path / "a.csv", ["2023-10-23 08:00"])
+    append_bookings(log, str(directory))
+    manifest = read_manifest(str(directory))
+    manifest["bookings"]["2023-W43"]["stops"] = "other"
+    (directory / "manifest.json").write_text(json.dumps(manifest))
+
+    with pytest.raises(ValueError, match="other stops"):
+        append_bookings(log, str(directory))
+    assert append_bookings(log, str(directory), replace=True) == {"2023-W43": 1}
+
+
+def test_append_requests_merges_weeks(stops, tmp_path):
+    directory = str(tmp_path / "parts")
+    served = _requests(stops, tmp_path / "a.csv", ["2023-10-23 08:00"] * 4)
+    rejected = _requests(stops, tmp_path / "b.csv", ["2023-10-25 08:00"] * 2, status="rejected")
+    append_requests(served, directory)
+    assert append_requests(rejected, directory) == {"2023-W43": 6}
+
+    entry = read_manifest(directory)["requests"]["2023-W43"]
+    part = load_partition("requests", "2023-W43", directory)
+    assert (entry["served"], entry["rejected"]) == (part["served"].sum(), part["rejected"].sum())
+    assert entry["served"] + entry["rejected"] <= entry["rows"] == 6
+
+    with pytest.raises(ValueError, match="another grid"):
+        append_requests(served, directory, size=500)
+    assert append_requests(served, directory, size=500, replace=True) == {"2023-W43": 4}
+
+
+def test_period_weeks_bounds(stops, tmp_path):
+    directory = str(tmp_path / "parts")
+    assert period_weeks("requests", ("2023-W01", "2023-W52"), directory) is None
+    log = _requests(stops, tmp_path / "a.csv", ["2023-10-16 08:00", "2023-10-23 08:00", "2023-10-30 08:00"])
+    append_requests(log, directory)
+    assert period_weeks("requests", None, directory) is None
+    assert period_weeks("requests", ("2023-W43", "2023-W44"), directory) == ["2023-W43", "2023-W44"]
+    assert period_weeks("requests", ("2023-W42", "2023-W42"), directory) == ["2023-W42"]
+    assert period_weeks("requests", ("2024-W01", "2024-W10"), directory) == []
@@ -0,0 +1,42 @@
+import numpy as np
+
+from pyramid import PointPyramid
+
+
+def _random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(7.5, 7.7, n), rng.uniform(51.9, 52.0, n)
+
+
+def test_every_level_keeps_the_total():
+    lon, lat = _random_points(10_000)
+    pyramid = PointPyramid()
+    pyramid.add(lon, lat)
+    sizes = [len(level.count) for level in pyramid.levels()]
+    assert all(level.count.sum() == 10_000 for level in pyramid.levels())
+    assert sizes == sorted(sizes)
+    assert pyramid.total == 10_000
+
+
+def test_chunks_and_combined_pyramids_match():
+    lon, lat = _random_points(5_000)
+    whole = PointPyramid()
+    whole.add(lon, lat)
+    first, second = PointPyramid(), PointPyramid()
+    first.add(lon[:2_000], lat[:2_000])
+    second.add(lon[2_000:], lat[2_000:])
+    first.add_cells(*second.cells())
+    for a, b in zip(whole.levels(), first.levels()):
+        np.testing.assert_array_equal(a.count, b.count)
+        np.testing.assert_allclose(a.lon, b.lon)
+        np.testing.assert_allclose(a.lat, b.lat)
+
+
+def test_level_centres_and_clamping():
+    pyramid = PointPyramid()
+    pyramid.add([7.6, 7.6, np.nan], [51.95, 51.95, 51.95])
+    level = pyramid.level(3)
+    assert level.zoom == pyramid.min_zoom
+    assert level.count.tolist() == [2]
+    np.testing.assert_allclose([level.lon[0], level.lat[0]], [7.6, 51.95])
+    assert pyramid.level(20).zoom == pyramid.max_zoom
@@ -0,0 +1,47 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from layer_store import METRIC_CRS
+from route_overlap import OVERLAP_COLUMN, route_overlaps
+
+
+def _routes(lines):
+    return gpd.GeoDataFrame(geometry=[shapely.LineString(line) for line in lines], crs=METRIC_CRS)
+
+
+def test_empty_input():
+    result = route_overlaps(_routes([]))
+    assert result.segments.empty
+    assert OVERLAP_COLUMN in result.segments
+    assert len(result.route_counts) == 0
+
+
+def test_shared_road_counted_once_per_route():
+    x, y = 365000.0, 5786000.0
+    routes = _routes([
+        [(x, y), (x + 100, y), (x + 200, y)],
+        # Gegenrichtung auf derselben Straße
+        [(x + 200, y), (x + 100, y), (x, y)],
+        # Biegt nach 100 m ab
+        [(x, y), (x + 100, y), (x + 100, y + 100)],
+        # Fährt dieselbe Straße zweimal
+        [(x, y), (x + 100, y), (x, y)],
+    ])
+    result = route_overlaps(routes)
+    np.testing.assert_array_equal(result.route_counts, [4, 4, 4, 4])
+    assert sorted(result.segments[OVERLAP_COLUMN]) == [1, 2, 4]
+
+
+def test_routes_without_shared_vertices_overlap_within_tolerance():
+    x, y = 365000.0, 5786000.0
+    routes = _routes([
+        [(x, y), (x + 300, y)],
+        # Gleiche Straße, andere Stützpunkte, 1 m versetzt
+        [(x + 50, y + 1), (x + 120, y + 1), (x + 250, y + 1)],
+        # 10 m daneben: keine Überlagerung
+        [(x, y + 10), (x + 300, y + 10)],
+    ])
+    result = route_overlaps(routes, tolerance=2.0)
+    np.testing.assert_array_equal(result.route_counts, [2, 2, 1])
+    assert route_overlaps(routes, tolerance=0.5).route_counts.max() == 1
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from temporal import UsageAggregates, usage_bins
+
+
+def test_usage_bins_cover_every_user():
+    aggregates = UsageAggregates()
+    rng = np.random.default_rng(0)
+    users = rng.zipf(1.5, 5000) % 500
+    status = np.where(rng.random(len(users)) < 0.7, "booked", "rejected")
+    times = pd.Timestamp("2023-10-23") + pd.to_timedelta(rng.integers(0, 7 * 24, len(users)), unit="h")
+    aggregates.add(times, users, status)
+
+    bins = usage_bins(aggregates, bins=20)
+    assert bins["users"].sum() == len(aggregates.users)
+    assert len(bins) <= 20 * 20
+    for user in aggregates.users.itertuples():
+        inside = (
+            (bins["rides"] <= user.rides) & (user.rides < bins["rides_end"])
+            & (bins["requests"] <= user.requests) & (user.requests < bins["requests_end"])
+        )
+        assert inside.sum() == 1
+
+
+def test_usage_aggregates_skip_missing_times():
+    aggregates = UsageAggregates()
+    aggregates.add(pd.to_datetime(["2023-10-23 08:00", None]), [1, 2], ["booked", "booked"])
+    assert aggregates.requests.sum() == 1
+    assert aggregates.users.index.tolist() == [1]
@@ -0,0 +1,230 @@
+"""Optional vector-tile mode for the large static layers.
+
+Instead of inlining their GeoJSON into every map, layers in ``TILE_LAYERS`` are
+cut into Mapbox Vector Tiles (one ``.pbf`` per tile and zoom level) in a local
+tile cache and served over HTTP next to the Streamlit app. The maps then only
+reference the tile URL, so the browser fetches the tiles in view and caches
+them across maps and sessions. Tiles live under the layer's content digest,
+so a changed shapefile gets a new URL and stale tiles are never served.
+
+The mode is off unless ``GMOBIL_VECTOR_TILES`` is set to the URL the browser
+reaches the tile server under (e.g. ``http://localhost:8765``) and the optional
+``mapbox_vector_tile`` package is installed::
+
+    python vector_tiles.py build
+    python vector_tiles.py serve --port 8765
+"""
+import argparse
+import functools
+import http.server
+import logging
+import os
+import threading
+
+import numpy as np
+import shapely
+
+from layer_store import BASE_DIR, LAYER_COLUMNS, layer_version, load_layer
+from payload import SIMPLIFY_PIXELS
+
+try:
+    import mapbox_vector_tile
+except ImportError:  # optional, only needed for the vector-tile mode
+    mapbox_vector_tile = None
+
+
+logger = logging.getLogger(__name__)
+
+# URL of the tile server as seen from the browser; unset disables the mode
+TILE_URL = os.environ.get("GMOBIL_VECTOR_TILES")
+
+TILE_DIR = os.path.join(BASE_DIR, "tile_cache")
+TILE_PORT = 8765
+
+# Layers served as vector tiles in this mode
+TILE_LAYERS = ("betriebsgebiet", "buslinien", "taxibuslinien", "verfuegbarkeiten")
+
+MIN_ZOOM = 8
+MAX_ZOOM = 16
+
+# Tile resolution and the margin (tile units) kept around each tile when clipping
+EXTENT = 4096
+BUFFER = 64
+
+# Half the Web Mercator world width in metres
+_ORIGIN = 20037508.342789244
+
+_server = None
+_server_lock = threading.Lock()
+_build_locks = {name: threading.Lock() for name in TILE_LAYERS}
+
+
+def tiles_enabled():
+    return bool(TILE_URL) and mapbox_vector_tile is not None
+
+
+def _tile_bounds(x, y, zoom):
+    size = 2 * _ORIGIN / 2 ** zoom
+    minx = -_ORIGIN + x * size
+    maxy = _ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _tile_range(bounds, zoom):
+    """Tile columns and rows covering Web Mercator ``bounds`` at ``zoom``."""
+    size = 2 * _ORIGIN / 2 ** zoom
+    minx, miny, maxx, maxy = bounds
+    x0, x1 = int((minx + _ORIGIN) // size), int((maxx + _ORIGIN) // size)
+    y0, y1 = int((_ORIGIN - maxy) // size), int((_ORIGIN - miny) // size)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _properties(gdf, columns):
+    """Feature properties per row: the given attribute columns plus the row number."""
+    frame = gdf[columns].astype(object)
+    records = frame.where(frame.notna(), None).to_dict("records")
+    for index, record in enumerate(records):
+        # None-Werte kann das Tile-Format nicht speichern
+        for key in [key for key, value in record.items() if value is None]:
+            del record[key]
+        record["index"] = index
+    return records
+
+
+def tile_dir(name, cache_dir=TILE_DIR):
+    """Directory of the current tiles of layer ``name``, keyed by its content digest."""
+    return os.path.join(cache_dir, name, layer_version(name)[:16])
+
+
+def build_tiles(name, cache_dir=TILE_DIR, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """Write all tiles of layer ``name``; returns the number of tiles written."""
+    gdf = load_layer(name)
+    directory = tile_dir(name, cache_dir)
+    gdf = gdf.to_crs(epsg=3857)
+    properties = _properties(gdf, [column for column in LAYER_COLUMNS[name] if column in gdf])
+    geoms = np.asarray(gdf.geometry.values)
+
+    written = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        # Vereinfachen auf die Auflösung der Zoomstufe, dann je Kachel zuschneiden
+        size = 2 * _ORIGIN / 2 ** zoom
+        simplified = shapely.simplify(geoms, size / 256 * SIMPLIFY_PIXELS, preserve_topology=True)
+        tree = shapely.STRtree(simplified)
+        xs, ys = _tile_range(gdf.total_bounds, zoom)
+        tiles = [(x, y) for x in xs for y in ys]
+        margin = size * BUFFER / EXTENT
+        boxes = shapely.box(*np.array([_tile_bounds(x, y, zoom) for x, y in tiles]).T)
+        buffered = shapely.box(*np.array([
+            (minx - margin, miny - margin, maxx + margin, maxy + margin)
+            for minx, miny, maxx, maxy in (_tile_bounds(x, y, zoom) for x, y in tiles)
+        ]).T)
+        tile_index, geom_index = tree.query(buffered, predicate="intersects")
+        clipped = shapely.intersection(simplified[geom_index], buffered[tile_index])
+
+        order = np.argsort(tile_index, kind="stable")
+        positions, starts = np.unique(tile_index[order], return_index=True)
+        for position, pick in zip(positions, np.split(order, starts[1:])):
+            features = [
+                {"geometry": clipped[i], "properties": properties[geom_index[i]]}
+                for i in pick if not shapely.is_empty(clipped[i])
+            ]
+            if not features:
+                continue
+            data = mapbox_vector_tile.encode(
+                [{"name": name, "features": features}],
+                default_options={"quantize_bounds": shapely.bounds(boxes[position]).tolist(), "extents": EXTENT},
+            )
+            x, y = tiles[position]
+            path = os.path.join(directory, str(zoom), str(x), f"{y}.pbf")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            written += 1
+
+    # Marker: alle Kacheln dieser Version sind geschrieben
+    open(os.path.join(directory, "complete"), "w").close()
+    return written
+
+
+def tile_url(name):
+    """Tile URL template for layer ``name``, building its tiles on first use.
+
+    Returns None if the mode is disabled or the layer is missing.
+    """
+    if not tiles_enabled() or layer_version(name) is None:
+        return None
+    directory = tile_dir(name)
+    if not os.path.exists(os.path.join(directory, "complete")):
+        with _build_locks[name]:
+            if not os.path.exists(os.path.join(directory, "complete")):
+                logger.info("building vector tiles for %s", name)
+                build_tiles(name)
+    start_server()
+    relative = os.path.relpath(directory, TILE_DIR).replace(os.sep, "/")
+    return f"{TILE_URL.rstrip('/')}/{relative}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+class _TileHandler(http.server.SimpleHTTPRequestHandler):
+    extensions_map = {**http.server.SimpleHTTPRequestHandler.extensions_map, ".pbf": "application/x-protobuf"}
+
+    def end_headers(self):
+        # Karten laufen in einem iframe einer anderen Origin
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        super().end_headers()
+
+    def send_error(self, code, message=None, explain=None):
+        # Leere Kacheln gibt es nicht als Datei
+        if code == 404 and self.path.endswith(".pbf"):
+            self.send_response(204)
+            self.end_headers()
+            return
+        super().send_error(code, message, explain)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(port=TILE_PORT, directory=TILE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    handler = functools.partial(_TileHandler, directory=directory)
+    return http.server.ThreadingHTTPServer(("", port), handler)
+
+
+def start_server(port=TILE_PORT, directory=TILE_DIR):
+    """Serve the tile cache from a background thread, once per process."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = serve(port, directory)
+        except OSError:
+            # Port belegt: ein anderer Prozess liefert die Kacheln bereits aus
+            _server = False
+            return
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and serve vector tiles for the large map layers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write the tile cache")
+    build.add_argument("--cache-dir", default=TILE_DIR)
+    build.add_argument("--layers", nargs="+", choices=TILE_LAYERS, default=list(TILE_LAYERS))
+    server = commands.add_parser("serve", help="serve the tile cache over HTTP")
+    server.add_argument("--cache-dir", default=TILE_DIR)
+    server.add_argument("--port", type=int, default=TILE_PORT)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if mapbox_vector_tile is None:
+            parser.error("the mapbox_vector_tile package is required to build tiles")
+        for name in args.layers:
+            if layer_version(name) is None:
+                print(f"{name}: file not found, skipped")
+                continue
+            print(f"{name}: {build_tiles(name, args.cache_dir)} tiles")
+    else:
+        print(f"serving {args.cache_dir} on port {args.port}")
+        serve(args.port, args.cache_dir).serve_forever()